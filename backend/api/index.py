@@ -1,15 +1,58 @@
-from fastapi import FastAPI, Request, status, Depends
+import time
+
+_import_started = time.perf_counter()
+
+from utils.utils import load_env
+
+# Settings are read at import time, so .env has to be loaded before any other module.
+load_env()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, status, Depends, WebSocket, WebSocketException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from models import CreateUrlRequest, UserCreate, UserLogin, Token, AiGenRequest
-from services.create_service import create_new_mock, list_endpoints, check_availability
-from services.resolve_service import resolve_mock_response
-from services.auth_service import register_user, login_user, get_current_user, get_current_user_optional, oauth2_scheme
-from services.ai_service import generate_mock_config_service
-from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from models import CreateUrlRequest, BulkCreateRequest, OpenApiImportRequest, HarImportRequest, UserCreate, UserLogin, Token, AiGenRequest, BatchRequest
+from services.create_service import create_new_mock, create_bulk_mocks, list_endpoints, get_endpoint_details, check_availability
+from services.import_service import openapi_to_requests, har_to_requests
+from services.resolve_service import resolve_mock_response, resolve_stream_websocket, sandbox_pool, stream_pool
+from services.broadcast_service import broadcast_stats, close_all as close_broadcasts
+from services.batch_service import resolve_batch
+from utils.request import MockRequest
+from utils.metrics import NULL_TIMER, start_timer, register_collector, render as render_metrics
+from utils.streaming import MockStreamResponse
+from utils.broadcast import BroadcastResponse, serve_websocket
+from utils.compression import compress_response
+from utils.auth import hashing_stats
+from database import storage, mongo_pool_stats
+from services.endpoint_cache import cache_stats
+from services.state_service import state_store
+from services.auth_service import register_user, login_user, get_current_user, get_current_user_optional, oauth2_scheme, require_metrics_token, user_cache
+from services.rate_limit_service import rate_limit_stats
+from services.recording_service import recorder, list_recordings
+from services.ai_service import generate_mock_config_service, generation_cache
+from utils.startup import record as record_startup, startup_stats
 
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await storage.startup()
+    await state_store.start()
+    if sandbox_pool is not None:
+        sandbox_pool.start()
+        stream_pool.start()
+    yield
+    # Feeds hold sandbox workers and subscriber connections; end them first.
+    await close_broadcasts()
+    if sandbox_pool is not None:
+        sandbox_pool.close()
+        stream_pool.close()
+    # Persist any write-behind state and queued recordings before the worker exits.
+    await state_store.stop()
+    await recorder.stop()
+    await storage.close()
+    generation_cache.close()
 
-app = FastAPI(title="Mock API Engine")
+app = FastAPI(title="Mock API Engine", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,32 +83,134 @@ async def generate_mock_config(payload: AiGenRequest, user: dict = Depends(get_c
 
 # --- Existing Routes ---
 @app.get("/endpoints")
-async def get_endpoints(user = Depends(get_current_user_optional)):
+async def get_endpoints(limit: int = 50, cursor: str = None, mine: bool = False, user = Depends(get_current_user_optional)):
+    email = user["email"] if user else None
+    return await list_endpoints(email, limit, cursor, mine)
+
+@app.get("/endpoints/{endpoint_id}")
+async def get_endpoint(endpoint_id: str, user = Depends(get_current_user_optional)):
     email = user["email"] if user else None
-    return await list_endpoints(email)
+    return await get_endpoint_details(endpoint_id, email)
+
+@app.get("/endpoints/{endpoint_id}/recordings")
+async def get_recordings(endpoint_id: str, since: float = None, limit: int = 500, cursor: str = None, user = Depends(get_current_user)):
+    return await list_recordings(endpoint_id, user["email"], since, limit, cursor)
 
 @app.get("/check-availability")
 async def check_availability_route(id: str):
     return await check_availability(id)
 
+@app.get("/cache-stats", dependencies=[Depends(require_metrics_token)])
+async def cache_stats_route():
+    return {**cache_stats(), "users": user_cache.stats(), "ai_generations": generation_cache.stats(), "rate_limits": rate_limit_stats(), "mongo_pool": mongo_pool_stats(), "recordings": recorder.stats(), "broadcasts": broadcast_stats()}
+
+register_collector("mock_cache", "In-process cache and state store counters.", cache_stats)
+register_collector("mock_user_cache", "Verified token cache counters.", user_cache.stats)
+register_collector("mock_ai_cache", "AI generation result cache counters.", generation_cache.stats)
+register_collector("mock_rate_limit", "Admission control decisions for mock requests.", rate_limit_stats)
+register_collector("mock_recording", "Request recording queue and writes.", recorder.stats)
+register_collector("mock_broadcast", "Stream mock feeds, subscribers and dropped events.", broadcast_stats)
+register_collector("mock_mongo_pool", "MongoDB connection pool usage per server.", mongo_pool_stats)
+register_collector("mock_startup", "Seconds spent importing the app and initialising each subsystem.", startup_stats)
+register_collector("mock_hashing", "Password hashing executor load.", hashing_stats)
+if sandbox_pool is not None:
+    register_collector("mock_sandbox", "Functional handler worker pool.", sandbox_pool.stats)
+    register_collector("mock_stream_sandbox", "Worker pool reserved for stream mock handlers.", stream_pool.stats)
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_token)])
+async def metrics_route():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/url", status_code=status.HTTP_201_CREATED)
 async def create_mock(payload: CreateUrlRequest, user = Depends(get_current_user)):
     result = await create_new_mock(payload, user["email"])
     return {"message": "Mock created successfully", **result}
 
+@app.post("/url/bulk")
+async def create_mocks_bulk(payload: BulkCreateRequest, user = Depends(get_current_user)):
+    return await create_bulk_mocks(payload.endpoints, user["email"], payload.ordered)
+
+# --- Import Routes ---
+@app.post("/import/openapi", tags=["Import"])
+async def import_openapi(payload: OpenApiImportRequest, user = Depends(get_current_user)):
+    return await create_bulk_mocks(openapi_to_requests(payload), user["email"])
+
+@app.post("/import/har", tags=["Import"])
+async def import_har(payload: HarImportRequest, user = Depends(get_current_user)):
+    return await create_bulk_mocks(har_to_requests(payload), user["email"])
+
+# --- Batch Route ---
+@app.post("/batch", tags=["Mocks"])
+async def batch_mocks(payload: BatchRequest, request: Request):
+    response = await resolve_batch(payload.requests, request.client.host if request.client else None)
+    return compress_response(response, request.headers.get("accept-encoding"))
+
 @app.api_route("/{endpoint_id}/{rest_of_path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def serve_mock(endpoint_id: str, rest_of_path: str, request: Request):
-    headers = dict(request.headers)
-    body = None
-    if request.method in ["POST", "PUT", "PATCH"]:
-        try:
-            body = await request.json()
-        except:
-            body = (await request.body()).decode() if await request.body() else None
+    started = time.perf_counter()
+    timer = start_timer()
+    status_code = 500
+    mock_request = MockRequest.from_request(request, timer)
+    try:
+        result = await resolve_mock_response(endpoint_id, rest_of_path, mock_request)
+        if isinstance(result, (MockStreamResponse, BroadcastResponse)):
+            # Streams record their own timings once they finish.
+            timer = NULL_TIMER
+            status_code = 200
+            return result
+        if isinstance(result, Response):
+            # Static and mapping bodies arrive pre-serialised, with their ETag.
+            response = result
+            timer.mark("serialize")
+        else:
+            # Serialise here rather than in FastAPI so the encoding time shows up in the metrics.
+            response = JSONResponse(jsonable_encoder(result))
+            timer.mark("serialize")
+            compress_response(response, request.headers.get("accept-encoding"))
+            timer.mark("compress")
+        status_code = response.status_code
+        return response
+    except HTTPException as e:
+        status_code = e.status_code
+        raise
+    finally:
+        timer.record(status_code)
+        if mock_request.record:
+            # A stream is recorded when the handler hands it over, before its first item is sent.
+            await recorder.capture(
+                endpoint_id, mock_request, "/" + rest_of_path, request.url.query, status_code, time.perf_counter() - started
+            )
 
-    request_data = {"headers": headers, "body": body, "method": request.method}
-    return await resolve_mock_response(endpoint_id, rest_of_path, request_data)
+# WebSocket close codes for a handshake that is turned away, by the HTTP status it would have had.
+_WS_CLOSE_CODES = {404: 1008, 429: 1013, 503: 1013}
+
+@app.websocket("/{endpoint_id}/{rest_of_path:path}")
+async def serve_mock_websocket(endpoint_id: str, rest_of_path: str, websocket: WebSocket):
+    started = time.perf_counter()
+    timer = start_timer()
+    status_code = 500
+    client = websocket.client.host if websocket.client else None
+    mock_request = MockRequest("GET", websocket.headers, timer=timer, client=client)
+    try:
+        try:
+            broadcast, subscriber = await resolve_stream_websocket(endpoint_id, rest_of_path, mock_request)
+        except HTTPException as e:
+            status_code = e.status_code
+            raise WebSocketException(code=_WS_CLOSE_CODES.get(e.status_code, 1011), reason=str(e.detail))
+        status_code = 101
+        try:
+            await serve_websocket(websocket, subscriber)
+        finally:
+            broadcast.unsubscribe(subscriber)
+    finally:
+        timer.record(status_code)
+        if mock_request.record:
+            await recorder.capture(
+                endpoint_id, mock_request, "/" + rest_of_path, websocket.url.query, status_code, time.perf_counter() - started
+            )
 
 @app.get("/")
 async def root():
-    return {"message": "FastDev API Engine is online", "docs": "/docs"}
\ No newline at end of file
+    return {"message": "FastDev API Engine is online", "docs": "/docs"}
+
+record_startup("import", time.perf_counter() - _import_started)
@@ -1,76 +0,0 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from models import UserCreate, UserLogin, Token, User
-from database import user_collection
-from utils.auth import get_password_hash, verify_password, create_access_token
-from datetime import timedelta
-from fastapi.security import OAuth2PasswordBearer
-from utils.auth import decode_access_token
-
-router = APIRouter()
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
-
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    email: str = payload.get("sub")
-    if email is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user = await user_collection.find_one({"email": email})
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    return user
-
-async def get_current_user_optional(token: str = Depends(oauth2_scheme_optional)):
-    if not token:
-        return None
-    try:
-        return await get_current_user(token)
-    except:
-        return None
-
-
-@router.post("/register", response_model=Token)
-async def register(user: UserCreate):
-    existing_user = await user_collection.find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    hashed_password = get_password_hash(user.password)
-    new_user = User(
-        email=user.email,
-        hashed_password=hashed_password
-    )
-    
-    # Insert safely without _id if None
-    user_dict = new_user.dict(by_alias=True, exclude={"id"})
-    await user_collection.insert_one(user_dict)
-    
-    access_token = create_access_token(data={"sub": user.email})
-    return {"access_token": access_token, "token_type": "bearer"}
-
-@router.post("/login", response_model=Token)
-async def login(user: UserLogin):
-    db_user = await user_collection.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["hashed_password"]):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    access_token = create_access_token(data={"sub": user.email})
-    return {"access_token": access_token, "token_type": "bearer"}
-
-@router.get("/me")
-async def read_users_me(current_user: dict = Depends(get_current_user)):
-    # Convert ObjectId to string for JSON serialization
-    current_user["_id"] = str(current_user["_id"])
-    return current_user
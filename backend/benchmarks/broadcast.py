@@ -0,0 +1,195 @@
+"""Fan-out of a `stream` mock to many concurrent subscribers.
+
+Creates a stream mock whose handler yields a timestamped tick every --interval-ms and
+attaches --subscribers clients to the ASGI app in-process, as SSE or, with --ws, as
+WebSocket clients. A --slow fraction of them take --slow-ms over every send, so the
+overflow policy comes into play. Reports the events published and delivered, how long
+an event took from the handler to each client, encodes per event and dropped events.
+
+    cd backend && python -m benchmarks.broadcast --subscribers 2000 --interval-ms 10 --seconds 5
+    cd backend && python -m benchmarks.broadcast --ws --slow 0.1 --slow-ms 200 --overflow disconnect
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("SQLITE_PATH", "")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("BROADCAST_MAX_SUBSCRIBERS", "0")
+
+from benchmarks.asgi import asgi_request, percentiles
+
+ENDPOINT_ID = "bench-broadcast"
+
+TICK_CODE = """
+import time
+
+def handler(url, headers, body, data):
+    seq = 0
+    while True:
+        seq += 1
+        yield {"seq": seq, "t": time.time(), "price": 100 + seq % 7}
+"""
+
+
+def _scope(kind: str, accept: str = "") -> dict:
+    path = f"/{ENDPOINT_ID}/"
+    scope = {
+        "type": kind, "asgi": {"version": "3.0"}, "http_version": "1.1", "path": path,
+        "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"accept", accept.encode())] if accept else [],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    if kind == "http":
+        scope.update(method="GET", scheme="http")
+    else:
+        scope.update(scheme="ws", subprotocols=[])
+    return scope
+
+
+class Client:
+    """One subscriber. Only the newest event of each send is decoded, to measure lag
+    without spending the benchmark's CPU on parsing every copy."""
+
+    def __init__(self, slow: float):
+        self.slow = slow
+        self.events = 0
+        self.lags = []
+        self.closed = None
+        self.stop = asyncio.Event()
+
+    def _seen(self, count: int, last: str):
+        self.events += count
+        self.lags.append(time.time() - json.loads(last)["t"])
+
+    async def sse(self, app):
+        async def receive():
+            if not hasattr(self, "_requested"):
+                self._requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await self.stop.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if body:
+                    frames = body.split(b"\n\n")[:-1]
+                    last = frames[-1].rsplit(b"data: ", 1)[-1]
+                    if last.startswith(b"{"):
+                        self._seen(len(frames), last.decode())
+                if not message.get("more_body"):
+                    self.closed = "ended"
+                if self.slow:
+                    await asyncio.sleep(self.slow)
+
+        await app(_scope("http", "text/event-stream"), receive, send)
+
+    async def ws(self, app):
+        connected = False
+
+        async def receive():
+            nonlocal connected
+            if not connected:
+                connected = True
+                return {"type": "websocket.connect"}
+            await self.stop.wait()
+            return {"type": "websocket.disconnect", "code": 1000}
+
+        async def send(message):
+            if message["type"] == "websocket.send":
+                self._seen(1, message["text"])
+                if self.slow:
+                    await asyncio.sleep(self.slow)
+            elif message["type"] == "websocket.close":
+                self.closed = message.get("code")
+
+        await app(_scope("websocket"), receive, send)
+
+
+async def main(args):
+    from api.index import app, lifespan
+    import utils.broadcast
+    from services.broadcast_service import broadcast_stats
+
+    encodes = 0
+    encode = utils.broadcast.BroadcastEvent._encode
+
+    def counted(event, fmt):
+        nonlocal encodes
+        encodes += 1
+        return encode(event, fmt)
+
+    utils.broadcast.BroadcastEvent._encode = counted
+
+    async with lifespan(app):
+        status, _, body = await asgi_request(app, "POST", "/auth/register", json_body={"email": "broadcast@example.com", "password": "bench-password"})
+        token = json.loads(body)["access_token"]
+        config = {"code": TICK_CODE, "interval_ms": args.interval_ms, "buffer": args.buffer}
+        if args.overflow:
+            config["on_overflow"] = args.overflow
+        status, _, body = await asgi_request(app, "POST", "/url", headers={"authorization": f"Bearer {token}"}, json_body={
+            "type": "stream", "name": "bench broadcast", "custom_id": ENDPOINT_ID, "config": config,
+        })
+        if status != 201:
+            raise SystemExit(f"Could not create the stream mock: {status} {body!r}")
+
+        slow_count = int(args.subscribers * args.slow)
+        clients = [Client(args.slow_ms / 1000 if i < slow_count else 0.0) for i in range(args.subscribers)]
+        tasks = [asyncio.ensure_future(client.ws(app) if args.ws else client.sse(app)) for client in clients]
+        # Connecting thousands of clients takes a while; measure only once all are subscribed.
+        while broadcast_stats()["subscribers"] < args.subscribers and not any(task.done() for task in tasks):
+            await asyncio.sleep(0.01)
+        for client in clients:
+            client.events = 0
+            client.lags.clear()
+        before = broadcast_stats()
+        encodes = 0
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await asyncio.sleep(args.seconds)
+        stats = broadcast_stats()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        for client in clients:
+            client.stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    fast = [client for client in clients if not client.slow]
+    slow = [client for client in clients if client.slow]
+    published = stats["published"] - before["published"]
+    delivered = sum(client.events for client in clients)
+    result = {
+        "transport": "websocket" if args.ws else "sse",
+        "subscribers": args.subscribers,
+        "slow_subscribers": len(slow),
+        "seconds": round(elapsed, 2),
+        "published": published,
+        "delivered": delivered,
+        "deliveries_per_s": round(delivered / elapsed, 1),
+        "encodes_per_event": round(encodes / published, 2) if published else None,
+        "cpu_per_event_ms": round(cpu / published * 1000, 3) if published else None,
+        "dropped": stats["dropped"] - before["dropped"],
+        "overflowed": stats["overflowed"] - before["overflowed"],
+        "lag_fast": percentiles([lag for client in fast for lag in client.lags]),
+        "lag_slow": percentiles([lag for client in slow for lag in client.lags]),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=1000, help="concurrent clients")
+    parser.add_argument("--interval-ms", type=float, default=10, help="pause between ticks")
+    parser.add_argument("--seconds", type=float, default=5, help="how long to stream")
+    parser.add_argument("--buffer", type=int, default=256, help="events buffered per subscriber")
+    parser.add_argument("--overflow", choices=["drop_oldest", "drop_newest", "disconnect"], help="overflow policy")
+    parser.add_argument("--slow", type=float, default=0.0, help="fraction of clients that are slow")
+    parser.add_argument("--slow-ms", type=float, default=100, help="time a slow client takes per send")
+    parser.add_argument("--ws", action="store_true", help="subscribe over WebSocket instead of SSE")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+"""Cold-start cost of the app: importing api/index.py and serving the first request.
+
+Each run is a fresh interpreter, like a new serverless instance. It imports the app
+under `python -X importtime`, serves one static mock without running the lifespan (as
+serverless adapters often do), and reports both timings, the slowest imports and
+which heavy SDKs ended up loaded. The mock is served from a SQLite file seeded
+beforehand, so no Mongo server or network is involved.
+
+    cd backend && python -m benchmarks.cold_start --runs 5
+    cd backend && python -m benchmarks.cold_start --top 25
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Modules a request for a static mock should not need.
+HEAVY_MODULES = ("openai", "passlib", "jose", "yaml", "motor", "pymongo")
+
+CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import api.index
+imported = time.perf_counter()
+from benchmarks.asgi import asgi_request
+status, _, _ = asyncio.run(asgi_request(api.index.app, "GET", "/cold-static/"))
+served = time.perf_counter()
+from utils.startup import startup_stats
+print(json.dumps({
+    "status": status,
+    "import_s": imported - started,
+    "first_request_s": served - imported,
+    "loaded": [name for name in %r if name in sys.modules],
+    "startup": {name: values["seconds"] for name, values in startup_stats().items()},
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _seed(sqlite_path: str):
+    from storage.memory import MemoryStorage
+
+    async def seed():
+        storage = MemoryStorage(sqlite_path)
+        await storage.upsert_endpoint({
+            "endpoint_id": "cold-static", "type": "static", "name": "cold static", "description": "",
+            "config": {"path": "/", "value": {"message": "hello"}}, "is_public": True,
+            "owner_email": None, "rate_limit": None, "revision": "cold",
+        })
+        await storage.close()
+
+    asyncio.run(seed())
+
+
+def _imports(stderr: str, max_depth: int) -> list:
+    """(cumulative seconds, module) from -X importtime output, for modules imported at most
+    max_depth levels below the top (2 = api.index and what it imports directly)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) + 1) // 2
+        if cumulative.strip().isdigit() and depth <= max_depth:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return rows
+
+
+def run_once(env: dict, max_depth: int) -> tuple:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_s"] = wall
+    return result, _imports(proc.stderr, max_depth)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_path = os.path.join(tmp, "cold.sqlite3")
+        _seed(sqlite_path)
+        env = {
+            **os.environ,
+            "STORAGE_BACKEND": "memory",
+            "SQLITE_PATH": sqlite_path,
+            "SANDBOX_MODE": "inline",
+            "LAZY_INIT": "1",
+            "AI_CACHE_PATH": "",
+            "OPEN_AI_KEY": os.environ.get("OPEN_AI_KEY", "benchmark"),
+        }
+
+        runs, imports = [], None
+        for _ in range(args.runs):
+            result, imports = run_once(env, args.depth)
+            runs.append(result)
+
+    def median_ms(key):
+        return round(statistics.median(run[key] for run in runs) * 1000, 1)
+
+    last = runs[-1]
+    print(f"runs              {args.runs}")
+    print(f"process wall      {median_ms('process_s')} ms (median, includes interpreter start)")
+    print(f"import api.index  {median_ms('import_s')} ms")
+    print(f"first request     {median_ms('first_request_s')} ms (status {last['status']})")
+    print(f"heavy modules     {', '.join(last['loaded']) or 'none'}")
+    for name, seconds in sorted(last["startup"].items()):
+        print(f"  init {name:<12}{seconds * 1000:>9.1f} ms")
+    print(f"\nslowest imports up to depth {args.depth} (last run):")
+    for seconds, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"  {seconds * 1000:>9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to start")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--depth", type=int, default=2, help="import nesting to report (2 = what api.index imports)")
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+"""Mock-serving latency while bcrypt logins are in flight.
+
+Serves a static mock in a loop while a burst of concurrent logins runs, once with
+hashing on the event loop (the old behaviour) and once on the hashing executor.
+
+    cd backend && python -m benchmarks.login_contention --logins 16 --requests 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPEN_AI_KEY", "benchmark")
+os.environ.setdefault("SANDBOX_MODE", "inline")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from benchmarks.asgi import asgi_request, percentiles
+
+
+async def serve_static(app, count: int, interval: float) -> list:
+    """Issues requests on a fixed schedule and measures from the scheduled time, so time
+    spent waiting for a blocked event loop shows up in the latency."""
+    async def one(scheduled: float) -> float:
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        status, _, _ = await asgi_request(app, "GET", "/bench-static/")
+        assert status == 200, status
+        return time.perf_counter() - scheduled
+
+    started = time.perf_counter()
+    return list(await asyncio.gather(*(one(started + i * interval) for i in range(count))))
+
+
+async def login(app, email: str, password: str) -> int:
+    status, _, _ = await asgi_request(app, "POST", "/auth/login", json_body={"email": email, "password": password})
+    return status
+
+
+async def scenario(app, logins: int, requests: int, interval: float) -> dict:
+    started = time.perf_counter()
+    login_tasks = [asyncio.ensure_future(login(app, "bench@example.com", "benchmark")) for _ in range(logins)]
+    samples = await serve_static(app, requests, interval)
+    statuses = await asyncio.gather(*login_tasks)
+    return {
+        "static": percentiles(samples),
+        "login_statuses": {str(code): statuses.count(code) for code in set(statuses)},
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+
+async def main(args):
+    from database import storage
+    import services.auth_service as auth_service
+    import utils.auth as auth
+    from api.index import app
+
+    await storage.insert_user({
+        "email": "bench@example.com",
+        "hashed_password": auth.get_pwd_context().hash("benchmark"),
+    })
+    await storage.upsert_endpoint({
+        "endpoint_id": "bench-static",
+        "type": "static",
+        "config": {"path": "/", "value": {"ok": True}},
+        "owner_email": "bench@example.com",
+    })
+
+    results = {"bcrypt_rounds": auth.BCRYPT_ROUNDS, "logins": args.logins, "requests": args.requests}
+    results["idle"] = await scenario(app, 0, args.requests, args.interval)
+
+    # Old behaviour: hash directly on the event loop.
+    executor_verify = auth_service.verify_password_async
+
+    async def blocking_verify(plain, hashed):
+        return auth.get_pwd_context().verify_and_update(plain, hashed)
+
+    auth_service.verify_password_async = blocking_verify
+    results["logins_on_event_loop"] = await scenario(app, args.logins, args.requests, args.interval)
+    auth_service.verify_password_async = executor_verify
+
+    results["logins_on_executor"] = await scenario(app, args.logins, args.requests, args.interval)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--interval", type=float, default=0.002, help="seconds between mock requests")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""Endpoint lookups against a real MongoDB deployment, from the primary and with the
+configured read preference, plus the connection pool counters they leave behind.
+
+Needs MONGOURI; point it at a replica set to see secondary reads (see the README for
+a single-node local one). The MONGO_* settings apply as they do in the app.
+
+    cd backend && MONGOURI="mongodb://localhost:27017/?replicaSet=rs0" \\
+        MONGO_READ_PREFERENCE=secondaryPreferred MONGO_MAX_STALENESS_S=90 \\
+        python -m benchmarks.mongo_reads --reads 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.asgi import percentiles
+
+ENDPOINT_ID = "bench-mongo-reads"
+
+
+async def timed_reads(storage, count: int, concurrency: int, stale_ok: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            started = time.perf_counter()
+            doc = await storage.get_endpoint(ENDPOINT_ID, stale_ok=stale_ok)
+            elapsed = time.perf_counter() - started
+        # A secondary may not have replicated the seed yet; that is the staleness at work.
+        return elapsed if doc else None
+
+    samples = await asyncio.gather(*(one() for _ in range(count)))
+    found = [sample for sample in samples if sample is not None]
+    return {**percentiles(found), "not_yet_replicated": len(samples) - len(found)}
+
+
+async def main(args):
+    import database
+    if not database.MONGO_DETAILS:
+        raise SystemExit("Set MONGOURI to the deployment to test")
+    storage = database.create_storage("mongo")
+    client = storage.database.client
+
+    await client.admin.command("ping")
+    topology = client.delegate._topology.description
+    print(f"topology          {topology.topology_type_name}")
+    for address, server in sorted(topology.server_descriptions().items()):
+        print(f"  {'%s:%s' % address:<24}{server.server_type_name}")
+    print(f"read preference   {database.read_preference() or 'primary'}")
+    print(f"client options    {json.dumps(database.mongo_client_options())}")
+
+    await storage.upsert_endpoint({
+        "endpoint_id": ENDPOINT_ID, "type": "static", "name": "mongo reads", "description": "",
+        "config": {"path": "/", "value": {"message": "hello"}}, "is_public": True,
+        "owner_email": None, "rate_limit": None, "revision": "bench",
+    })
+    try:
+        results = {
+            "primary": await timed_reads(storage, args.reads, args.concurrency, stale_ok=False),
+            "stale_ok": await timed_reads(storage, args.reads, args.concurrency, stale_ok=True),
+        }
+        results["pool"] = database.mongo_pool_stats()
+        print(json.dumps(results, indent=2))
+    finally:
+        await storage.endpoints.delete_one({"endpoint_id": ENDPOINT_ID})
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=1000, help="lookups per read preference")
+    parser.add_argument("--concurrency", type=int, default=32, help="lookups in flight at once")
+    asyncio.run(main(parser.parse_args()))
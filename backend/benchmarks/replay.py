@@ -0,0 +1,193 @@
+"""Replays recorded mock requests to reproduce a captured load pattern.
+
+Records come from the configured storage (the same STORAGE_BACKEND / MONGOURI /
+SQLITE_PATH settings as the app) for an endpoint created with `record_requests`, or
+from a JSON file saved from GET /endpoints/{id}/recordings. Each request is sent at
+its original offset from the first one, divided by --speed; --speed 0 sends them as
+fast as --concurrency allows. Requests go to the app in-process, or to a running
+server with --target.
+
+    cd backend && python -m benchmarks.replay --endpoint my-mock --since 1718000000
+    cd backend && python -m benchmarks.replay --input session.json --speed 4 --target http://localhost:8000
+    cd backend && python -m benchmarks.replay --endpoint my-mock --save session.json --dry-run
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.asgi import asgi_request, percentiles
+
+# Set by the transport or describing the original connection, not the request.
+SKIP_HEADERS = {"host", "content-length", "connection", "transfer-encoding", "keep-alive"}
+
+
+async def load_from_storage(endpoint_id: str, since: float = None, until: float = None, limit: int = None) -> list:
+    from database import create_storage
+    storage = create_storage()
+    records, cursor = [], None
+    try:
+        while True:
+            page, cursor = await storage.list_recordings(endpoint_id, since, 1000, cursor)
+            records.extend(record for record in page if until is None or record["timestamp"] <= until)
+            if cursor is None or (limit and len(records) >= limit):
+                break
+    finally:
+        await storage.close()
+    return records[:limit] if limit else records
+
+
+def load_from_file(path: str) -> list:
+    with open(path) as f:
+        data = json.load(f)
+    # A saved API page ({"items": [...]}) or a plain list of records.
+    return data["items"] if isinstance(data, dict) else data
+
+
+def _request(record: dict, endpoint_id: str = None) -> tuple:
+    """(method, url, headers, body) to re-issue a record, optionally against another endpoint."""
+    url = f"/{endpoint_id or record['endpoint_id']}{record['path']}"
+    if record.get("query"):
+        url += "?" + record["query"]
+    headers = {
+        key: value for key, value in record.get("headers", {}).items()
+        if key.lower() not in SKIP_HEADERS and value != "[redacted]"
+    }
+    body = record.get("body") or ""
+    body = base64.b64decode(body) if record.get("body_encoding") == "base64" else body.encode()
+    return record["method"], url, headers, body
+
+
+class HttpTarget:
+    """Sends requests to a running server over plain HTTP, one blocking connection per thread."""
+
+    def __init__(self, base_url: str, concurrency: int):
+        parts = urlsplit(base_url)
+        self.connection_class = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def _send(self, method: str, url: str, headers: dict, body: bytes) -> int:
+        connection = self.connection_class(self.netloc, timeout=30)
+        try:
+            connection.request(method, self.prefix + url, body=body or None, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    async def send(self, method: str, url: str, headers: dict, body: bytes) -> int:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._send, method, url, headers, body)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class AppTarget:
+    """Sends requests to the ASGI app in this process."""
+
+    def __init__(self):
+        from api.index import app
+        self.app = app
+
+    async def send(self, method: str, url: str, headers: dict, body: bytes) -> int:
+        status, _, _ = await asgi_request(self.app, method, url, headers, body)
+        return status
+
+    def close(self):
+        pass
+
+
+async def replay(records: list, target, speed: float, concurrency: int, endpoint_id: str = None) -> dict:
+    records = sorted(records, key=lambda record: record["timestamp"])
+    semaphore = asyncio.Semaphore(concurrency)
+    first = records[0]["timestamp"]
+    started = time.perf_counter()
+    latencies, lags, statuses, mismatches, errors = [], [], Counter(), 0, 0
+
+    async def one(record):
+        nonlocal mismatches, errors
+        scheduled = started + ((record["timestamp"] - first) / speed if speed else 0.0)
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        async with semaphore:
+            sent = time.perf_counter()
+            # How far behind schedule the request went out: the replay could not keep up.
+            lags.append(max(0.0, sent - scheduled))
+            try:
+                status = await target.send(*_request(record, endpoint_id))
+            except Exception as e:
+                errors += 1
+                print("REPLAY::SEND_FAIL", e)
+                return
+            latencies.append(time.perf_counter() - sent)
+        statuses[str(status)] += 1
+        if status != record.get("status"):
+            mismatches += 1
+
+    await asyncio.gather(*(one(record) for record in records))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(records),
+        "recorded_span_s": round(records[-1]["timestamp"] - first, 3),
+        "elapsed_s": round(elapsed, 3),
+        "rate_rps": round(len(records) / elapsed, 1) if elapsed else None,
+        "statuses": dict(statuses),
+        "status_mismatches": mismatches,
+        "errors": errors,
+        "latency": percentiles(latencies),
+        "schedule_lag": percentiles(lags),
+        "recorded_latency": percentiles([record["latency_ms"] / 1000 for record in records if "latency_ms" in record]),
+    }
+
+
+async def main(args):
+    if args.input:
+        records = load_from_file(args.input)
+    elif args.endpoint:
+        records = await load_from_storage(args.endpoint, args.since, args.until, args.limit)
+    else:
+        raise SystemExit("Pass --endpoint or --input")
+    if args.limit:
+        records = records[:args.limit]
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"items": records}, f, default=str)
+        print(f"saved {len(records)} records to {args.save}")
+    if not records:
+        raise SystemExit("No recorded requests to replay")
+    if args.dry_run:
+        return
+
+    target = HttpTarget(args.target, args.concurrency) if args.target else AppTarget()
+    try:
+        result = await replay(records, target, args.speed, args.concurrency, args.as_endpoint)
+    finally:
+        target.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", help="replay this endpoint's recordings from storage")
+    parser.add_argument("--input", help="replay records from a JSON file instead")
+    parser.add_argument("--since", type=float, help="only records at or after this Unix time")
+    parser.add_argument("--until", type=float, help="only records at or before this Unix time")
+    parser.add_argument("--limit", type=int, help="replay at most this many records")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale: 1 = original pace, 2 = twice as fast, 0 = no delays")
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight at once")
+    parser.add_argument("--target", help="base URL of a running server; default is the app in-process")
+    parser.add_argument("--as-endpoint", help="send the requests to this endpoint ID instead of the recorded one")
+    parser.add_argument("--save", help="write the loaded records to this JSON file")
+    parser.add_argument("--dry-run", action="store_true", help="load (and --save) without replaying")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,219 @@
+"""Throughput and latency of the mock-serving path, one scenario per mock type.
+
+Drives the ASGI app in-process against the embedded storage engine, so no Mongo
+server or network is involved. Each scenario runs a fixed number of requests from
+--concurrency closed-loop clients after a short warm-up. Results are written as
+JSON; pass an earlier file to --compare to print the change per scenario.
+
+    cd backend && python -m benchmarks.serve_mock --requests 2000 --concurrency 16
+    cd backend && python -m benchmarks.serve_mock --only static,mapping --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPEN_AI_KEY", "benchmark")
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+# Every request comes from one client, so the default limits would turn most of them
+# into 429s. Limits this high keep the limiter on the measured path without tripping it.
+for _limit in ("RATE_LIMIT_ENDPOINT_RPS", "RATE_LIMIT_ENDPOINT_BURST", "RATE_LIMIT_OWNER_RPS", "RATE_LIMIT_OWNER_BURST", "RATE_LIMIT_CLIENT_PER_MINUTE"):
+    os.environ.setdefault(_limit, "1000000000")
+
+from benchmarks.asgi import asgi_request, percentiles
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+EMAIL = "bench@example.com"
+PASSWORD = "benchmark"
+MAPPING_ROUTES = 5000
+STATE_RECORDS = 5000
+
+STATELESS_CODE = """
+def handler(url, headers, body, data):
+    return {"url": url, "ok": True}
+"""
+
+STATEFUL_CODE = """
+def handler(url, headers, body, data):
+    data["hits"] = data.get("hits", 0) + 1
+    return {"hits": data["hits"]}
+"""
+
+POST_CODE = """
+def handler(url, headers, body, data):
+    items = data.setdefault("items", [])
+    items.append(body)
+    del items[:-100]
+    return {"created": body, "count": len(items)}
+"""
+
+# One record out of STATE_RECORDS kept as separate keys, plus a counter.
+LARGE_STATE_CODE = """
+def handler(url, headers, body, data):
+    record = data["user:" + url.rsplit("/", 1)[-1]]
+    data["reads"] = data.get("reads", 0) + 1
+    return {"user": record, "reads": data["reads"]}
+"""
+
+
+def _endpoints() -> list:
+    routes = [{"path": f"/resources{i}/{{id}}", "value": {"resource": i, "id": "{id}"}} for i in range(MAPPING_ROUTES)]
+    return [
+        {"type": "static", "name": "bench static", "custom_id": "bench-static",
+         "config": {"path": "/", "value": {"message": "hello", "items": list(range(20))}}},
+        {"type": "static", "name": "bench large static", "custom_id": "bench-large",
+         "config": {"path": "/", "value": {"items": [{"id": i, "name": f"item {i}"} for i in range(500)]}}},
+        {"type": "mapping", "name": "bench mapping", "custom_id": "bench-mapping",
+         "config": {"routes": routes}},
+        {"type": "functional", "name": "bench functional", "custom_id": "bench-functional",
+         "config": {"path": "/", "code": STATELESS_CODE, "data": {}}},
+        {"type": "functional", "name": "bench stateful", "custom_id": "bench-stateful",
+         "config": {"path": "/", "code": STATEFUL_CODE, "data": {}}},
+        {"type": "functional", "name": "bench large state", "custom_id": "bench-large-state",
+         "config": {"path": "/", "code": LARGE_STATE_CODE, "data": {
+             f"user:{i}": {"id": i, "name": f"user {i}", "email": f"user{i}@example.com", "tags": ["a", "b"]}
+             for i in range(STATE_RECORDS)
+         }}},
+        {"type": "post_mock", "name": "bench post", "custom_id": "bench-post",
+         "config": {"path": "/", "method": "POST", "code": POST_CODE, "data": {}}},
+    ]
+
+
+def _scenarios(token: str, static_etag: str) -> dict:
+    auth = {"Authorization": f"Bearer {token}"}
+    last_route = MAPPING_ROUTES - 1
+    # name -> (method, url, headers, json body[, expected status])
+    return {
+        "static": ("GET", "/bench-static/", None, None),
+        "static_not_modified": ("GET", "/bench-static/", {"if-none-match": static_etag}, None, 304),
+        "static_large_gzip": ("GET", "/bench-large/", {"accept-encoding": "gzip"}, None),
+        "mapping": ("GET", f"/bench-mapping/resources{last_route}/42", None, None),
+        "functional": ("GET", "/bench-functional/", None, None),
+        "functional_stateful": ("GET", "/bench-stateful/", None, None),
+        "functional_large_state": ("GET", f"/bench-large-state/{STATE_RECORDS // 2}", None, None),
+        "post_mock": ("POST", "/bench-post/", None, {"name": "widget", "price": 10}),
+        # One HTTP exchange carrying 50 mock calls; divide its latency by 50 to compare.
+        "batch_50": ("POST", "/batch", None, {"requests": [
+            {"endpoint_id": "bench-static"} if i % 2 else {"endpoint_id": "bench-mapping", "path": f"/resources{i}/{i}"}
+            for i in range(50)
+        ]}),
+        "list_endpoints": ("GET", "/endpoints?limit=50", auth, None),
+        "login": ("POST", "/auth/login", None, {"email": EMAIL, "password": PASSWORD}),
+    }
+
+
+async def _seed(app) -> tuple:
+    status, _, body = await asgi_request(app, "POST", "/auth/register", json_body={"email": EMAIL, "password": PASSWORD})
+    assert status == 200, (status, body)
+    token = json.loads(body)["access_token"]
+
+    status, _, body = await asgi_request(
+        app, "POST", "/url/bulk",
+        headers={"Authorization": f"Bearer {token}"},
+        json_body={"endpoints": _endpoints()},
+    )
+    assert status == 200 and json.loads(body)["counts"] == {"created": len(_endpoints())}, (status, body)
+
+    _, headers, _ = await asgi_request(app, "GET", "/bench-static/")
+    return token, dict(headers)[b"etag"].decode()
+
+
+async def run_scenario(app, request: tuple, requests: int, concurrency: int, warmup: int) -> dict:
+    method, url, headers, json_body, expected = (*request, 200)[:5]
+    errors = {}
+
+    async def one() -> float:
+        started = time.perf_counter()
+        status, _, _ = await asgi_request(app, method, url, headers=headers, json_body=json_body)
+        elapsed = time.perf_counter() - started
+        if status != expected:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+        return elapsed
+
+    for _ in range(warmup):
+        await one()
+
+    samples = []
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            samples.append(await one())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "latency": percentiles(samples),
+        "errors": errors,
+    }
+
+
+def _compare(results: dict, baseline: dict):
+    print(f"{'scenario':<22}{'rps':>12}{'Δ':>9}{'p50 ms':>10}{'Δ':>9}{'p99 ms':>10}{'Δ':>9}")
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        rps, p50, p99 = result["throughput_rps"], result["latency"]["p50_ms"], result["latency"]["p99_ms"]
+        print(f"{name:<22}{rps:>12}{delta(rps, old['throughput_rps']):>9}"
+              f"{p50:>10}{delta(p50, old['latency']['p50_ms']):>9}"
+              f"{p99:>10}{delta(p99, old['latency']['p99_ms']):>9}")
+
+
+async def main(args):
+    from api.index import app
+
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "config": {key: os.environ.get(key) for key in ("STORAGE_BACKEND", "SANDBOX_MODE", "STATE_DURABILITY", "BCRYPT_ROUNDS")},
+        "scenarios": {},
+    }
+
+    async with app.router.lifespan_context(app):
+        token, static_etag = await _seed(app)
+        scenarios = _scenarios(token, static_etag)
+        selected = args.only.split(",") if args.only else list(scenarios)
+        for name in selected:
+            # Logins are bcrypt-bound by design, so they get a fraction of the request budget.
+            requests = max(1, args.requests // 20) if name == "login" else args.requests
+            result = await run_scenario(app, scenarios[name], requests, args.concurrency, args.warmup)
+            results["scenarios"][name] = result
+            print(f"{name:<22}{result['throughput_rps']:>10} req/s  p50 {result['latency']['p50_ms']} ms"
+                  f"  p99 {result['latency']['p99_ms']} ms  errors {result['errors'] or '-'}", file=sys.stderr)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"serve_mock-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent closed-loop clients")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/serve_mock-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    asyncio.run(main(parser.parse_args()))
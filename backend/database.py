@@ -1,11 +1,151 @@
-import motor.motor_asyncio
 import os
-from dotenv import load_dotenv
+import asyncio
+from utils.utils import load_env, is_serverless
+from utils.startup import timed
 
-load_dotenv()
+load_env()
 
 MONGO_DETAILS = os.getenv("MONGOURI")
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS)
-database = client.fastdev_db
-endpoint_collection = database.get_collection("endpoints")
-user_collection = database.get_collection("users")
\ No newline at end of file
+# "mongo" (default), or "memory" for the embedded engine used by single-node
+# deployments and CI. The embedded engine persists to SQLITE_PATH when it is set.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+SQLITE_PATH = os.getenv("SQLITE_PATH")
+# Build the storage engine (and import its driver) on first use instead of at startup.
+# On by default on serverless platforms, where a cold start should only pay for what
+# its first request needs.
+LAZY_INIT = os.getenv("LAZY_INIT", "1" if is_serverless() else "0") == "1"
+
+# Motor connection settings. Those set here override the same option in MONGOURI;
+# unset ones keep the URI's value or the driver default (a pool of 100 per server).
+MONGO_MAX_POOL_SIZE = os.getenv("MONGO_MAX_POOL_SIZE")
+MONGO_MIN_POOL_SIZE = os.getenv("MONGO_MIN_POOL_SIZE")
+MONGO_MAX_IDLE_MS = os.getenv("MONGO_MAX_IDLE_MS")
+# How long an operation waits for a free pooled connection before failing.
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+# The driver waits 30s for a usable server by default; a request should fail sooner.
+MONGO_SERVER_SELECTION_TIMEOUT_MS = os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+MONGO_CONNECT_TIMEOUT_MS = os.getenv("MONGO_CONNECT_TIMEOUT_MS")
+MONGO_SOCKET_TIMEOUT_MS = os.getenv("MONGO_SOCKET_TIMEOUT_MS")
+# Comma-separated wire compressors in order of preference: zstd, snappy, zlib.
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
+# Read preference for lookups that tolerate slightly stale data (serving static and
+# mapping mocks, listings, availability checks). Writes and functional state always
+# use the primary.
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# Bounded staleness for those reads, in seconds (MongoDB requires at least 90).
+MONGO_MAX_STALENESS_S = os.getenv("MONGO_MAX_STALENESS_S")
+
+# Recorded mock requests (see services/recording_service.py) are kept in a capped
+# collection of this many megabytes and documents; the memory engine keeps the newest
+# RECORDINGS_MAX of them.
+RECORDINGS_CAPPED_MB = int(os.getenv("RECORDINGS_CAPPED_MB", "64"))
+RECORDINGS_MAX = int(os.getenv("RECORDINGS_MAX", "100000"))
+
+# Compressors that need a package which may not be installed.
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy"}
+
+pool_stats = None
+
+
+def _available_compressors(names: str) -> list:
+    import importlib.util
+    compressors = []
+    for name in filter(None, (part.strip() for part in names.split(","))):
+        module = _COMPRESSOR_MODULES.get(name)
+        if module is not None and importlib.util.find_spec(module) is None:
+            print("MONGO::COMPRESSOR_UNAVAILABLE", name)
+            continue
+        compressors.append(name)
+    return compressors
+
+
+def mongo_client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    }
+    options = {key: int(value) for key, value in options.items() if value not in (None, "")}
+    compressors = _available_compressors(MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+def read_preference():
+    """The read preference for stale-tolerant lookups, or None to read from the primary."""
+    if MONGO_READ_PREFERENCE == "primary":
+        return None
+    from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+    max_staleness = int(MONGO_MAX_STALENESS_S) if MONGO_MAX_STALENESS_S else -1
+    return make_read_preference(read_pref_mode_from_name(MONGO_READ_PREFERENCE), None, max_staleness)
+
+
+def connect_mongo():
+    global pool_stats
+    import motor.motor_asyncio
+    from storage.mongo_pool import PoolStats
+    pool_stats = PoolStats()
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_DETAILS, event_listeners=[pool_stats], **mongo_client_options())
+    pool_stats.max_pool_size = client.options.pool_options.max_pool_size
+    return client.fastdev_db
+
+
+def mongo_pool_stats() -> dict:
+    return pool_stats.stats() if pool_stats is not None else {}
+
+
+def create_storage(backend: str = STORAGE_BACKEND):
+    if backend == "mongo":
+        from storage.mongo import MongoStorage
+        return MongoStorage(connect_mongo(), read_preference())
+    if backend == "memory":
+        from storage.memory import MemoryStorage
+        return MemoryStorage(SQLITE_PATH, RECORDINGS_MAX)
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'")
+
+
+class LazyStorage:
+    """Stands in for the configured engine and builds it on first attribute access.
+
+    The engine's startup() is awaited from the app lifespan unless LAZY_INIT is set;
+    then it runs in the background once the engine is first built instead.
+    """
+
+    def __init__(self, backend: str = STORAGE_BACKEND):
+        self.backend = backend
+        self._engine = None
+        self._started = False
+        self._startup_task = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with timed("storage"):
+                self._engine = create_storage(self.backend)
+            if LAZY_INIT:
+                try:
+                    self._startup_task = asyncio.get_running_loop().create_task(self.startup())
+                except RuntimeError:
+                    pass  # No loop yet; the lifespan's startup() will run it.
+        return self._engine
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+    async def startup(self):
+        if self._started or (LAZY_INIT and self._engine is None):
+            return
+        self._started = True
+        await self.engine.startup()
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.close()
+
+
+storage = LazyStorage()
@@ -0,0 +1,136 @@
+"""Index management for the Mongo collections (the mongo storage engine only).
+
+Indexes are declared here and applied idempotently at startup. Run this module
+directly to apply them and to check the hot queries for collection scans:
+
+    cd backend && python indexes.py --apply --explain
+"""
+import argparse
+import asyncio
+import json
+import os
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import CollectionInvalid, OperationFailure
+from database import RECORDINGS_CAPPED_MB, RECORDINGS_MAX
+from utils.utils import is_serverless
+
+# Applying indexes costs a round trip per collection, which serverless cold starts skip by default.
+ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "0" if is_serverless() else "1") == "1"
+
+INDEXES = {
+    "endpoints": [
+        IndexModel([("endpoint_id", ASCENDING)], name="endpoint_id_unique", unique=True),
+        # Keyset pagination in list_endpoints: one branch of the $or each, sorted by _id.
+        IndexModel([("is_public", ASCENDING), ("_id", ASCENDING)], name="public_listing"),
+        IndexModel([("owner_email", ASCENDING), ("_id", ASCENDING)], name="owner_listing"),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "state": [
+        IndexModel([("endpoint_id", ASCENDING), ("revision", ASCENDING), ("key", ASCENDING)], name="state_key_unique", unique=True),
+    ],
+    "recordings": [
+        IndexModel([("endpoint_id", ASCENDING), ("_id", ASCENDING)], name="endpoint_recordings"),
+    ],
+}
+
+# Created before anything else touches them, since an index build or an insert would
+# otherwise create them as ordinary, unbounded collections.
+CAPPED_COLLECTIONS = {
+    "recordings": {"size": RECORDINGS_CAPPED_MB * 1024 * 1024, "max": RECORDINGS_MAX},
+}
+
+# (description, collection, filter, sort) for every query on a request path.
+HOT_QUERIES = [
+    ("resolve endpoint", "endpoints", {"endpoint_id": "__probe__"}, None),
+    ("resolve batch", "endpoints", {"endpoint_id": {"$in": ["__probe__", "__probe2__"]}}, None),
+    ("list public endpoints", "endpoints", {"is_public": True}, [("_id", ASCENDING)]),
+    ("list visible endpoints", "endpoints",
+     {"$or": [{"is_public": True}, {"owner_email": "probe@example.com"}]}, [("_id", ASCENDING)]),
+    ("list own endpoints", "endpoints", {"owner_email": "probe@example.com"}, [("_id", ASCENDING)]),
+    ("load state keys", "state", {"endpoint_id": "__probe__", "revision": "__probe__", "key": {"$in": ["a", "b"]}}, None),
+    ("find user", "users", {"email": "probe@example.com"}, None),
+    ("list recordings", "recordings", {"endpoint_id": "__probe__"}, [("_id", ASCENDING)]),
+]
+
+
+async def ensure_capped(database) -> list:
+    """Creates the missing capped collections and returns their names."""
+    existing = set(await database.list_collection_names())
+    created = []
+    for name, options in CAPPED_COLLECTIONS.items():
+        if name in existing:
+            if not (await database.get_collection(name).options()).get("capped"):
+                print("INDEX::NOT_CAPPED", name)
+            continue
+        try:
+            await database.create_collection(name, capped=True, **options)
+            created.append(name)
+        except CollectionInvalid:
+            pass  # Another worker created it first.
+        except OperationFailure as e:
+            print("INDEX::CAPPED_FAIL", name, e)
+    return created
+
+
+async def ensure_indexes(database) -> dict:
+    """Creates any missing indexes. Existing ones with the same definition are left untouched."""
+    created = {"capped": await ensure_capped(database)}
+    for name, models in INDEXES.items():
+        try:
+            created[name] = await database.get_collection(name).create_indexes(models)
+        except OperationFailure as e:
+            # Typically duplicate data blocking a unique index; the service still works without it.
+            print("INDEX::CREATE_FAIL", name, e)
+            created[name] = []
+    return created
+
+
+def _stages(plan: dict):
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan", "winningPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def explain_hot_queries(database) -> list:
+    """Runs explain() on every hot query and flags the ones that fall back to a collection scan."""
+    report = []
+    for description, name, query, sort in HOT_QUERIES:
+        cursor = database.get_collection(name).find(query).limit(50)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = list(_stages(explanation.get("queryPlanner", {}).get("winningPlan", {})))
+        report.append({
+            "query": description,
+            "collection": name,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+        })
+    return report
+
+
+async def _main(args):
+    from database import connect_mongo
+    database = connect_mongo()
+    if args.apply:
+        print(json.dumps(await ensure_indexes(database), indent=2))
+    if args.explain:
+        report = await explain_hot_queries(database)
+        print(json.dumps(report, indent=2))
+        if any(entry["collection_scan"] for entry in report):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="create missing indexes")
+    parser.add_argument("--explain", action="store_true", help="explain hot queries, exit 1 on any collection scan")
+    asyncio.run(_main(parser.parse_args()))
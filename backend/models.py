@@ -5,6 +5,8 @@ from datetime import datetime
 class StaticConfig(BaseModel):
     path: str = "/"
     value: Dict[str, Any]
+    # Overrides MOCK_CACHE_CONTROL for this endpoint's responses.
+    cache_control: Optional[str] = None
 
 class RouteMapping(BaseModel):
     path: str
@@ -12,25 +14,89 @@ class RouteMapping(BaseModel):
 
 class MappingConfig(BaseModel):
     routes: List[RouteMapping]
+    cache_control: Optional[str] = None
 class FunctionalConfig(BaseModel):
     path: str = "/"
     code: str
     data: Dict[str, Any] = {}
+    # How a generator handler's items are streamed; None lets the Accept header decide.
+    stream: Optional[Literal["chunked", "ndjson", "sse"]] = None
 
 class PostMockConfig(BaseModel):
     path: str = "/"
     method: Literal["POST", "PUT", "DELETE"] = "POST"
     code: str
     data: Dict[str, Any] = {}
+    stream: Optional[Literal["chunked", "ndjson", "sse"]] = None
+
+class StreamEvent(BaseModel):
+    # Wait after the previous event (or after the feed starts) before publishing this one.
+    delay_ms: float = Field(0, ge=0)
+    # Sent as the SSE event name; other formats get {"event": ..., "data": ...}.
+    event: Optional[str] = None
+    data: Any = None
+
+class StreamConfig(BaseModel):
+    path: str = "/"
+    # Either a generator handler, called once per feed, or a scripted schedule of events.
+    code: Optional[str] = None
+    events: Optional[List[StreamEvent]] = None
+    # Start the schedule over once its last event is out.
+    repeat: bool = False
+    # Pause between a handler's events, for generators that do not pace themselves.
+    interval_ms: Optional[float] = Field(None, ge=0)
+    data: Dict[str, Any] = {}
+    # Wire format over HTTP; None lets the Accept header decide. WebSocket clients get text messages.
+    stream: Optional[Literal["chunked", "ndjson", "sse"]] = None
+    # Events buffered per subscriber, and what to do with a subscriber whose buffer is full.
+    buffer: Optional[int] = Field(None, ge=1)
+    on_overflow: Optional[Literal["drop_oldest", "drop_newest", "disconnect"]] = None
+
+class RateLimitConfig(BaseModel):
+    # Each setting can only tighten the server-wide RATE_LIMIT_* / FUNCTIONAL_MAX_CONCURRENCY limits.
+    requests_per_second: Optional[float] = Field(None, gt=0)
+    burst: Optional[int] = Field(None, ge=1)
+    per_client_per_minute: Optional[int] = Field(None, ge=1)
+    max_concurrency: Optional[int] = Field(None, ge=1)
 
 class CreateUrlRequest(BaseModel):
-    type: Literal["static", "mapping", "functional", "post_mock"]
-    config: Union[StaticConfig, MappingConfig, FunctionalConfig, PostMockConfig]
+    type: Literal["static", "mapping", "functional", "post_mock", "stream"]
+    config: Union[StaticConfig, MappingConfig, FunctionalConfig, PostMockConfig, StreamConfig]
     name: str = Field(..., min_length=1, max_length=50)
     description: str = ""
     is_public: bool = True
     owner_email: Optional[str] = None
     custom_id: Optional[str] = None
+    rate_limit: Optional[RateLimitConfig] = None
+    # Capture the requests this mock receives; see GET /endpoints/{id}/recordings.
+    record_requests: bool = False
+
+class BulkCreateRequest(BaseModel):
+    endpoints: List[CreateUrlRequest]
+    ordered: bool = False
+
+class BatchItem(BaseModel):
+    endpoint_id: str
+    path: str = "/"
+    method: Literal["GET", "POST", "PUT", "DELETE"] = "GET"
+    headers: Dict[str, str] = {}
+    # JSON values are sent as a JSON body; strings are sent as is.
+    body: Any = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+class OpenApiImportRequest(BaseModel):
+    # A parsed spec, or its raw JSON/YAML text.
+    spec: Union[Dict[str, Any], str]
+    custom_id: Optional[str] = None
+    name: Optional[str] = None
+    is_public: bool = True
+
+class HarImportRequest(BaseModel):
+    har: Union[Dict[str, Any], str]
+    id_prefix: Optional[str] = None
+    is_public: bool = True
 
 # User Models
 class User(BaseModel):
@@ -1,35 +1,26 @@
 from fastapi import HTTPException
 from models import AiGenRequest
-from database import user_collection
+from database import storage
+from services.auth_service import invalidate_user
+from utils.generation_cache import GenerationCache, generation_key
+from utils.startup import timed
+import asyncio
 import os
 from datetime import datetime
-from openai import AsyncOpenAI
+from types import SimpleNamespace
 import json
 
-client = AsyncOpenAI(api_key=os.getenv("OPEN_AI_KEY"))
 MAX_CHATS = int(os.getenv("MAX_CHATS_PER_WEEK", "20"))
 AI_MODEL = os.getenv("AI_MODEL", "gpt-3.5-turbo")
+# "openai" calls the API; "stub" answers locally and deterministically, for tests and offline development.
+AI_CLIENT = os.getenv("AI_CLIENT", "openai")
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1024"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))
+# A SQLite file that persists the cache across restarts. It holds users' prompts and
+# results, so it is off unless pointed at a file only this app can read.
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "")
 
-async def generate_mock_config_service(payload: AiGenRequest, user: dict):
-    # Rate Limiting Logic
-    now = datetime.utcnow()
-    last_reset = user.get("last_reset_time", now)
-    
-    # If more than 7 days have passed, reset counter
-    if (now - last_reset).days >= 7:
-        await user_collection.update_one(
-            {"_id": user["_id"]},
-            {"$set": {"max_chats_count": 0, "last_reset_time": now}}
-        )
-        current_count = 0
-    else:
-        current_count = user.get("max_chats_count", 0)
-    
-    if current_count >= MAX_CHATS:
-        raise HTTPException(status_code=429, detail="Weekly AI generation limit reached.")
-
-    # Generate Content
-    system_prompt = """
+SYSTEM_PROMPT = """
     You are an expert Python backend developer. 
     Your task is to generate a Mock Configuration based on the user's description.
     
@@ -58,6 +49,109 @@ async def generate_mock_config_service(payload: AiGenRequest, user: dict):
     Return ONLY the raw JSON object. Do not wrap it in markdown code blocks.
     """
 
+
+class _StubCompletions:
+    async def create(self, model: str, messages: list):
+        description = messages[-1]["content"].split("Description:", 1)[-1].split("\n", 1)[0].strip()
+        content = json.dumps({"type": "static", "value": {"description": description, "model": model}})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class StubClient:
+    """Mimics the slice of AsyncOpenAI used here without touching the network."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_StubCompletions())
+
+
+_client = None
+
+
+def get_client():
+    """The AI client, created on first use: importing the OpenAI SDK takes longer than
+    everything else at startup, and most cold starts only serve mocks."""
+    global _client
+    if _client is None:
+        with timed("ai_client"):
+            if AI_CLIENT == "stub":
+                _client = StubClient()
+            else:
+                from openai import AsyncOpenAI
+                _client = AsyncOpenAI(api_key=os.getenv("OPEN_AI_KEY"))
+    return _client
+
+
+generation_cache = GenerationCache(AI_CACHE_SIZE, AI_CACHE_TTL, AI_CACHE_PATH or None)
+# generation key -> task of the model call in flight for it
+_in_flight = {}
+
+
+async def generate_mock_config_service(payload: AiGenRequest, user: dict):
+    # Identical requests are answered from the cache, or by joining the call already in
+    # flight for them. Neither reaches the model, so neither counts against the quota.
+    key = generation_key(
+        payload.description, payload.input_format, payload.output_format, payload.url, AI_MODEL, SYSTEM_PROMPT
+    )
+    cached = await generation_cache.get(key)
+    if cached is not None:
+        return cached
+    task = _in_flight.get(key)
+    if task is not None:
+        result, _ = await asyncio.shield(task)
+        return result
+
+    # Rate Limiting Logic
+    now = datetime.utcnow()
+    last_reset = user.get("last_reset_time", now)
+    
+    # If more than 7 days have passed, reset counter. Only the request that still sees the
+    # old reset time resets it, so concurrent requests cannot wipe each other's increments.
+    if (now - last_reset).days >= 7:
+        await storage.update_user(
+            user["_id"], {"max_chats_count": 0, "last_reset_time": now}, expected={"last_reset_time": last_reset}
+        )
+        invalidate_user(user["email"])
+
+    # The quota is claimed before the call, in one conditional update, so concurrent
+    # requests cannot all pass a stale check and overrun it.
+    if not await storage.increment_user(user["_id"], "max_chats_count", limit=MAX_CHATS):
+        raise HTTPException(status_code=429, detail="Weekly AI generation limit reached.")
+    invalidate_user(user["email"])
+
+    task = _in_flight.get(key)
+    owner = task is None
+    if owner:
+        task = _in_flight[key] = asyncio.ensure_future(_generate_cached(key, payload))
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+
+    try:
+        # Shielded, so a client that disconnects does not cancel the call for everyone waiting on it.
+        result, complete = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        await _refund(user)
+        raise
+    if not (owner and complete):
+        # Joined a call another request started meanwhile, or got an unusable answer: not charged.
+        await _refund(user)
+    return result
+
+
+async def _refund(user: dict):
+    await storage.increment_user(user["_id"], "max_chats_count", -1)
+    invalidate_user(user["email"])
+
+
+async def _generate_cached(key: str, payload: AiGenRequest):
+    result, complete = await _generate(payload)
+    if complete:
+        await generation_cache.set(key, result)
+    return result, complete
+
+
+async def _generate(payload: AiGenRequest):
+    """Returns (result, complete); incomplete results fell back to raw content and are not cached."""
     user_prompt = f"""
     Description: {payload.description}
     Input Format: {payload.input_format or "Any"}
@@ -68,10 +162,10 @@ async def generate_mock_config_service(payload: AiGenRequest, user: dict):
     """
 
     try:
-        response = await client.chat.completions.create(
+        response = await get_client().chat.completions.create(
             model=AI_MODEL,
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt}
             ]
         )
@@ -89,7 +183,7 @@ async def generate_mock_config_service(payload: AiGenRequest, user: dict):
             # Fallback if AI fails to return valid JSON - try to wrap it as static or functional heuristically
             # This is a basic fallback
             print("GEN::JSON_FAIL", content)
-            return {"content": content, "type": "functional"} # Assume functional legacy
+            return {"content": content, "type": "functional"}, False # Assume functional legacy
 
         # Transform to frontend expected format
         result = {
@@ -102,12 +196,7 @@ async def generate_mock_config_service(payload: AiGenRequest, user: dict):
         if result["type"] == "static" and not isinstance(result["content"], str):
              result["content"] = json.dumps(result["content"])
 
-        await user_collection.update_one(
-            {"_id": user["_id"]},
-            {"$inc": {"max_chats_count": 1}}
-        )
-        
-        return result
+        return result, True
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI Generation Failed: {str(e)}")
@@ -1,13 +1,35 @@
+import hmac
+import os
+import time
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from models import UserCreate, UserLogin, Token, User
-from database import user_collection
-from utils.auth import get_password_hash, verify_password, create_access_token, decode_access_token
+from database import storage
+from storage.base import DuplicateKey
+from utils.auth import hash_password_async, verify_password_async, create_access_token, decode_access_token, HashingSaturated
+from utils.cache import LRUCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
+# Bearer token that operational routes such as /metrics require; unset, they answer 404.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+
+# Verified token -> user document. Entries never outlive the token's own expiry.
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def invalidate_user(email: str):
+    """Drops cached sessions for a user after their record changes."""
+    user_cache.pop_where(lambda user: user.get("email") == email)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    cached = user_cache.get(token)
+    if cached is not None:
+        # Callers mutate the user dict (e.g. stringifying _id), so never hand out the cached one.
+        return dict(cached)
+
     payload = decode_access_token(token)
     if payload is None:
         raise HTTPException(
@@ -19,10 +41,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if email is None:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = await user_collection.find_one({"email": email})
+    user = await storage.get_user(email)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+
+    ttl = USER_CACHE_TTL
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        user_cache.set(token, user, ttl=ttl)
+    return dict(user)
 
 async def get_current_user_optional(token: str = Depends(oauth2_scheme_optional)):
     if not token:
@@ -32,12 +60,41 @@ async def get_current_user_optional(token: str = Depends(oauth2_scheme_optional)
     except:
         return None
 
+async def require_metrics_token(token: str = Depends(oauth2_scheme_optional)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not token or not hmac.compare_digest(token, METRICS_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+def _hashing_unavailable():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+async def hash_password(password: str) -> str:
+    try:
+        return await hash_password_async(password)
+    except HashingSaturated:
+        raise _hashing_unavailable()
+
+async def verify_password(plain_password: str, hashed_password: str):
+    try:
+        return await verify_password_async(plain_password, hashed_password)
+    except HashingSaturated:
+        raise _hashing_unavailable()
+
 async def register_user(user: UserCreate) -> dict:
-    existing_user = await user_collection.find_one({"email": user.email})
+    existing_user = await storage.get_user(user.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     new_user = User(
         email=user.email,
         hashed_password=hashed_password
@@ -45,19 +102,31 @@ async def register_user(user: UserCreate) -> dict:
     
     # Insert safely without _id if None
     user_dict = new_user.dict(by_alias=True, exclude={"id"})
-    await user_collection.insert_one(user_dict)
+    try:
+        await storage.insert_user(user_dict)
+    except DuplicateKey:
+        # Lost a race with a concurrent registration for the same email.
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 async def login_user(user: UserLogin) -> dict:
-    db_user = await user_collection.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["hashed_password"]):
+    db_user = await storage.get_user(user.email)
+    valid, new_hash = (False, None)
+    if db_user:
+        valid, new_hash = await verify_password(user.password, db_user["hashed_password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    if new_hash:
+        # The hashing parameters changed since this password was stored; upgrade it in place.
+        await storage.update_user(db_user["_id"], {"hashed_password": new_hash})
+        invalidate_user(user.email)
     
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
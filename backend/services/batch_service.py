@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+import time
+from fastapi import HTTPException
+from starlette.responses import Response
+from services.endpoint_cache import get_endpoints
+from services.recording_service import recorder
+from services.resolve_service import resolve_mock_response
+from utils.http_cache import serialize
+from utils.metrics import start_timer
+from utils.request import MockRequest
+from utils.streaming import MockStreamResponse
+from utils.utils import load_env
+
+load_env()
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+# Sub-requests resolved at once. Kept below FUNCTIONAL_MAX_CONCURRENCY, so a batch of
+# calls to one functional mock queues on its lock instead of being turned away.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+# A streaming handler called in a batch is collected into a list of at most this many items.
+BATCH_STREAM_ITEMS = int(os.getenv("BATCH_STREAM_ITEMS", "1000"))
+
+# Response headers that describe the HTTP exchange rather than the mock's answer.
+_TRANSPORT_HEADERS = {"content-length", "content-encoding", "vary", "transfer-encoding"}
+
+
+def _request_body(item) -> bytes:
+    if item.body is None:
+        return b""
+    if isinstance(item.body, str):
+        return item.body.encode()
+    return json.dumps(item.body).encode()
+
+
+def _mock_request(item, client: str, timer) -> MockRequest:
+    # Lower-cased like Starlette's headers. Sub-responses are embedded in one JSON
+    # document, so they must not be compressed on their own.
+    headers = {key.lower(): value for key, value in item.headers.items() if key.lower() != "accept-encoding"}
+    if item.body is not None and not isinstance(item.body, str):
+        headers.setdefault("content-type", "application/json")
+    return MockRequest(item.method, headers, raw=_request_body(item), timer=timer, client=client)
+
+
+def _result(status: int, headers: dict, body: bytes) -> bytes:
+    """One result as JSON, with the mock's already serialised body spliced in as is."""
+    head = serialize({"status": status, "headers": headers})
+    return head[:-1] + b',"body":' + (body or b"null") + b"}"
+
+
+async def _resolve_one(item, docs: dict, client: str) -> bytes:
+    started = time.perf_counter()
+    timer = start_timer()
+    status_code = 500
+    request = None
+    path = "/" + item.path.lstrip("/")
+    try:
+        doc = docs.get(item.endpoint_id.strip("/"))
+        if doc is None:
+            raise HTTPException(status_code=404, detail="Mock not found")
+        if doc["type"] == "stream":
+            raise HTTPException(status_code=400, detail="Stream mocks cannot be called in a batch")
+        request = _mock_request(item, client, timer)
+        result = await resolve_mock_response(doc["endpoint_id"], path[1:], request, doc)
+
+        headers = {}
+        if isinstance(result, MockStreamResponse):
+            body = serialize(await result.collect(BATCH_STREAM_ITEMS))
+            status_code = 200
+        elif isinstance(result, Response):
+            body = result.body
+            status_code = result.status_code
+            headers = {k: v for k, v in result.headers.items() if k not in _TRANSPORT_HEADERS}
+        else:
+            body = serialize(result)
+            status_code = 200
+        timer.mark("serialize")
+        return _result(status_code, headers, body)
+    except HTTPException as e:
+        status_code = e.status_code
+        return _result(status_code, dict(e.headers or {}), serialize({"detail": e.detail}))
+    except Exception as e:
+        print("BATCH::ITEM_FAIL", e)
+        return _result(status_code, {}, serialize({"detail": f"Functional Error: {e}"}))
+    finally:
+        timer.record(status_code)
+        if request is not None and request.record:
+            await recorder.capture(doc["endpoint_id"], request, path, "", status_code, time.perf_counter() - started)
+
+
+async def resolve_batch(items: list, client: str = None) -> Response:
+    """Resolves every sub-request and returns {"results": [...]} in request order, each
+    with its own status, headers and body. Endpoint documents are fetched in one query."""
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {BATCH_MAX_ITEMS} requests")
+
+    docs = await get_endpoints(item.endpoint_id.strip("/") for item in items)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def bounded(item):
+        async with semaphore:
+            return await _resolve_one(item, docs, client)
+
+    results = await asyncio.gather(*(bounded(item) for item in items))
+    return Response(b'{"results":[' + b",".join(results) + b"]}", media_type="application/json")
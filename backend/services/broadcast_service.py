@@ -0,0 +1,121 @@
+import asyncio
+import os
+import weakref
+from fastapi import HTTPException, status
+from utils.broadcast import OVERFLOW_POLICIES, Broadcast
+from utils.streaming import STREAM_BATCH_SIZE, iter_batches, close_stream
+from utils.utils import load_env
+
+load_env()
+
+# Events buffered for each subscriber of a `stream` mock. An endpoint's `buffer` setting
+# overrides it, up to BROADCAST_MAX_BUFFER.
+BROADCAST_BUFFER = int(os.getenv("BROADCAST_BUFFER", "256"))
+BROADCAST_MAX_BUFFER = int(os.getenv("BROADCAST_MAX_BUFFER", "10000"))
+# What happens to a subscriber whose buffer is full, unless the endpoint sets `on_overflow`.
+BROADCAST_OVERFLOW = os.getenv("BROADCAST_OVERFLOW", "drop_oldest")
+# Subscribers per endpoint in each worker process; 0 lifts the cap.
+BROADCAST_MAX_SUBSCRIBERS = int(os.getenv("BROADCAST_MAX_SUBSCRIBERS", "10000"))
+# Sandbox workers reserved for stream mock handlers in process mode. Each running feed
+# holds one, so they are kept apart from the functional pool; a feed beyond them gets 503.
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "2"))
+
+if BROADCAST_OVERFLOW not in OVERFLOW_POLICIES:
+    raise ValueError(f"Unknown BROADCAST_OVERFLOW '{BROADCAST_OVERFLOW}'")
+
+# endpoint_id -> the Broadcast currently running for it in this process
+broadcasts = {}
+# Feeds closed whose producer may still be closing its source.
+_closing = weakref.WeakSet()
+# Counters of feeds that have already stopped, so stats() covers the process lifetime.
+_finished = {"published": 0, "dropped": 0, "overflowed": 0}
+_started = 0
+
+
+async def scripted_events(events: list, repeat: bool = False):
+    """A stream mock's `events` schedule as event batches: each event is published
+    `delay_ms` after the previous one."""
+    while True:
+        for event in events:
+            delay = event.get("delay_ms") or 0
+            if delay:
+                await asyncio.sleep(delay / 1000)
+            yield [(event.get("event"), event.get("data"))]
+        if not repeat:
+            return
+
+
+async def handler_events(source, size: int = STREAM_BATCH_SIZE):
+    """The items of a generator handler (in-process or sandboxed) as batches of up to
+    `size` unnamed events."""
+    try:
+        async for items in iter_batches(source, size):
+            yield [(None, item) for item in items]
+    finally:
+        await close_stream(source)
+
+
+def _closed(broadcast: Broadcast):
+    if broadcasts.get(broadcast.key[0]) is broadcast:
+        del broadcasts[broadcast.key[0]]
+    _closing.add(broadcast)
+    for key, value in broadcast.stats().items():
+        if key in _finished:
+            _finished[key] += value
+
+
+def _broadcast(doc: dict, open_events) -> Broadcast:
+    global _started
+    endpoint_id = doc["endpoint_id"]
+    key = (endpoint_id, doc.get("revision"))
+    broadcast = broadcasts.get(endpoint_id)
+    if broadcast is not None and broadcast.key != key:
+        # The endpoint was overwritten; its subscribers reconnect to the new definition.
+        broadcast.close()
+        broadcast = None
+    if broadcast is None or broadcast.closed:
+        interval = (doc["config"].get("interval_ms") or 0) / 1000
+        broadcast = broadcasts[endpoint_id] = Broadcast(key, open_events, interval, _closed)
+        _started += 1
+    return broadcast
+
+
+async def subscribe(doc: dict, fmt: str, open_events) -> tuple:
+    """Joins the endpoint's feed, starting it with open_events() if it is not running in
+    this process. Returns (broadcast, subscriber)."""
+    config = doc["config"]
+    broadcast = _broadcast(doc, open_events)
+    if BROADCAST_MAX_SUBSCRIBERS and len(broadcast.subscribers) >= BROADCAST_MAX_SUBSCRIBERS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many subscribers to this stream.",
+            headers={"Retry-After": "1"},
+        )
+    limit = min(config.get("buffer") or BROADCAST_BUFFER, BROADCAST_MAX_BUFFER)
+    policy = config.get("on_overflow") or BROADCAST_OVERFLOW
+    return broadcast, await broadcast.subscribe(fmt, limit, policy)
+
+
+def close_broadcast(endpoint_id: str):
+    """Stops the endpoint's feed, if one is running, after its definition changed."""
+    broadcast = broadcasts.get(endpoint_id)
+    if broadcast is not None:
+        broadcast.close()
+
+
+async def close_all():
+    """Stops every feed and waits for their sources, sandbox workers included, to be closed."""
+    running = list(broadcasts.values()) + list(_closing)
+    for broadcast in running:
+        broadcast.close()
+    await asyncio.gather(*(broadcast.wait_closed() for broadcast in running))
+
+
+def broadcast_stats() -> dict:
+    running = [broadcast.stats() for broadcast in broadcasts.values()]
+    return {
+        "feeds": len(running),
+        "started": _started,
+        "subscribers": sum(stats["subscribers"] for stats in running),
+        **{key: total + sum(stats[key] for stats in running) for key, total in _finished.items()},
+    }
@@ -1,78 +1,177 @@
 import os
-from database import endpoint_collection as collection
-from utils.utils import format_path, generate_unique_id
-from dotenv import load_dotenv
+from database import storage
+from storage.base import DuplicateKey, InvalidCursor
+from services.endpoint_cache import invalidate_endpoint
+from models import StreamConfig
+from utils.utils import format_path, generate_unique_id, load_env
+from utils.router import build_router
 from fastapi import HTTPException, status
 
-load_dotenv()
+load_env()
 
 BASE_URL = os.getenv("BASE_URL")
 
 async def check_availability(endpoint_id: str):
     """Checks if an endpoint ID is already in use."""
     endpoint_id = endpoint_id.strip("/")
-    exists = await collection.find_one({"endpoint_id": endpoint_id})
+    # A stale answer is harmless: creating a taken ID still fails on the unique index.
+    exists = await storage.get_endpoint(endpoint_id, stale_ok=True)
     return {"available": not bool(exists)}
 
-async def list_endpoints(user_email: str = None):
+MAX_BULK_ITEMS = int(os.getenv("MAX_BULK_ITEMS", "5000"))
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+async def list_endpoints(user_email: str = None, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, mine: bool = False):
     """
-    Lists endpoints. 
-    If user_email is provided, shows Public + User's Own endpoints.
+    Lists endpoint summaries one page at a time, ordered by _id.
+    If user_email is provided, shows Public + User's Own endpoints, or with mine only the user's own.
     If no user_email, shows only Public endpoints.
+    Pass the returned next_cursor back as `cursor` to fetch the following page.
     """
-    query = {"is_public": True}
-    
-    if user_email:
-        query = {
-            "$or": [
-                {"is_public": True},
-                {"owner_email": user_email}
-            ]
-        }
-        
-    return await collection.find(query, {"_id": 0}).to_list(length=1000)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if mine and not user_email:
+        raise HTTPException(status_code=401, detail="Sign in to list your own endpoints")
+    try:
+        docs, next_cursor = await storage.list_endpoints(user_email, limit, cursor, owned_only=mine)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": docs, "next_cursor": next_cursor}
 
-async def create_new_mock(payload, user_email: str):
+async def get_endpoint_details(endpoint_id: str, user_email: str = None):
+    """Returns the full endpoint definition if it is public or owned by the user."""
+    doc = await storage.get_visible_endpoint(endpoint_id.strip("/"), user_email)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Endpoint not found")
+    return doc
+
+def build_endpoint_document(payload, user_email: str) -> dict:
+    """Validates a CreateUrlRequest and turns it into the stored endpoint document."""
     endpoint_id = payload.custom_id if payload.custom_id else generate_unique_id()
     endpoint_id = endpoint_id.strip("/")
     
-    # Check if ID exists if custom_id provided OR just to be safe (collision check)
-    existing = await collection.find_one({"endpoint_id": endpoint_id})
-    
-    # If custom ID is requested and taken by someone else (or even same user, we might want to overwrite or fail using specific logic)
-    # User Request: "Verify if its available and not being used"
-    # User Request: "There should be an option to create new by name and must have check button"
-    # Strategy: If it exists and user is owner, allow update? Or fail?
-    # Simpler first pass: functionality to check availability is separate. 
-    # Here, if it exists, we fail if it's a NEW creation request logic, but let's assume if they passed the check they want it.
-    # However, to be robust:
-    if existing:
-        if existing.get("owner_email") != user_email:
-             raise HTTPException(status_code=409, detail=f"Endpoint ID '{endpoint_id}' is already taken by another user.")
-        # If it is the same user, we overwrite/update.
-        # But `insert_one` will fail on _id if we used endpoint_id as _id (we aren't, accessing by endpoint_id field).
-        # We should probably use update_one with upsert, or delete previous.
-        await collection.delete_one({"endpoint_id": endpoint_id})
-
     if hasattr(payload.config, "model_dump"):
         config_dict = payload.config.model_dump()
     else:
         config_dict = payload.config.dict()
+
+    rate_limit = None
+    if payload.rate_limit is not None:
+        if hasattr(payload.rate_limit, "model_dump"):
+            rate_limit = payload.rate_limit.model_dump(exclude_none=True)
+        else:
+            rate_limit = payload.rate_limit.dict(exclude_none=True)
+
+    if payload.type == "mapping":
+        # Compile once up front so malformed route templates are rejected at creation time.
+        try:
+            build_router(config_dict.get("routes", []))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif payload.type == "stream":
+        _check_stream_config(config_dict)
+    elif isinstance(payload.config, StreamConfig):
+        # Every stream setting is optional, so a config missing what its own type needs lands here.
+        raise HTTPException(status_code=400, detail=f"Invalid config for a {payload.type} mock")
     
-    new_endpoint = {
+    return {
         "endpoint_id": endpoint_id,
         "type": payload.type,
         "config": config_dict,
         "name": payload.name,
         "description": payload.description,
         "is_public": payload.is_public,
-        "owner_email": user_email
+        "owner_email": user_email,
+        "rate_limit": rate_limit,
+        "record_requests": payload.record_requests,
+        # Changes on every write, so stale in-memory state can tell it belongs to an older definition.
+        "revision": generate_unique_id()
     }
-    
-    await collection.insert_one(new_endpoint)
-    path_suffix = config_dict.get('path', '/')
+
+def _check_stream_config(config: dict):
+    if bool(config.get("code")) == bool(config.get("events")):
+        raise HTTPException(status_code=400, detail="A stream mock needs either `code` or `events`")
+    if config.get("events") and config.get("repeat") and not any(event.get("delay_ms") for event in config["events"]):
+        # It would publish as fast as the loop turns, forever.
+        raise HTTPException(status_code=400, detail="A repeating schedule needs at least one event with a delay_ms")
+
+def _endpoint_urls(new_endpoint: dict) -> dict:
+    endpoint_id = new_endpoint["endpoint_id"]
+    path_suffix = new_endpoint["config"].get('path', '/')
     return {
         "endpoint_id": endpoint_id,
         "base_url": f"{BASE_URL}/{endpoint_id}{format_path(path_suffix)}",
         "usage": f"{BASE_URL}/{endpoint_id}{format_path(path_suffix)}"
     }
+
+async def create_new_mock(payload, user_email: str):
+    new_endpoint = build_endpoint_document(payload, user_email)
+    endpoint_id = new_endpoint["endpoint_id"]
+
+    try:
+        # The same owner overwrites their endpoint; an ID held by someone else is a conflict.
+        await storage.upsert_endpoint(new_endpoint)
+    except DuplicateKey:
+        raise HTTPException(status_code=409, detail=f"Endpoint ID '{endpoint_id}' is already taken by another user.")
+    invalidate_endpoint(endpoint_id)
+    return _endpoint_urls(new_endpoint)
+
+async def create_bulk_mocks(payloads: list, user_email: str, ordered: bool = False) -> dict:
+    """
+    Creates or overwrites many endpoints with a single bulk upsert.
+    Every item gets its own result: created, conflict (ID owned by someone else or
+    repeated in the batch), invalid, or skipped (ordered mode, after the first failure).
+    """
+    if len(payloads) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ITEMS} endpoints per request")
+
+    results = [None] * len(payloads)
+    documents = []  # (payload index, document)
+    seen = set()
+    for index, payload in enumerate(payloads):
+        try:
+            new_endpoint = build_endpoint_document(payload, user_email)
+        except HTTPException as e:
+            results[index] = {"index": index, "status": "invalid", "detail": e.detail}
+            continue
+        if new_endpoint["endpoint_id"] in seen:
+            results[index] = {"index": index, "endpoint_id": new_endpoint["endpoint_id"],
+                              "status": "conflict", "detail": "Endpoint ID repeated in this batch"}
+            continue
+        seen.add(new_endpoint["endpoint_id"])
+        documents.append((index, new_endpoint))
+
+    if ordered and any(results):
+        # Ordered imports are all-or-nothing up to the first bad item, so stop before writing it.
+        first_bad = next(i for i, result in enumerate(results) if result)
+        documents = [(i, doc) for i, doc in documents if i < first_bad]
+
+    write_errors = await storage.bulk_upsert_endpoints([doc for _, doc in documents], ordered=ordered)
+
+    failed_at = min(write_errors) if ordered and write_errors else None
+    for position, (index, new_endpoint) in enumerate(documents):
+        endpoint_id = new_endpoint["endpoint_id"]
+        error = write_errors.get(position)
+        if error is not None:
+            kind, detail = error
+            results[index] = {
+                "index": index,
+                "endpoint_id": endpoint_id,
+                "status": kind,
+                "detail": f"Endpoint ID '{endpoint_id}' is already taken by another user." if kind == "conflict" else detail,
+            }
+        elif failed_at is not None and position > failed_at:
+            results[index] = {"index": index, "endpoint_id": endpoint_id, "status": "skipped"}
+        else:
+            invalidate_endpoint(endpoint_id)
+            results[index] = {"index": index, "status": "created", **_endpoint_urls(new_endpoint)}
+
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {"index": index, "status": "skipped"}
+
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {"counts": counts, "results": results}
@@ -0,0 +1,114 @@
+import os
+from database import storage
+from utils.cache import LRUCache
+from utils.handler import handler_cache, invalidate_handler
+from services.state_service import state_store
+from services.broadcast_service import close_broadcast
+from utils.utils import load_env
+
+load_env()
+
+ENDPOINT_CACHE_SIZE = int(os.getenv("ENDPOINT_CACHE_SIZE", "2048"))
+ENDPOINT_CACHE_TTL = float(os.getenv("ENDPOINT_CACHE_TTL", "30"))
+
+# Only read-only mock types are served from memory. Functional mocks mutate
+# their persisted state on every call, so they are always read from the database.
+# Stream mocks keep their feed's state in memory only, so their definition can be cached.
+CACHEABLE_TYPES = {"static", "mapping", "stream"}
+
+endpoint_cache = LRUCache(maxsize=ENDPOINT_CACHE_SIZE, ttl=ENDPOINT_CACHE_TTL)
+
+# endpoint_id -> (revision, {kind: artifact}). Artifacts derived from a document
+# (compiled routers, prepared bodies, ...) stay valid until the endpoint is saved again,
+# so refetching an unchanged document does not rebuild them.
+compiled_cache = LRUCache(maxsize=ENDPOINT_CACHE_SIZE)
+
+# IDs whose next lookup goes straight to the primary when storage can serve stale reads
+# from replicas: functional mocks, whose state must be current, and endpoints this
+# process just wrote, so a replica that is behind cannot hand back the old version.
+primary_ids = LRUCache(maxsize=ENDPOINT_CACHE_SIZE)
+
+
+def _remember(endpoint_id: str, doc: dict):
+    if doc.get("type") in CACHEABLE_TYPES:
+        endpoint_cache.set(endpoint_id, doc)
+        primary_ids.pop(endpoint_id)
+    else:
+        primary_ids.set(endpoint_id, True)
+
+
+async def get_endpoint(endpoint_id: str):
+    """Returns the endpoint document, serving read-only mocks from the in-process cache."""
+    doc = endpoint_cache.get(endpoint_id)
+    if doc is not None:
+        return doc
+
+    if not storage.stale_reads or primary_ids.get(endpoint_id):
+        doc = await storage.get_endpoint(endpoint_id)
+    else:
+        doc = await storage.get_endpoint(endpoint_id, stale_ok=True)
+        if doc and doc.get("type") not in CACHEABLE_TYPES:
+            doc = await storage.get_endpoint(endpoint_id)
+    if doc:
+        _remember(endpoint_id, doc)
+    return doc
+
+
+async def get_endpoints(endpoint_ids) -> dict:
+    """get_endpoint for many IDs; whatever is not cached is fetched in one storage query."""
+    docs = {}
+    missing = []
+    for endpoint_id in dict.fromkeys(endpoint_ids):
+        doc = endpoint_cache.get(endpoint_id)
+        if doc is not None:
+            docs[endpoint_id] = doc
+        else:
+            missing.append(endpoint_id)
+
+    if missing and storage.stale_reads:
+        stale = [endpoint_id for endpoint_id in missing if not primary_ids.get(endpoint_id)]
+        found = await storage.get_endpoints(stale, stale_ok=True) if stale else {}
+        for endpoint_id, doc in found.items():
+            if doc.get("type") in CACHEABLE_TYPES:
+                _remember(endpoint_id, doc)
+                docs[endpoint_id] = doc
+        missing = [endpoint_id for endpoint_id in missing if endpoint_id not in docs]
+
+    if missing:
+        for endpoint_id, doc in (await storage.get_endpoints(missing)).items():
+            _remember(endpoint_id, doc)
+            docs[endpoint_id] = doc
+    return docs
+
+
+def get_compiled(doc: dict, kind: str, build):
+    """Returns build(doc), memoised per endpoint revision."""
+    # Documents saved before revisions existed are compared whole instead.
+    version = doc.get("revision") or doc
+    entry = compiled_cache.get(doc["endpoint_id"])
+    if entry is None or entry[0] != version:
+        entry = (version, {})
+        compiled_cache.set(doc["endpoint_id"], entry)
+
+    artifacts = entry[1]
+    if kind not in artifacts:
+        artifacts[kind] = build(doc)
+    return artifacts[kind]
+
+
+def invalidate_endpoint(endpoint_id: str):
+    """Drops any cached state for an endpoint after it has been written."""
+    endpoint_cache.pop(endpoint_id)
+    compiled_cache.pop(endpoint_id)
+    invalidate_handler(endpoint_id)
+    state_store.discard(endpoint_id)
+    close_broadcast(endpoint_id)
+    primary_ids.set(endpoint_id, True)
+
+
+def cache_stats() -> dict:
+    return {
+        "endpoints": endpoint_cache.stats(),
+        "handlers": handler_cache.stats(),
+        "state": state_store.stats(),
+    }
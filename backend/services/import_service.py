@@ -0,0 +1,224 @@
+import base64
+import json
+import re
+from urllib.parse import urlsplit
+from fastapi import HTTPException
+from models import CreateUrlRequest, MappingConfig, StaticConfig, RouteMapping
+
+MAX_SCHEMA_DEPTH = 6
+HTTP_METHODS = ("get", "post", "put", "patch", "delete")
+
+
+def _load_document(source, kind: str) -> dict:
+    if isinstance(source, dict):
+        return source
+    try:
+        return json.loads(source)
+    except json.JSONDecodeError:
+        pass
+    # Imported here rather than at module load: it is only needed for YAML specs.
+    try:
+        import yaml
+    except ImportError:  # YAML specs are optional; JSON always works.
+        yaml = None
+    if yaml is None:
+        raise HTTPException(status_code=400, detail=f"{kind} is not valid JSON (install PyYAML to import YAML)")
+    try:
+        document = yaml.safe_load(source)
+    except yaml.YAMLError as e:
+        raise HTTPException(status_code=400, detail=f"{kind} could not be parsed: {e}")
+    if not isinstance(document, dict):
+        raise HTTPException(status_code=400, detail=f"{kind} must be an object")
+    return document
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+
+
+def _template_path(path: str) -> str:
+    """OpenAPI allows any parameter name; the router needs identifiers."""
+    return re.sub(r"\{([^}]+)\}", lambda m: "{" + re.sub(r"\W", "_", m.group(1)) + "}", path)
+
+
+def _resolve_ref(spec: dict, ref: str):
+    node = spec
+    for part in ref.lstrip("#/").split("/"):
+        node = node.get(part.replace("~1", "/").replace("~0", "~"), {}) if isinstance(node, dict) else {}
+    return node
+
+
+def _sample_from_schema(spec: dict, schema: dict, depth: int = 0):
+    if not isinstance(schema, dict) or depth > MAX_SCHEMA_DEPTH:
+        return None
+    if "$ref" in schema:
+        return _sample_from_schema(spec, _resolve_ref(spec, schema["$ref"]), depth + 1)
+    if "example" in schema:
+        return schema["example"]
+    if "default" in schema:
+        return schema["default"]
+    if schema.get("enum"):
+        return schema["enum"][0]
+    if "allOf" in schema:
+        merged = {}
+        for part in schema["allOf"]:
+            sample = _sample_from_schema(spec, part, depth + 1)
+            if isinstance(sample, dict):
+                merged.update(sample)
+        return merged
+    for key in ("oneOf", "anyOf"):
+        if schema.get(key):
+            return _sample_from_schema(spec, schema[key][0], depth + 1)
+
+    schema_type = schema.get("type")
+    if schema_type == "object" or "properties" in schema:
+        return {
+            name: _sample_from_schema(spec, prop, depth + 1)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return [_sample_from_schema(spec, schema.get("items", {}), depth + 1)]
+    if schema_type == "integer":
+        return 0
+    if schema_type == "number":
+        return 0.0
+    if schema_type == "boolean":
+        return True
+    if schema_type == "string":
+        return "2024-01-01T00:00:00Z" if schema.get("format") == "date-time" else "string"
+    return None
+
+
+def _response_example(spec: dict, operation: dict):
+    """Example body of the first 2xx response, from explicit examples or the schema."""
+    responses = operation.get("responses", {})
+    # YAML specs may parse status codes as integers.
+    for code, response in sorted(responses.items(), key=lambda item: str(item[0])):
+        if not str(code).startswith("2"):
+            continue
+        response = response or {}
+        if "$ref" in response:
+            response = _resolve_ref(spec, response["$ref"])
+
+        # OpenAPI 3
+        for media_type, content in response.get("content", {}).items():
+            if "json" not in media_type:
+                continue
+            if "example" in content:
+                return content["example"], True
+            for example in content.get("examples", {}).values():
+                if "$ref" in example:
+                    example = _resolve_ref(spec, example["$ref"])
+                if "value" in example:
+                    return example["value"], True
+            if "schema" in content:
+                return _sample_from_schema(spec, content["schema"]), True
+
+        # Swagger 2
+        examples = response.get("examples", {})
+        if "application/json" in examples:
+            return examples["application/json"], True
+        if "schema" in response:
+            return _sample_from_schema(spec, response["schema"]), True
+    return None, False
+
+
+def _endpoint_request(routes: list, name: str, description: str, custom_id, is_public: bool) -> CreateUrlRequest:
+    """A single dict-valued route becomes a static mock; anything else a mapping."""
+    name = (name or "Imported API")[:50]
+    if len(routes) == 1 and isinstance(routes[0].value, dict) and "{" not in routes[0].path:
+        return CreateUrlRequest(
+            type="static",
+            config=StaticConfig(path=routes[0].path, value=routes[0].value),
+            name=name, description=description, is_public=is_public, custom_id=custom_id,
+        )
+    return CreateUrlRequest(
+        type="mapping",
+        config=MappingConfig(routes=routes),
+        name=name, description=description, is_public=is_public, custom_id=custom_id,
+    )
+
+
+def openapi_to_requests(payload) -> list:
+    """Turns an OpenAPI 3 / Swagger 2 spec into one endpoint with a route per path."""
+    spec = _load_document(payload.spec, "OpenAPI spec")
+    if "paths" not in spec:
+        raise HTTPException(status_code=400, detail="OpenAPI spec has no 'paths'")
+
+    routes = []
+    for path, item in spec["paths"].items():
+        if not isinstance(item, dict):
+            continue
+        # Mapping routes are method-agnostic, so prefer what a GET would return.
+        for method in HTTP_METHODS:
+            if method not in item:
+                continue
+            value, found = _response_example(spec, item[method])
+            if found:
+                routes.append(RouteMapping(path=_template_path(path), value=value))
+                break
+
+    if not routes:
+        raise HTTPException(status_code=400, detail="OpenAPI spec has no JSON responses to mock")
+
+    info = spec.get("info", {})
+    return [_endpoint_request(
+        routes,
+        payload.name or info.get("title"),
+        info.get("description", ""),
+        payload.custom_id,
+        payload.is_public,
+    )]
+
+
+def _har_body(response: dict):
+    content = response.get("content", {})
+    text = content.get("text")
+    if text is None:
+        return None
+    if content.get("encoding") == "base64":
+        try:
+            text = base64.b64decode(text).decode()
+        except (ValueError, UnicodeDecodeError):
+            return None
+    if "json" in content.get("mimeType", ""):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+    return text
+
+
+def har_to_requests(payload) -> list:
+    """Turns a recorded HAR into one endpoint per host, replaying the last response seen per path."""
+    har = _load_document(payload.har, "HAR file")
+    entries = har.get("log", {}).get("entries", [])
+
+    hosts = {}
+    for entry in entries:
+        request, response = entry.get("request", {}), entry.get("response", {})
+        if not 200 <= response.get("status", 0) < 300:
+            continue
+        url = urlsplit(request.get("url", ""))
+        if not url.netloc:
+            continue
+        body = _har_body(response)
+        if body is None:
+            continue
+
+        path = url.path or "/"
+        paths = hosts.setdefault(url.netloc, {})
+        is_get = request.get("method", "GET").upper() == "GET"
+        # GET responses win over other methods for the same path; otherwise the latest one does.
+        if is_get or path not in paths or not paths[path][1]:
+            paths[path] = (body, is_get)
+
+    if not hosts:
+        raise HTTPException(status_code=400, detail="HAR file has no successful responses to mock")
+
+    requests = []
+    for host, paths in hosts.items():
+        routes = [RouteMapping(path=path, value=body) for path, (body, _) in paths.items()]
+        custom_id = f"{payload.id_prefix}-{_slug(host)}" if payload.id_prefix else None
+        requests.append(_endpoint_request(routes, host, f"Recorded from {host}", custom_id, payload.is_public))
+    return requests
@@ -0,0 +1,88 @@
+import math
+import os
+from fastapi import HTTPException, status
+from utils.rate_limit import RateLimiter
+from utils.utils import load_env
+
+load_env()
+
+# Server-wide limits. They are the defaults for every endpoint and the ceilings for an
+# endpoint's own `rate_limit` settings, which can only tighten them. 0 disables a limit.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_ENDPOINT_RPS = float(os.getenv("RATE_LIMIT_ENDPOINT_RPS", "500"))
+RATE_LIMIT_ENDPOINT_BURST = float(os.getenv("RATE_LIMIT_ENDPOINT_BURST", "1000"))
+RATE_LIMIT_OWNER_RPS = float(os.getenv("RATE_LIMIT_OWNER_RPS", "2000"))
+RATE_LIMIT_OWNER_BURST = float(os.getenv("RATE_LIMIT_OWNER_BURST", "4000"))
+RATE_LIMIT_CLIENT_PER_MINUTE = int(os.getenv("RATE_LIMIT_CLIENT_PER_MINUTE", "3000"))
+FUNCTIONAL_MAX_CONCURRENCY = int(os.getenv("FUNCTIONAL_MAX_CONCURRENCY", "32"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Only behind a proxy that sets X-Forwarded-For is the header the client's address;
+# anywhere else it is whatever the client chose to send.
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+
+rate_limiter = RateLimiter(RATE_LIMIT_MAX_KEYS)
+
+
+def _limit(configured, ceiling):
+    if not ceiling:
+        return configured or 0
+    return min(configured, ceiling) if configured else ceiling
+
+
+def _too_many(wait: float, detail: str):
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+def client_address(request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client or "unknown"
+
+
+def admit(doc: dict, request):
+    """Raises 429 with Retry-After if the endpoint, its owner or this client is over its limit."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    endpoint_id = doc["endpoint_id"]
+    config = doc.get("rate_limit") or {}
+    rules = []
+
+    rps = _limit(config.get("requests_per_second"), RATE_LIMIT_ENDPOINT_RPS)
+    if rps:
+        burst = _limit(config.get("burst"), RATE_LIMIT_ENDPOINT_BURST) or rps
+        rules.append(("endpoint", endpoint_id, "bucket", rps, max(1.0, burst)))
+
+    per_minute = _limit(config.get("per_client_per_minute"), RATE_LIMIT_CLIENT_PER_MINUTE)
+    if per_minute:
+        rules.append(("client", (endpoint_id, client_address(request)), "window", per_minute, 60.0))
+
+    owner = doc.get("owner_email")
+    if owner and RATE_LIMIT_OWNER_RPS:
+        rules.append(("owner", owner, "bucket", RATE_LIMIT_OWNER_RPS, max(1.0, RATE_LIMIT_OWNER_BURST)))
+
+    wait = rate_limiter.check(rules)
+    if wait:
+        _too_many(wait, "Rate limit exceeded for this mock.")
+
+
+def enter_functional(doc: dict):
+    """Claims an execution slot for a functional endpoint, or raises 429 when all are busy.
+    Returns the release callback (a no-op when concurrency is uncapped)."""
+    limit = _limit((doc.get("rate_limit") or {}).get("max_concurrency"), FUNCTIONAL_MAX_CONCURRENCY)
+    if not RATE_LIMIT_ENABLED or not limit:
+        return lambda: None
+    endpoint_id = doc["endpoint_id"]
+    if not rate_limiter.enter(endpoint_id, limit):
+        # Calls queue on the endpoint's state lock; rather than join a full queue, fail fast.
+        _too_many(1, "Too many concurrent calls to this mock.")
+    return lambda: rate_limiter.leave(endpoint_id)
+
+
+def rate_limit_stats() -> dict:
+    return rate_limiter.stats()
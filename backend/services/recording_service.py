@@ -0,0 +1,165 @@
+import asyncio
+import base64
+import os
+import time
+from collections import deque
+from fastapi import HTTPException
+from database import storage
+from storage.base import InvalidCursor
+from utils.utils import load_env
+
+load_env()
+
+# Capture only happens for endpoints created with `record_requests`; this turns it off server-wide.
+RECORDING_ENABLED = os.getenv("RECORDING_ENABLED", "1") == "1"
+# Records waiting to be written. When the queue is full, new records are dropped.
+RECORDING_QUEUE_SIZE = int(os.getenv("RECORDING_QUEUE_SIZE", "10000"))
+RECORDING_BATCH_SIZE = int(os.getenv("RECORDING_BATCH_SIZE", "500"))
+RECORDING_FLUSH_INTERVAL = float(os.getenv("RECORDING_FLUSH_INTERVAL", "1.0"))
+# Request bodies are kept up to this many bytes.
+RECORDING_MAX_BODY = int(os.getenv("RECORDING_MAX_BODY", "65536"))
+# Header values replaced with "[redacted]" before a record is queued.
+RECORDING_REDACT_HEADERS = {
+    name.strip().lower()
+    for name in os.getenv("RECORDING_REDACT_HEADERS", "authorization,cookie,proxy-authorization,x-api-key").split(",")
+    if name.strip()
+}
+
+MAX_PAGE_SIZE = 1000
+
+
+def _headers(headers) -> dict:
+    return {
+        key: "[redacted]" if key.lower() in RECORDING_REDACT_HEADERS else value
+        for key, value in headers.items()
+    }
+
+
+def _body(raw: bytes) -> dict:
+    fields = {}
+    if len(raw) > RECORDING_MAX_BODY:
+        raw = raw[:RECORDING_MAX_BODY]
+        fields["body_truncated"] = True
+    try:
+        fields["body"] = raw.decode()
+    except UnicodeDecodeError:
+        fields["body"] = base64.b64encode(raw).decode()
+        fields["body_encoding"] = "base64"
+    return fields
+
+
+class RequestRecorder:
+    """Queues recorded mock requests in memory and writes them to storage in batches.
+
+    Capturing a request never waits on storage: the record is appended to a bounded
+    queue, and a background task inserts queued records every RECORDING_FLUSH_INTERVAL
+    seconds, or sooner once RECORDING_BATCH_SIZE are waiting. A full queue, or a batch
+    whose insert fails, is dropped and counted rather than retried.
+    """
+
+    def __init__(self, queue_size: int = RECORDING_QUEUE_SIZE, batch_size: int = RECORDING_BATCH_SIZE):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._queue = deque()
+        self._wakeup = None
+        self._flusher = None
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    async def capture(self, endpoint_id: str, request, path: str, query: str, status: int, latency: float):
+        """Records one served request. request is the MockRequest it was served from."""
+        try:
+            if len(self._queue) >= self.queue_size:
+                self.dropped += 1
+                return
+            record = {
+                "endpoint_id": endpoint_id,
+                "timestamp": time.time(),
+                "method": request.method,
+                "path": path,
+                "query": query,
+                "headers": _headers(request.headers),
+                **_body(await request.raw_body()),
+                "client": request.client,
+                "status": status,
+                "latency_ms": round(latency * 1000, 3),
+            }
+            self._queue.append(record)
+            self.recorded += 1
+            self._ensure_flusher()
+            if len(self._queue) >= self.batch_size:
+                self._wakeup.set()
+        except Exception as e:
+            # Capture is best effort; it must never fail the request it describes.
+            print("RECORDING::CAPTURE_FAIL", e)
+
+    async def flush(self):
+        """Writes everything queued so far, one batch at a time."""
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                await storage.insert_recordings(batch)
+                self.flushes += 1
+                self.written += len(batch)
+            except Exception as e:
+                print("RECORDING::FLUSH_FAIL", e)
+                self.failed += len(batch)
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=RECORDING_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def stop(self):
+        """Cancels the background flusher and writes whatever is still queued."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+
+recorder = RequestRecorder()
+
+
+def recording(doc: dict) -> bool:
+    return RECORDING_ENABLED and bool(doc.get("record_requests"))
+
+
+async def list_recordings(endpoint_id: str, user_email: str, since: float = None, limit: int = 500, cursor: str = None):
+    """One page of an endpoint's recorded requests, oldest first. Only its owner may read them."""
+    endpoint_id = endpoint_id.strip("/")
+    doc = await storage.get_endpoint(endpoint_id)
+    if not doc or doc.get("owner_email") != user_email:
+        raise HTTPException(status_code=404, detail="Endpoint not found")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        items, next_cursor = await storage.list_recordings(endpoint_id, since, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
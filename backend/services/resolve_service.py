@@ -1,105 +1,346 @@
+import copy
+import inspect
 import os
-import json
-import ast
+from functools import partial
+import anyio.from_thread
+import anyio.to_thread
 from fastapi import HTTPException, status
-from database import endpoint_collection as collection
-from utils.utils import format_path
-from dotenv import load_dotenv
+from services.endpoint_cache import get_endpoint, get_compiled
+from services.state_service import state_store
+from services.rate_limit_service import admit, enter_functional
+from services.recording_service import recording
+from services.broadcast_service import BROADCAST_WORKERS, handler_events, scripted_events, subscribe
+from utils.utils import format_path, is_serverless, load_env
+from utils.handler import load_handler
+from utils.router import build_router, render_value
+from utils.sandbox import SandboxPool, SandboxStream, SandboxBusy, SandboxError, SandboxTimeout
+from utils.state import LazyState
+from utils.broadcast import BroadcastResponse
+from utils.streaming import STREAM_BATCH_SIZE, MockStreamResponse, choose_format, is_stream
+from utils.http_cache import conditional_response, prepare_body, serialize, templated_etag
+from utils.request import MockRequest
+from utils.metrics import NULL_TIMER
 
-load_dotenv()
+load_env()
 BASE_URL = os.getenv("BASE_URL")
 
-async def resolve_mock_response(endpoint_id: str, rest_of_path: str, request_meta: dict):
-    doc = await collection.find_one({"endpoint_id": endpoint_id})
+# "process" runs handlers in a pool of warm worker processes with time and memory
+# limits; "inline" runs them on the event loop (used on serverless platforms).
+SANDBOX_MODE = os.getenv("SANDBOX_MODE", "inline" if is_serverless() else "process")
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", str(os.cpu_count() or 1)))
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "5"))
+SANDBOX_CPU_TIMEOUT = float(os.getenv("SANDBOX_CPU_TIMEOUT", str(SANDBOX_TIMEOUT)))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "512"))
+# How long a call waits for a free worker before it gets 503.
+SANDBOX_ACQUIRE_TIMEOUT = float(os.getenv("SANDBOX_ACQUIRE_TIMEOUT", str(SANDBOX_TIMEOUT)))
+# How long a call waits for the calls queued ahead of it on the endpoint's state before it gets 503.
+STATE_LOCK_TIMEOUT = float(os.getenv("STATE_LOCK_TIMEOUT", str(SANDBOX_TIMEOUT)))
+
+sandbox_pool = None
+# Stream mock handlers run in a pool of their own, which never waits for a free worker.
+stream_pool = None
+if SANDBOX_MODE == "process":
+    sandbox_pool = SandboxPool(SANDBOX_WORKERS, SANDBOX_TIMEOUT, SANDBOX_CPU_TIMEOUT, SANDBOX_MEMORY_MB, SANDBOX_ACQUIRE_TIMEOUT)
+    stream_pool = SandboxPool(BROADCAST_WORKERS, SANDBOX_TIMEOUT, SANDBOX_CPU_TIMEOUT, SANDBOX_MEMORY_MB, 0)
+
+async def resolve_mock_response(endpoint_id: str, rest_of_path: str, request: MockRequest, doc: dict = None):
+    """doc: the endpoint document, when the caller has already looked it up (batches)."""
+    timer = request.timer
+    if doc is None:
+        doc = await get_endpoint(endpoint_id)
+        timer.mark("lookup")
     if not doc:
         raise HTTPException(status_code=404, detail="Mock not found")
 
     mock_type = doc["type"]
+    timer.identify(endpoint_id, mock_type)
+    # Before admission, so recordings also show the requests that were turned away.
+    request.record = recording(doc)
+    admit(doc, request)
     config = doc["config"]
     request_path = format_path(rest_of_path)
 
     if mock_type == "static":
         target = format_path(config.get("path", "/"))
         if target == request_path or target == "/":
-            return config.get("value")
+            prepared = get_compiled(doc, "body", lambda d: prepare_body(d["config"].get("value")))
+            timer.mark("compile")
+            return await conditional_response(
+                request, prepared.etag, lambda: prepared.body, config.get("cache_control"), prepared.variants
+            )
             
     elif mock_type == "mapping":
-        for route in config.get("routes", []):
-            if format_path(route["path"]) == request_path:
-                return route["value"]
+        router = get_compiled(doc, "router", lambda d: build_router(d["config"].get("routes", [])))
+        timer.mark("compile")
+        matched = router.match(request_path)
+        if matched:
+            route, params = matched
+            response = await _route_response(doc, route, params, request)
+            timer.mark("execute")
+            return response
 
     elif mock_type == "functional":
         full_url = f"{BASE_URL}/{endpoint_id}{request_path}"
-        data = config.get("data", {})
-        
-        result = execute_functional_code(
-            config.get("code", ""),
-            data,
-            full_url,
-            request_meta
-        )
-        
-        await collection.update_one(
-            {"endpoint_id": endpoint_id},
-            {"$set": {"config.data": data}}
-        )
-        
-        return result
+        return await run_functional_mock(doc, full_url, request)
 
     elif mock_type == "post_mock":
         expected_method = config.get("method", "POST")
-        if request_meta.get("method") != expected_method:
+        if request.method != expected_method:
             raise HTTPException(status_code=405, detail=f"Method Not Allowed: This mock is for {expected_method} requests only")
 
         full_url = f"{BASE_URL}/{endpoint_id}{request_path}"
-        data = config.get("data", {})
-        
-        result = execute_functional_code(
-            config.get("code", ""),
-            data,
-            full_url,
-            request_meta
-        )
-        
-        await collection.update_one(
-            {"endpoint_id": endpoint_id},
-            {"$set": {"config.data": data}}
-        )
-        
-        return result
+        return await run_functional_mock(doc, full_url, request)
+
+    elif mock_type == "stream":
+        if _stream_matches(config, request_path):
+            fmt = choose_format(config.get("stream"), request.headers.get("accept", ""))
+            broadcast, subscriber = await subscribe_stream(doc, fmt)
+            timer.mark("execute")
+
+            def on_close():
+                broadcast.unsubscribe(subscriber)
+                timer.record(200)
+
+            return BroadcastResponse(subscriber, on_close)
 
     raise HTTPException(status_code=404, detail="Route matching failed")
 
 
-def execute_functional_code(code: str, data: dict, url: str, request_meta: dict):
+async def resolve_stream_websocket(endpoint_id: str, rest_of_path: str, request: MockRequest) -> tuple:
+    """resolve_mock_response for a WebSocket client, which only stream mocks accept.
+    Returns (broadcast, subscriber); the caller unsubscribes once the socket closes."""
+    doc = await get_endpoint(endpoint_id)
+    request.timer.mark("lookup")
+    if not doc or doc["type"] != "stream":
+        raise HTTPException(status_code=404, detail="Mock not found")
+    request.timer.identify(endpoint_id, "stream")
+    request.record = recording(doc)
+    admit(doc, request)
+    if not _stream_matches(doc["config"], format_path(rest_of_path)):
+        raise HTTPException(status_code=404, detail="Route matching failed")
+    return await subscribe_stream(doc, "ws")
+
+
+def _stream_matches(config: dict, request_path: str) -> bool:
+    target = format_path(config.get("path", "/"))
+    return target == request_path or target == "/"
+
+
+async def subscribe_stream(doc: dict, fmt: str) -> tuple:
+    """Joins a stream mock's feed in this process, starting it if nobody is subscribed yet."""
+    return await subscribe(doc, fmt, partial(open_stream_events, doc))
+
+
+async def _no_state(*_):
+    raise LookupError("A stream handler's data is sent whole")
+
+
+async def open_stream_events(doc: dict):
+    """Starts a stream mock's producer: its scripted schedule, or its generator handler
+    called once for the whole feed, in-process or in a sandbox worker."""
+    config = doc["config"]
+    if config.get("events"):
+        return scripted_events(config["events"], config.get("repeat"))
+
+    endpoint_id = doc["endpoint_id"]
+    code = config.get("code", "")
+    url = f"{BASE_URL}/{endpoint_id}{format_path(config.get('path', '/'))}"
+    # Every subscriber shares one call, so there are no request headers or body, and
+    # `data` is a scratch copy of config.data that lives as long as the feed.
+    data = copy.deepcopy(config.get("data") or {})
+    if sandbox_pool is None:
+        try:
+            result = load_handler(endpoint_id, code)(url, {}, None, data)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Functional Error: {str(e)}")
+    else:
+        state = (_no_state, _no_state, (data, list(data)))
+        result, _, _ = await execute_in_sandbox(endpoint_id, code, state, url, {}, None, stream_pool)
+
+    if not (is_stream(result) or isinstance(result, SandboxStream)):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Functional Error: a stream mock's handler must be a generator")
+    # A paced feed pulls one item per tick, so each event is computed when it is published.
+    return handler_events(result, 1 if config.get("interval_ms") else STREAM_BATCH_SIZE)
+
+
+async def _route_response(doc: dict, route: dict, params: dict, request: MockRequest):
+    # Each route's template is serialised once per document. Routes without parameters
+    # send those bytes as is; the others only render when the client's copy is stale.
+    templates = get_compiled(doc, "route_bodies", lambda d: {})
+    template = templates.get(id(route))
+    if template is None:
+        template = templates[id(route)] = prepare_body(route["value"])
+
+    cache_control = doc["config"].get("cache_control")
+    if not params:
+        return await conditional_response(request, template.etag, lambda: template.body, cache_control, template.variants)
+    return await conditional_response(
+        request,
+        templated_etag(template, params),
+        lambda: serialize(render_value(route["value"], params)),
+        cache_control,
+    )
 
-    local_vars = {}
+
+async def _lock_state(lock):
+    with anyio.move_on_after(STATE_LOCK_TIMEOUT) as waited:
+        await lock.acquire()
+    if waited.cancelled_caught:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Functional Busy: the endpoint's state stayed locked for {STATE_LOCK_TIMEOUT}s",
+            headers={"Retry-After": "1"})
+
+
+async def run_functional_mock(doc: dict, url: str, request: MockRequest):
+    """Runs the endpoint handler against its state, one invocation per endpoint at a time.
+    A generator handler only holds the endpoint lock until it is created; the stream keeps
+    the execution slot, and its state changes are applied when it ends."""
+    endpoint_id = doc["endpoint_id"]
+    code = doc["config"].get("code", "")
+    timer = request.timer
+    headers = request.header_dict()
+    body = await request.body()
+    timer.mark("body")
+
+    leave = enter_functional(doc)
+    streaming = False
+    try:
+        lock = state_store.lock(doc)
+        await _lock_state(lock)
+    except BaseException:
+        leave()
+        raise
     try:
-        body = request_meta.get("body")
-        if isinstance(body, str) and (body.strip().startswith("{") or body.strip().startswith("[")):
+        timer.mark("lock")
+        entry = await state_store.open(doc)
+        data = None
+        if sandbox_pool is None:
+            # Unless all of the state is in memory, the handler runs on a worker thread, from
+            # where a key that is not loaded yet is fetched by blocking on the event loop.
+            data = LazyState(
+                partial(anyio.from_thread.run, state_store.fetch, entry),
+                partial(anyio.from_thread.run, state_store.list_keys, entry),
+                entry,
+            )
             try:
-                body = json.loads(body)
-            except json.JSONDecodeError:
-                try:
-                    body = ast.literal_eval(body)
-                except:
-                    pass # Keep as string if all fails
-
-        execution_env = {"true": True, "false": False, "null": None}
-        
-        exec(code, execution_env)
-        
-        handler = execution_env.get("handler")
-        if not handler:
-            raise ValueError("No function named 'handler' found in code.")
-        result = handler(
-            url, 
-            request_meta.get("headers"), 
-            body, 
-            data)
+                result, data = await execute_functional_code(endpoint_id, code, data, url, headers, body, timer)
+            except HTTPException:
+                state_store.rollback(endpoint_id, data)
+                raise
+        else:
+            state = (partial(state_store.fetch, entry), partial(state_store.list_keys, entry), state_store.preloaded(entry))
+            result, changes, (compile_seconds, execute_seconds) = await execute_in_sandbox(endpoint_id, code, state, url, headers, body)
+            timer.add("compile", compile_seconds)
+            timer.add("execute", execute_seconds)
+            # What is left of the round trip is pickling, the pipe, state requests and waiting for a free worker.
+            timer.mark("sandbox", excluding=compile_seconds + execute_seconds)
+
+        if is_stream(result) or isinstance(result, SandboxStream):
+            streaming = True
+            return _stream_response(doc, request, result, lock, leave, entry, data)
+
+        if data is not None:
+            state_store.track(entry, data)
+        else:
+            state_store.apply(entry, *changes)
+        await state_store.commit(endpoint_id)
+        timer.mark("persist")
         return result
+    finally:
+        lock.release()
+        if not streaming:
+            leave()
+
+
+def _stream_response(doc: dict, request: MockRequest, source, lock, leave, entry, data) -> MockStreamResponse:
+    """Wraps a generator handler's output; the response takes over the execution slot.
+    data is the LazyState the handler got when it ran in-process."""
+    endpoint_id = doc["endpoint_id"]
+    fmt = choose_format(doc["config"].get("stream"), request.headers.get("accept", ""))
+
+    async def on_close(failed: bool):
+        try:
+            async with lock:
+                if isinstance(source, SandboxStream):
+                    # The worker's changes come back once the generator ends or is closed.
+                    if source.changes is None:
+                        return
+                    state_store.apply(entry, *source.changes)
+                elif data.cache is not entry:
+                    # The handler streamed from its own snapshot of the state.
+                    if failed:
+                        return
+                    state_store.apply(entry, *data.changes())
+                elif failed:
+                    state_store.rollback(endpoint_id, data)
+                    return
+                else:
+                    state_store.track(entry, data)
+                await state_store.commit(endpoint_id)
+        except Exception as e:
+            print("STREAM::COMMIT_FAIL", e)
+        finally:
+            leave()
+
+    return MockStreamResponse(source, fmt, on_close, request.timer)
+
+
+def _call_handler(handler, url: str, headers: dict, body, data: LazyState):
+    result = handler(url, headers, body, data)
+    if result is data:
+        return data.to_dict()
+    if is_stream(result):
+        # The stream is consumed on the event loop, which cannot wait for a key to be fetched.
+        data.load_all()
+    return result
+
+
+async def execute_functional_code(endpoint_id: str, code: str, data: LazyState, url: str, headers: dict, body, timer=NULL_TIMER):
+    """Returns (result, the LazyState the handler was given)."""
+    try:
+        handler = load_handler(endpoint_id, code)
+        timer.mark("compile")
+        if inspect.isgeneratorfunction(handler) or inspect.isasyncgenfunction(handler):
+            # Calling it only creates the generator; its body runs on the event loop as the
+            # stream is consumed, after the endpoint lock is released. So it gets a loaded
+            # copy of the state rather than a view other calls change underneath it.
+            await state_store.load_all(data.cache)
+            data = state_store.snapshot(data.cache)
+            result = handler(url, headers, body, data)
+        elif state_store.resident(data.cache):
+            # Nothing left to fetch, so the thread hop can be skipped.
+            result = _call_handler(handler, url, headers, body, data)
+        else:
+            result = await anyio.to_thread.run_sync(_call_handler, handler, url, headers, body, data)
+        timer.mark("execute")
+        return result, data
 
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Functional Error: {str(e)}")
\ No newline at end of file
+            detail=f"Functional Error: {str(e)}")
+
+
+async def execute_in_sandbox(endpoint_id: str, code: str, state: tuple, url: str, headers: dict, body, pool: SandboxPool = None):
+    """Runs the handler in the worker pool (sandbox_pool unless pool is given) and returns
+    (result, state changes, worker timings)."""
+    try:
+        return await (pool or sandbox_pool).run(endpoint_id, code, url, headers, body, state)
+    except SandboxTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Functional Timeout: {str(e)}")
+    except SandboxBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Functional Busy: {str(e)}",
+            headers={"Retry-After": "1"})
+    except SandboxError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Functional Error: {str(e)}")
@@ -0,0 +1,347 @@
+import asyncio
+import copy
+import os
+import time
+from database import storage
+from utils.state import LazyState, StateCache, changes_in_place
+from utils.utils import is_serverless, load_env
+
+load_env()
+
+# "write_behind": state changes are applied in memory and flushed to storage in batches.
+# "write_through": every invocation awaits its own write (the only safe mode on serverless).
+STATE_DURABILITY = os.getenv("STATE_DURABILITY", "write_through" if is_serverless() else "write_behind")
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "1.0"))
+STATE_FLUSH_THRESHOLD = int(os.getenv("STATE_FLUSH_THRESHOLD", "100"))
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "4096"))
+# Clean in-memory state older than this is fetched from storage again, which bounds
+# how long workers can diverge from each other.
+STATE_TTL = float(os.getenv("STATE_TTL", "30"))
+# State with at most this many keys is loaded whole when first used, so handlers never
+# wait for a key; larger state is fetched key by key as handlers read it.
+STATE_PRELOAD_KEYS = int(os.getenv("STATE_PRELOAD_KEYS", "256"))
+
+_MISSING = object()
+
+
+def _doc_version(doc: dict) -> tuple:
+    # An endpoint overwritten in place keeps its endpoint_id but gets a new revision,
+    # and with it a fresh set of state keys.
+    return (doc["endpoint_id"], doc.get("revision"))
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _all_loaded(*_):
+    raise LookupError("A state snapshot is loaded whole")
+
+
+def _copy(value):
+    return copy.deepcopy(value) if changes_in_place(value) else value
+
+
+class _StateEntry(StateCache):
+    __slots__ = ("version", "stored", "dirty", "lock", "loaded_at", "seeded")
+
+    def __init__(self, version: tuple):
+        super().__init__()
+        self.version = version
+        # key -> the value as last read from or written to storage, to diff against.
+        self.stored = {}
+        self.dirty = set()
+        self.lock = asyncio.Lock()
+        self.loaded_at = time.monotonic()
+        self.seeded = False
+
+    def forget(self):
+        super().forget()
+        self.stored = {}
+        self.loaded_at = time.monotonic()
+
+
+class StateStore:
+    """Holds functional mock state in memory, key by key, and persists the keys handlers
+    change per the configured durability mode.
+
+    State lives in storage as one record per key, apart from the endpoint document.
+    A handler's `data` is a LazyState over the endpoint's entry here, so a call only
+    fetches the keys it reads and only the keys it changed are written back.
+    """
+
+    def __init__(self, durability: str = STATE_DURABILITY):
+        if durability not in ("write_behind", "write_through"):
+            raise ValueError(f"Unknown STATE_DURABILITY '{durability}'")
+        self.durability = durability
+        self._entries = {}
+        self._dirty = set()
+        self._wakeup = None
+        self._flusher = None
+        self.flushes = 0
+        self.writes = 0
+        self.fetches = 0
+        self.keys_fetched = 0
+
+    def _entry(self, doc: dict) -> _StateEntry:
+        endpoint_id = doc["endpoint_id"]
+        entry = self._entries.get(endpoint_id)
+        if entry is not None and entry.version != _doc_version(doc):
+            # The endpoint was replaced by another worker; its old state no longer applies.
+            self._dirty.discard(endpoint_id)
+            entry = None
+
+        if entry is None:
+            entry = _StateEntry(_doc_version(doc))
+            self._entries[endpoint_id] = entry
+            self._evict()
+        return entry
+
+    def lock(self, doc: dict) -> asyncio.Lock:
+        """Per-endpoint lock that serialises handler invocations sharing the same state."""
+        return self._entry(doc).lock
+
+    async def open(self, doc: dict) -> _StateEntry:
+        """The endpoint's state entry, ready for a handler call. Call while holding lock(doc).
+
+        The first time a revision is used, its initial `config.data` (or the state an older
+        version kept in the endpoint document) is copied into the key store."""
+        entry = self._entry(doc)
+        if not entry.seeded:
+            # Documents saved before state moved out of them have neither field, and still
+            # hold their state in `config.data`.
+            if doc.get("state_revision", _MISSING) != doc.get("revision"):
+                await storage.seed_state(*entry.version, doc["config"].get("data") or {})
+            entry.seeded = True
+        elif doc["endpoint_id"] not in self._dirty and time.monotonic() - entry.loaded_at > STATE_TTL:
+            entry.forget()
+        if entry.names is None:
+            names = await self.list_keys(entry)
+            if len(names) <= STATE_PRELOAD_KEYS:
+                await self.fetch(entry, names)
+        return entry
+
+    def resident(self, entry: _StateEntry) -> bool:
+        """True when every key is in memory, so a handler will not need to fetch any."""
+        return entry.names is not None and len(entry.values) == len(entry.names)
+
+    def preloaded(self, entry: _StateEntry):
+        """(values, names) to send along with an out-of-process call when the whole state
+        is small and in memory, otherwise None and the worker asks for keys as it goes."""
+        if self.resident(entry) and len(entry.names) <= STATE_PRELOAD_KEYS:
+            return entry.values, list(entry.names)
+        return None
+
+    async def fetch(self, entry: _StateEntry, keys: list) -> dict:
+        """The stored values of those keys that exist, loading them into the entry first."""
+        wanted = [key for key in keys if key not in entry.values and key not in entry.missing]
+        if wanted:
+            self.fetches += 1
+            self.keys_fetched += len(wanted)
+            found = await storage.get_state(*entry.version, wanted)
+            for key in wanted:
+                if key in found:
+                    # Another call may have written the key while this fetch was in flight.
+                    if key not in entry.values and key not in entry.missing:
+                        entry.values[key] = found[key]
+                        entry.stored[key] = _copy(found[key])
+                else:
+                    entry.missing.add(key)
+        return {key: entry.values[key] for key in keys if key in entry.values}
+
+    async def list_keys(self, entry: _StateEntry) -> list:
+        if entry.names is None:
+            self.fetches += 1
+            entry.names = (set(await storage.get_state_keys(*entry.version)) | set(entry.values)) - entry.missing
+        return list(entry.names)
+
+    async def load_all(self, entry: _StateEntry):
+        await self.fetch(entry, await self.list_keys(entry))
+
+    def snapshot(self, entry: _StateEntry) -> LazyState:
+        """A private copy of the whole state (load_all the entry first) for a streaming handler,
+        which keeps running after the endpoint lock is released. Its changes() are applied
+        once the stream ends, like those of a sandbox worker."""
+        cache = StateCache()
+        cache.values = copy.deepcopy(entry.values)
+        cache.missing = set(entry.missing)
+        cache.names = set(entry.names)
+        return LazyState(_all_loaded, _all_loaded, cache)
+
+    def apply(self, entry: _StateEntry, values: dict, deleted: list):
+        """Applies the changes an out-of-process handler made to its copy of the state."""
+        entry.values.update(values)
+        entry.missing.difference_update(values)
+        for key in deleted:
+            entry.values.pop(key, None)
+            entry.missing.add(key)
+        if entry.names is not None:
+            entry.names.update(values)
+            entry.names.difference_update(deleted)
+        entry.dirty.update(values)
+        entry.dirty.update(deleted)
+
+    def track(self, entry: _StateEntry, state: LazyState):
+        """Records the keys a handler changed, or may have changed in place, through state."""
+        entry.dirty |= state.written | state.exposed
+
+    async def commit(self, endpoint_id: str):
+        """Persists, or schedules the persisting of, the entry's changed keys."""
+        entry = self._entries.get(endpoint_id)
+        if entry is None or not entry.dirty:
+            return
+
+        if self.durability == "write_through":
+            write = self._diff(entry)
+            if write is None:
+                return
+            try:
+                await storage.write_state([write[0]])
+            except Exception:
+                entry.dirty.update(write[1])
+                raise
+            self._written(entry, write)
+            return
+
+        self._dirty.add(endpoint_id)
+        self._ensure_flusher()
+        if len(self._dirty) >= STATE_FLUSH_THRESHOLD:
+            self._wakeup.set()
+
+    def rollback(self, endpoint_id: str, state: LazyState):
+        """Forgets clean keys that a failed handler may have partially mutated."""
+        entry = self._entries.get(endpoint_id)
+        if entry is None:
+            return
+        for key in (state.written | state.exposed) - entry.dirty:
+            entry.values.pop(key, None)
+            entry.stored.pop(key, None)
+            entry.missing.discard(key)
+            entry.names = None
+
+    def discard(self, endpoint_id: str):
+        self._entries.pop(endpoint_id, None)
+        self._dirty.discard(endpoint_id)
+
+    def _diff(self, entry: _StateEntry):
+        """Takes the entry's dirty keys and returns ((endpoint_id, revision, sets, incs,
+        deletes), snapshot), or None if none of them differs from storage. An integer that
+        changed from an integer is written as an increment, so counters bumped by
+        concurrent workers add up; everything else, floats included, is set outright."""
+        dirty, entry.dirty = entry.dirty, set()
+        sets, incs, deletes, snapshot = {}, {}, [], {}
+        for key in dirty:
+            stored = entry.stored.get(key, _MISSING)
+            if key not in entry.values:
+                if stored is not _MISSING:
+                    deletes.append(key)
+                    snapshot[key] = _MISSING
+                continue
+            value = entry.values[key]
+            if stored is not _MISSING and stored == value and type(stored) is type(value):
+                continue
+            # Snapshot, since handlers keep mutating live values while the write is in flight.
+            snapshot[key] = _copy(value)
+            if _is_int(value) and _is_int(stored):
+                incs[key] = value - stored
+            else:
+                sets[key] = snapshot[key]
+        if not snapshot:
+            return None
+        return (*entry.version, sets, incs, deletes), snapshot
+
+    def _written(self, entry: _StateEntry, write: tuple):
+        _, snapshot = write
+        for key, value in snapshot.items():
+            if value is _MISSING:
+                entry.stored.pop(key, None)
+            else:
+                entry.stored[key] = value
+        entry.loaded_at = time.monotonic()
+        self.writes += len(snapshot)
+
+    async def flush(self):
+        """Writes the changed keys of every dirty endpoint in a single batch."""
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        writes = []
+        for endpoint_id in dirty:
+            entry = self._entries.get(endpoint_id)
+            if entry is None:
+                continue
+            write = self._diff(entry)
+            if write is not None:
+                writes.append((entry, write))
+
+        if not writes:
+            return
+        try:
+            await storage.write_state([write[0] for _, write in writes])
+            self.flushes += 1
+            for entry, write in writes:
+                self._written(entry, write)
+        except Exception as e:
+            print("STATE::FLUSH_FAIL", e)
+            for entry, (_, snapshot) in writes:
+                if self._entries.get(entry.version[0]) is entry:
+                    entry.dirty.update(snapshot)
+                    self._dirty.add(entry.version[0])
+            raise
+
+    def _evict(self):
+        if len(self._entries) <= STATE_CACHE_SIZE:
+            return
+        for endpoint_id in list(self._entries):
+            if len(self._entries) <= STATE_CACHE_SIZE:
+                break
+            entry = self._entries[endpoint_id]
+            if endpoint_id not in self._dirty and not entry.dirty and not entry.lock.locked():
+                del self._entries[endpoint_id]
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=STATE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(STATE_FLUSH_INTERVAL)
+
+    async def start(self):
+        if self.durability == "write_behind":
+            self._ensure_flusher()
+
+    async def stop(self):
+        """Cancels the background flusher and flushes whatever is still pending."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "durability": self.durability,
+            "endpoints": len(self._entries),
+            "dirty": len(self._dirty),
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "fetches": self.fetches,
+            "keys_fetched": self.keys_fetched,
+        }
+
+
+state_store = StateStore()
@@ -0,0 +1,126 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+# Fields needed to render a listing; handler code, static values and state stay out of it.
+SUMMARY_FIELDS = (
+    "endpoint_id",
+    "type",
+    "name",
+    "description",
+    "is_public",
+    "owner_email",
+    "config.path",
+    "config.method",
+)
+
+
+class DuplicateKey(Exception):
+    """An endpoint ID held by another owner, or an email that is already registered."""
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor this engine did not issue."""
+
+
+class Storage(ABC):
+    """Persistence for endpoints, their functional state and users. Every engine returns
+    documents shaped like the Mongo ones: an `_id` and the endpoint `revision`. Functional
+    state is kept per key, scoped by endpoint and revision, outside the endpoint document."""
+
+    name = "base"
+    # True when get_endpoint(stale_ok=True) may read from somewhere other than the primary.
+    stale_reads = False
+
+    async def startup(self):
+        """Called once from the app lifespan before the first request."""
+
+    async def close(self):
+        """Called once on shutdown, after the state store has flushed."""
+
+    # --- Endpoints ---
+
+    @abstractmethod
+    async def get_endpoint(self, endpoint_id: str, stale_ok: bool = False) -> Optional[dict]:
+        """stale_ok: the caller can use a slightly outdated copy (engines with replicas may
+        read it from a secondary). Anything that reads or writes functional state must not."""
+
+    @abstractmethod
+    async def get_endpoints(self, endpoint_ids: List[str], stale_ok: bool = False) -> Dict[str, dict]:
+        """The endpoints that exist among endpoint_ids, keyed by ID, in one round trip."""
+
+    @abstractmethod
+    async def get_visible_endpoint(self, endpoint_id: str, user_email: str = None) -> Optional[dict]:
+        """The endpoint without its `_id`, if it is public or owned by user_email."""
+
+    @abstractmethod
+    async def list_endpoints(self, user_email: str = None, limit: int = 50, cursor: str = None, owned_only: bool = False) -> Tuple[List[dict], Optional[str]]:
+        """One page of endpoint summaries visible to user_email, or with owned_only only those
+        user_email owns, ordered by `_id`.
+        Returns (items, next_cursor); next_cursor is None on the last page. Listings
+        tolerate stale reads, like get_endpoint(stale_ok=True)."""
+
+    @abstractmethod
+    async def upsert_endpoint(self, doc: dict):
+        """Creates the endpoint or replaces the owner's previous definition.
+        Raises DuplicateKey if another owner holds the endpoint ID."""
+
+    @abstractmethod
+    async def bulk_upsert_endpoints(self, docs: List[dict], ordered: bool = False) -> Dict[int, Tuple[str, str]]:
+        """upsert_endpoint for many documents in one round trip.
+        Returns {position: ("conflict" | "error", detail)} for the documents that failed;
+        in ordered mode nothing after the first failure is written."""
+
+    # --- Functional state ---
+
+    @abstractmethod
+    async def seed_state(self, endpoint_id: str, revision: str, data: dict):
+        """Copies data (the endpoint's `config.data`) into the state keys of this revision,
+        keeping keys that already exist, and drops the state of every other revision. Then
+        marks the endpoint document with `state_revision` and empties its `config.data`."""
+
+    @abstractmethod
+    async def get_state(self, endpoint_id: str, revision: str, keys: List) -> dict:
+        """{key: value} for those of keys that exist, in one round trip."""
+
+    @abstractmethod
+    async def get_state_keys(self, endpoint_id: str, revision: str) -> List:
+        ...
+
+    @abstractmethod
+    async def write_state(self, writes: List[Tuple]):
+        """Applies (endpoint_id, revision, sets, incs, deletes) changes in one round trip:
+        sets {key: value} replaces values, incs {key: number} adds to them and deletes
+        [key, ...] removes keys."""
+
+    # --- Users ---
+
+    @abstractmethod
+    async def get_user(self, email: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def insert_user(self, user: dict):
+        """Stores a new user and returns its `_id`. Raises DuplicateKey if the email is taken."""
+
+    @abstractmethod
+    async def update_user(self, user_id, fields: dict, expected: dict = None) -> bool:
+        """Sets fields. With `expected`, only if every expected field still has that value
+        (compare-and-set); returns whether the user was updated."""
+
+    @abstractmethod
+    async def increment_user(self, user_id, field: str, amount: int = 1, limit: int = None) -> bool:
+        """Atomically adds amount to field. With `limit`, only if the current value is below
+        it; returns whether the counter was incremented."""
+
+    # --- Recordings ---
+
+    @abstractmethod
+    async def insert_recordings(self, records: List[dict]):
+        """Appends recorded mock requests. The store is bounded: the oldest records make
+        room for new ones."""
+
+    @abstractmethod
+    async def list_recordings(self, endpoint_id: str, since: float = None, limit: int = 500, cursor: str = None) -> Tuple[List[dict], Optional[str]]:
+        """One page of an endpoint's recordings, without their `_id`, in insertion order;
+        with since, only those whose `timestamp` is at or after it. Returns
+        (items, next_cursor) like list_endpoints."""
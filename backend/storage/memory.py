@@ -0,0 +1,291 @@
+import copy
+import sqlite3
+from collections import deque
+from bson import ObjectId, json_util
+from storage.base import Storage, DuplicateKey, InvalidCursor, SUMMARY_FIELDS
+
+
+def _visible(doc: dict, user_email: str = None) -> bool:
+    return doc.get("is_public") is True or (user_email is not None and doc.get("owner_email") == user_email)
+
+
+def _summary(doc: dict) -> dict:
+    summary = {}
+    for field in SUMMARY_FIELDS:
+        source, target = doc, summary
+        *parents, leaf = field.split(".")
+        for parent in parents:
+            source = source.get(parent)
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(parent, {})
+        else:
+            if leaf in source:
+                target[leaf] = copy.deepcopy(source[leaf])
+    return summary
+
+
+class MemoryStorage(Storage):
+    """An embedded engine that keeps every document in process memory.
+
+    Reads never leave the process. With a sqlite_path, every write is also
+    persisted to SQLite and the documents are reloaded from it on startup, which
+    is enough for single-node deployments; without one, data lives as long as the
+    process (CI, benchmarks). Documents are copied in and out, so callers can
+    mutate what they get back just as they would a freshly decoded Mongo document.
+    """
+
+    name = "memory"
+
+    def __init__(self, sqlite_path: str = None, max_recordings: int = 100000):
+        self.sqlite_path = sqlite_path
+        self.max_recordings = max_recordings
+        self._endpoints = {}  # endpoint_id -> doc, in _id order
+        self._endpoint_ids = {}  # _id -> endpoint_id
+        self._users = {}  # email -> doc
+        self._user_emails = {}  # _id -> email
+        self._state = {}  # (endpoint_id, revision) -> {key: value}
+        self._recordings = deque(maxlen=max_recordings)  # oldest first, like a capped collection
+        self._db = None
+        if sqlite_path:
+            self._open(sqlite_path)
+
+    # --- SQLite persistence ---
+
+    def _open(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS endpoints (endpoint_id TEXT PRIMARY KEY, doc TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, doc TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS recordings (id INTEGER PRIMARY KEY, doc TEXT NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state (endpoint_id TEXT NOT NULL, revision TEXT NOT NULL, key TEXT NOT NULL, "
+            "value TEXT NOT NULL, PRIMARY KEY (endpoint_id, revision, key))"
+        )
+        self._db.commit()
+
+        endpoints = [json_util.loads(row[0]) for row in self._db.execute("SELECT doc FROM endpoints")]
+        for doc in sorted(endpoints, key=lambda doc: doc["_id"]):
+            self._endpoints[doc["endpoint_id"]] = doc
+            self._endpoint_ids[doc["_id"]] = doc["endpoint_id"]
+        for (raw,) in self._db.execute("SELECT doc FROM users"):
+            doc = json_util.loads(raw)
+            self._users[doc["email"]] = doc
+            self._user_emails[doc["_id"]] = doc["email"]
+        for endpoint_id, revision, key, value in self._db.execute("SELECT endpoint_id, revision, key, value FROM state"):
+            self._state.setdefault((endpoint_id, revision), {})[json_util.loads(key)] = json_util.loads(value)
+        for (raw,) in self._db.execute("SELECT doc FROM recordings ORDER BY id DESC LIMIT ?", (self.max_recordings,)):
+            self._recordings.appendleft(json_util.loads(raw))
+
+    def _persist(self, table: str, key_column: str, docs: list):
+        if self._db is None or not docs:
+            return
+        with self._db:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO {table} ({key_column}, doc) VALUES (?, ?)",
+                [(doc[key_column], json_util.dumps(doc)) for doc in docs]
+            )
+
+    async def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # --- Endpoints ---
+
+    async def get_endpoint(self, endpoint_id: str, stale_ok: bool = False):
+        doc = self._endpoints.get(endpoint_id)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    async def get_endpoints(self, endpoint_ids: list, stale_ok: bool = False):
+        return {
+            endpoint_id: copy.deepcopy(self._endpoints[endpoint_id])
+            for endpoint_id in endpoint_ids if endpoint_id in self._endpoints
+        }
+
+    async def get_visible_endpoint(self, endpoint_id: str, user_email: str = None):
+        doc = self._endpoints.get(endpoint_id)
+        if doc is None or not _visible(doc, user_email):
+            return None
+        doc = copy.deepcopy(doc)
+        doc.pop("_id", None)
+        return doc
+
+    async def list_endpoints(self, user_email: str = None, limit: int = 50, cursor: str = None, owned_only: bool = False):
+        after = None
+        if cursor:
+            if not ObjectId.is_valid(cursor):
+                raise InvalidCursor(cursor)
+            after = ObjectId(cursor)
+
+        docs = []
+        next_cursor = None
+        for doc in self._endpoints.values():
+            if after is not None and doc["_id"] <= after:
+                continue
+            if not (doc.get("owner_email") == user_email if owned_only else _visible(doc, user_email)):
+                continue
+            if len(docs) == limit:
+                next_cursor = str(last_id)
+                break
+            docs.append(_summary(doc))
+            last_id = doc["_id"]
+        return docs, next_cursor
+
+    def _upsert(self, doc: dict) -> dict:
+        existing = self._endpoints.get(doc["endpoint_id"])
+        if existing is not None and existing.get("owner_email") != doc.get("owner_email"):
+            raise DuplicateKey(doc["endpoint_id"])
+
+        stored = copy.deepcopy(doc)
+        if existing is not None:
+            # A replace keeps the document's _id, and with it its place in the listing order.
+            stored["_id"] = existing["_id"]
+        else:
+            stored["_id"] = ObjectId()
+            self._endpoint_ids[stored["_id"]] = stored["endpoint_id"]
+        self._endpoints[stored["endpoint_id"]] = stored
+        return stored
+
+    async def upsert_endpoint(self, doc: dict):
+        self._persist("endpoints", "endpoint_id", [self._upsert(doc)])
+
+    async def bulk_upsert_endpoints(self, docs: list, ordered: bool = False) -> dict:
+        errors = {}
+        written = []
+        for position, doc in enumerate(docs):
+            try:
+                written.append(self._upsert(doc))
+            except DuplicateKey:
+                errors[position] = ("conflict", f"duplicate endpoint_id '{doc['endpoint_id']}'")
+                if ordered:
+                    break
+        self._persist("endpoints", "endpoint_id", written)
+        return errors
+
+    # --- Functional state ---
+
+    def _persist_state(self, endpoint_id: str, revision: str, keys):
+        if self._db is None:
+            return
+        state = self._state.get((endpoint_id, revision), {})
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO state (endpoint_id, revision, key, value) VALUES (?, ?, ?, ?)",
+                [(endpoint_id, revision, json_util.dumps(key), json_util.dumps(state[key])) for key in keys if key in state]
+            )
+            self._db.executemany(
+                "DELETE FROM state WHERE endpoint_id = ? AND revision = ? AND key = ?",
+                [(endpoint_id, revision, json_util.dumps(key)) for key in keys if key not in state]
+            )
+
+    async def seed_state(self, endpoint_id: str, revision: str, data: dict):
+        state = self._state.setdefault((endpoint_id, revision), {})
+        seeded = [key for key in data if key not in state]
+        for key in seeded:
+            state[key] = copy.deepcopy(data[key])
+        for scope in [scope for scope in self._state if scope[0] == endpoint_id and scope[1] != revision]:
+            del self._state[scope]
+        if self._db is not None:
+            with self._db:
+                self._db.execute("DELETE FROM state WHERE endpoint_id = ? AND revision != ?", (endpoint_id, revision))
+        self._persist_state(endpoint_id, revision, seeded)
+
+        doc = self._endpoints.get(endpoint_id)
+        if doc is not None and doc.get("revision") == revision:
+            doc["state_revision"] = revision
+            doc["config"]["data"] = {}
+            self._persist("endpoints", "endpoint_id", [doc])
+
+    async def get_state(self, endpoint_id: str, revision: str, keys: list) -> dict:
+        state = self._state.get((endpoint_id, revision), {})
+        return {key: copy.deepcopy(state[key]) for key in keys if key in state}
+
+    async def get_state_keys(self, endpoint_id: str, revision: str) -> list:
+        return list(self._state.get((endpoint_id, revision), {}))
+
+    async def write_state(self, writes: list):
+        for endpoint_id, revision, sets, incs, deletes in writes:
+            state = self._state.setdefault((endpoint_id, revision), {})
+            for key, value in sets.items():
+                state[key] = copy.deepcopy(value)
+            for key, amount in incs.items():
+                state[key] = state.get(key, 0) + amount
+            for key in deletes:
+                state.pop(key, None)
+            self._persist_state(endpoint_id, revision, [*sets, *incs, *deletes])
+
+    # --- Users ---
+
+    async def get_user(self, email: str):
+        doc = self._users.get(email)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    async def insert_user(self, user: dict):
+        if user["email"] in self._users:
+            raise DuplicateKey(user["email"])
+        stored = copy.deepcopy(user)
+        stored.setdefault("_id", ObjectId())
+        self._users[stored["email"]] = stored
+        self._user_emails[stored["_id"]] = stored["email"]
+        self._persist("users", "email", [stored])
+        return stored["_id"]
+
+    def _user(self, user_id):
+        return self._users.get(self._user_emails.get(user_id))
+
+    async def update_user(self, user_id, fields: dict, expected: dict = None) -> bool:
+        doc = self._user(user_id)
+        if doc is None or any(doc.get(key) != value for key, value in (expected or {}).items()):
+            return False
+        doc.update(copy.deepcopy(fields))
+        self._persist("users", "email", [doc])
+        return True
+
+    async def increment_user(self, user_id, field: str, amount: int = 1, limit: int = None) -> bool:
+        doc = self._user(user_id)
+        if doc is None or (limit is not None and doc.get(field, 0) >= limit):
+            return False
+        doc[field] = doc.get(field, 0) + amount
+        self._persist("users", "email", [doc])
+        return True
+
+    # --- Recordings ---
+
+    async def insert_recordings(self, records: list):
+        stored = []
+        for record in records:
+            record = copy.deepcopy(record)
+            record.setdefault("_id", ObjectId())
+            stored.append(record)
+        self._recordings.extend(stored)
+        if self._db is None or not stored:
+            return
+        with self._db:
+            self._db.executemany("INSERT INTO recordings (doc) VALUES (?)", [(json_util.dumps(record),) for record in stored])
+            self._db.execute(
+                "DELETE FROM recordings WHERE id <= (SELECT MAX(id) FROM recordings) - ?", (self.max_recordings,)
+            )
+
+    async def list_recordings(self, endpoint_id: str, since: float = None, limit: int = 500, cursor: str = None):
+        after = None
+        if cursor:
+            if not ObjectId.is_valid(cursor):
+                raise InvalidCursor(cursor)
+            after = ObjectId(cursor)
+
+        items = []
+        next_cursor = None
+        for record in list(self._recordings):
+            if record["endpoint_id"] != endpoint_id or (after is not None and record["_id"] <= after):
+                continue
+            if since is not None and record.get("timestamp", 0) < since:
+                continue
+            if len(items) == limit:
+                next_cursor = str(last_id)
+                break
+            item = copy.deepcopy(record)
+            last_id = item.pop("_id")
+            items.append(item)
+        return items, next_cursor
@@ -0,0 +1,222 @@
+from bson import ObjectId
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from storage.base import Storage, DuplicateKey, InvalidCursor, SUMMARY_FIELDS
+from indexes import ENSURE_INDEXES, ensure_capped, ensure_indexes
+
+SUMMARY_PROJECTION = {field: 1 for field in SUMMARY_FIELDS}
+
+
+def _visibility_query(user_email: str = None) -> dict:
+    if user_email:
+        return {
+            "$or": [
+                {"is_public": True},
+                {"owner_email": user_email}
+            ]
+        }
+    return {"is_public": True}
+
+
+def _state_filter(endpoint_id: str, revision: str, key) -> dict:
+    return {"endpoint_id": endpoint_id, "revision": revision, "key": key}
+
+
+def _owner_filter(doc: dict) -> dict:
+    # The same owner overwrites their endpoint. An ID held by someone else is caught by
+    # _foreign_ids before the write, and by the unique index on endpoint_id if another
+    # owner takes it in between.
+    return {"endpoint_id": doc["endpoint_id"], "owner_email": doc["owner_email"]}
+
+
+class MongoStorage(Storage):
+    """The Motor-backed engine. With a read_preference, stale-tolerant endpoint reads go
+    through it (e.g. to secondaries); everything else reads from the primary."""
+
+    name = "mongo"
+
+    def __init__(self, database, read_preference=None):
+        self.database = database
+        self.endpoints = database.get_collection("endpoints")
+        self.users = database.get_collection("users")
+        self.state = database.get_collection("state")
+        self.recordings = database.get_collection("recordings")
+        self._recordings_ready = False
+        self.stale_reads = read_preference is not None
+        self.endpoint_replicas = (
+            self.endpoints.with_options(read_preference=read_preference) if read_preference else self.endpoints
+        )
+
+    def _endpoints(self, stale_ok: bool):
+        return self.endpoint_replicas if stale_ok else self.endpoints
+
+    async def startup(self):
+        if ENSURE_INDEXES:
+            try:
+                await ensure_indexes(self.database)
+            except Exception as e:
+                print("INDEX::BOOTSTRAP_FAIL", e)
+
+    async def get_endpoint(self, endpoint_id: str, stale_ok: bool = False):
+        return await self._endpoints(stale_ok).find_one({"endpoint_id": endpoint_id})
+
+    async def get_endpoints(self, endpoint_ids: list, stale_ok: bool = False):
+        cursor = self._endpoints(stale_ok).find({"endpoint_id": {"$in": list(endpoint_ids)}})
+        return {doc["endpoint_id"]: doc async for doc in cursor}
+
+    async def get_visible_endpoint(self, endpoint_id: str, user_email: str = None):
+        query = {"$and": [{"endpoint_id": endpoint_id}, _visibility_query(user_email)]}
+        return await self.endpoints.find_one(query, {"_id": 0})
+
+    async def list_endpoints(self, user_email: str = None, limit: int = 50, cursor: str = None, owned_only: bool = False):
+        query = {"owner_email": user_email} if owned_only else _visibility_query(user_email)
+        if cursor:
+            if not ObjectId.is_valid(cursor):
+                raise InvalidCursor(cursor)
+            query = {"$and": [query, {"_id": {"$gt": ObjectId(cursor)}}]}
+
+        # Fetch one extra document to learn whether another page exists.
+        docs = await self.endpoint_replicas.find(query, SUMMARY_PROJECTION).sort("_id", 1).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = str(docs[-1]["_id"])
+
+        for doc in docs:
+            doc.pop("_id", None)
+        return docs, next_cursor
+
+    async def _foreign_ids(self, docs: list) -> set:
+        """The endpoint IDs among docs that another owner holds. Checked explicitly, since
+        the unique index is missing when ENSURE_INDEXES is off or its build failed."""
+        owners = {doc["endpoint_id"]: doc["owner_email"] for doc in docs}
+        existing = await self.endpoints.find(
+            {"endpoint_id": {"$in": list(owners)}}, {"_id": 0, "endpoint_id": 1, "owner_email": 1}
+        ).to_list(length=None)
+        return {found["endpoint_id"] for found in existing if found.get("owner_email") != owners[found["endpoint_id"]]}
+
+    async def upsert_endpoint(self, doc: dict):
+        if await self._foreign_ids([doc]):
+            raise DuplicateKey(doc["endpoint_id"])
+        try:
+            await self.endpoints.replace_one(_owner_filter(doc), doc, upsert=True)
+        except DuplicateKeyError:
+            raise DuplicateKey(doc["endpoint_id"])
+
+    async def bulk_upsert_endpoints(self, docs: list, ordered: bool = False) -> dict:
+        if not docs:
+            return {}
+        foreign = await self._foreign_ids(docs)
+        errors = {}
+        writes = []  # (position in docs, document)
+        for position, doc in enumerate(docs):
+            if doc["endpoint_id"] in foreign:
+                errors[position] = ("conflict", f"endpoint_id '{doc['endpoint_id']}' is owned by another user")
+                if ordered:
+                    break
+            else:
+                writes.append((position, doc))
+        if not writes:
+            return errors
+        try:
+            await self.endpoints.bulk_write(
+                [ReplaceOne(_owner_filter(doc), doc, upsert=True) for _, doc in writes],
+                ordered=ordered
+            )
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                kind = "conflict" if error.get("code") == 11000 else "error"
+                errors[writes[error["index"]][0]] = (kind, error.get("errmsg"))
+        return errors
+
+    async def seed_state(self, endpoint_id: str, revision: str, data: dict):
+        if data:
+            # $setOnInsert: a worker seeding late must not undo keys already changed.
+            await self.state.bulk_write([
+                UpdateOne(_state_filter(endpoint_id, revision, key), {"$setOnInsert": {"value": value}}, upsert=True)
+                for key, value in data.items()
+            ], ordered=False)
+        await self.state.delete_many({"endpoint_id": endpoint_id, "revision": {"$ne": revision}})
+        await self.endpoints.update_one(
+            {"endpoint_id": endpoint_id, "revision": revision},
+            {"$set": {"state_revision": revision, "config.data": {}}}
+        )
+
+    async def get_state(self, endpoint_id: str, revision: str, keys: list) -> dict:
+        cursor = self.state.find(
+            {"endpoint_id": endpoint_id, "revision": revision, "key": {"$in": list(keys)}},
+            {"_id": 0, "key": 1, "value": 1}
+        )
+        return {doc["key"]: doc.get("value") async for doc in cursor}
+
+    async def get_state_keys(self, endpoint_id: str, revision: str) -> list:
+        cursor = self.state.find({"endpoint_id": endpoint_id, "revision": revision}, {"_id": 0, "key": 1})
+        return [doc["key"] async for doc in cursor]
+
+    async def write_state(self, writes: list):
+        operations = []
+        for endpoint_id, revision, sets, incs, deletes in writes:
+            # Writes for a revision that has since been replaced land in its old scope,
+            # which the next seed_state drops.
+            operations.extend(
+                UpdateOne(_state_filter(endpoint_id, revision, key), {"$set": {"value": value}}, upsert=True)
+                for key, value in sets.items()
+            )
+            operations.extend(
+                UpdateOne(_state_filter(endpoint_id, revision, key), {"$inc": {"value": amount}}, upsert=True)
+                for key, amount in incs.items()
+            )
+            if deletes:
+                operations.append(DeleteMany({"endpoint_id": endpoint_id, "revision": revision, "key": {"$in": deletes}}))
+        if operations:
+            await self.state.bulk_write(operations, ordered=False)
+
+    async def get_user(self, email: str):
+        return await self.users.find_one({"email": email})
+
+    async def insert_user(self, user: dict):
+        try:
+            result = await self.users.insert_one(user)
+        except DuplicateKeyError:
+            raise DuplicateKey(user.get("email"))
+        return result.inserted_id
+
+    async def update_user(self, user_id, fields: dict, expected: dict = None) -> bool:
+        result = await self.users.update_one({**(expected or {}), "_id": user_id}, {"$set": fields})
+        return result.matched_count == 1
+
+    async def increment_user(self, user_id, field: str, amount: int = 1, limit: int = None) -> bool:
+        query = {"_id": user_id}
+        if limit is not None:
+            # $not also matches users that do not have the field yet.
+            query[field] = {"$not": {"$gte": limit}}
+        result = await self.users.update_one(query, {"$inc": {field: amount}})
+        return result.matched_count == 1
+
+    async def insert_recordings(self, records: list):
+        if not records:
+            return
+        if not self._recordings_ready:
+            # Also when ENSURE_INDEXES is off: the first insert must not create the collection uncapped.
+            await ensure_capped(self.database)
+            self._recordings_ready = True
+        await self.recordings.insert_many(records, ordered=False)
+
+    async def list_recordings(self, endpoint_id: str, since: float = None, limit: int = 500, cursor: str = None):
+        query = {"endpoint_id": endpoint_id}
+        if since is not None:
+            query["timestamp"] = {"$gte": since}
+        if cursor:
+            if not ObjectId.is_valid(cursor):
+                raise InvalidCursor(cursor)
+            query["_id"] = {"$gt": ObjectId(cursor)}
+
+        docs = await self.recordings.find(query).sort("_id", 1).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = str(docs[-1]["_id"])
+
+        for doc in docs:
+            doc.pop("_id", None)
+        return docs, next_cursor
@@ -0,0 +1,90 @@
+import threading
+from pymongo import monitoring
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters per server, fed by PyMongo's pool events.
+
+    Events arrive on driver threads, so updates are taken under a lock. `checked_out`
+    against `max_pool_size` is the utilisation; `checkout_timeouts` counts requests
+    that gave up waiting for a connection, i.e. pool exhaustion.
+    """
+
+    def __init__(self, max_pool_size: int = 100):
+        self.max_pool_size = max_pool_size
+        self._servers = {}
+        self._lock = threading.Lock()
+
+    def _server(self, address) -> dict:
+        key = "%s:%s" % address
+        server = self._servers.get(key)
+        if server is None:
+            server = self._servers[key] = {
+                "open": 0,
+                "checked_out": 0,
+                "peak_checked_out": 0,
+                "checkouts": 0,
+                "checkout_timeouts": 0,
+                "checkout_failures": 0,
+                "checkout_wait_seconds": 0.0,
+                "pool_clears": 0,
+            }
+        return server
+
+    def connection_created(self, event):
+        with self._lock:
+            self._server(event.address)["open"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._server(event.address)["open"] -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["checkouts"] += 1
+            server["checked_out"] += 1
+            server["peak_checked_out"] = max(server["peak_checked_out"], server["checked_out"])
+            # Time spent waiting for the pool (and connecting, if a new connection was needed).
+            server["checkout_wait_seconds"] += getattr(event, "duration", 0.0) or 0.0
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._server(event.address)["checked_out"] -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                server["checkout_timeouts"] += 1
+            else:
+                server["checkout_failures"] += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._server(event.address)["pool_clears"] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def stats(self) -> dict:
+        """Counters per server, keyed server0, server1, ... in the order the servers were
+        first seen, so host addresses are not exported."""
+        with self._lock:
+            servers = {f"server{index}": dict(server) for index, server in enumerate(self._servers.values())}
+        for server in servers.values():
+            server["max_pool_size"] = self.max_pool_size
+            server["utilization"] = round(server["checked_out"] / self.max_pool_size, 4) if self.max_pool_size else 0.0
+        return servers
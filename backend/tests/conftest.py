@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read at import, so they have to be in place before the app is imported.
+# A small process pool, so a test can see whether one kind of work starves another.
+os.environ.update(
+    STORAGE_BACKEND="memory",
+    SQLITE_PATH="",
+    AI_CLIENT="stub",
+    AI_CACHE_PATH="",
+    RATE_LIMIT_ENABLED="0",
+    SANDBOX_MODE="process",
+    SANDBOX_WORKERS="1",
+    BROADCAST_WORKERS="1",
+)
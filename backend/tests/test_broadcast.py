@@ -0,0 +1,74 @@
+import asyncio
+import json
+from benchmarks.asgi import asgi_request
+
+TICKS = """import time
+
+def handler(url, headers, body, data):
+    while True:
+        yield {"t": time.time()}
+"""
+ECHO = "def handler(url, headers, body, data):\n    return {'ok': True}"
+
+
+async def _create(app, auth: dict, endpoint_id: str, type_: str, config: dict):
+    status, _, body = await asgi_request(app, "POST", "/url", headers=auth, json_body={
+        "type": type_, "name": endpoint_id, "custom_id": endpoint_id, "config": config,
+    })
+    assert status == 201, body
+
+
+async def _subscribe(app, path: str, first_event: asyncio.Event, leave: asyncio.Event, statuses: list):
+    """An SSE client that stays connected until `leave` is set."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"accept", b"text/event-stream")], "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await leave.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+        elif message.get("body"):
+            first_event.set()
+
+    await app(scope, receive, send)
+
+
+def test_functional_mock_is_served_while_a_feed_holds_a_worker():
+    from api.index import app, lifespan
+
+    async def scenario():
+        async with lifespan(app):
+            _, _, body = await asgi_request(app, "POST", "/auth/register", json_body={"email": "feed@example.com", "password": "feed-password"})
+            auth = {"authorization": f"Bearer {json.loads(body)['access_token']}"}
+            await _create(app, auth, "ticks", "stream", {"code": TICKS, "interval_ms": 10})
+            await _create(app, auth, "other-ticks", "stream", {"code": TICKS, "interval_ms": 10})
+            await _create(app, auth, "echo", "functional", {"code": ECHO})
+
+            first_event, leave, statuses = asyncio.Event(), asyncio.Event(), []
+            subscriber = asyncio.ensure_future(_subscribe(app, "/ticks/", first_event, leave, statuses))
+            await asyncio.wait_for(first_event.wait(), 30)
+            try:
+                # The only functional worker is still free for functional mocks.
+                status, _, body = await asyncio.wait_for(asgi_request(app, "GET", "/echo/"), 10)
+                assert (status, json.loads(body)) == (200, {"ok": True})
+                # The feed pool is full, so a second feed is turned away instead of waiting.
+                status, headers, _ = await asyncio.wait_for(asgi_request(app, "GET", "/other-ticks/"), 10)
+                assert status == 503
+                assert (b"retry-after", b"1") in headers
+            finally:
+                leave.set()
+                await asyncio.wait_for(subscriber, 10)
+            assert statuses == [200]
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+import copy
+
+
+def _doc(revision):
+    return {"endpoint_id": "compiled", "type": "static", "revision": revision, "config": {"value": {"a": 1}}}
+
+
+def test_compiled_artifacts_survive_a_refetch_of_the_same_revision():
+    from services.endpoint_cache import get_compiled
+
+    builds = []
+
+    def build(doc):
+        builds.append(doc["revision"])
+        return object()
+
+    first = get_compiled(_doc("r1"), "body", build)
+    # A refetch after the cache TTL is an equal document, but a new object.
+    assert get_compiled(_doc("r1"), "body", build) is first
+    assert get_compiled(_doc("r2"), "body", build) is not first
+    assert builds == ["r1", "r2"]
+
+    legacy = _doc(None)
+    artifact = get_compiled(legacy, "body", build)
+    assert get_compiled(copy.deepcopy(legacy), "body", build) is artifact
@@ -0,0 +1,22 @@
+import asyncio
+from utils.generation_cache import GenerationCache, generation_key
+
+
+def test_keys_ignore_whitespace_but_not_case():
+    assert generation_key("fields  userId,\n createdAt") == generation_key("fields userId, createdAt")
+    assert generation_key("fields userId, createdAt") != generation_key("fields userid, createdat")
+
+
+def test_results_persist_across_instances(tmp_path):
+    path = str(tmp_path / "ai.sqlite3")
+
+    async def scenario():
+        first = GenerationCache(8, 60, path)
+        await first.set("k", {"type": "static"})
+        first.close()
+        second = GenerationCache(8, 60, path)
+        assert await second.get("k") == {"type": "static"}
+        assert await second.get("other") is None
+        second.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,27 @@
+import asyncio
+import gzip
+import json
+from benchmarks.asgi import asgi_request
+
+
+def test_static_variants_are_compressed_once_per_revision():
+    from api.index import app, lifespan
+    from database import storage
+    from services.endpoint_cache import compiled_cache
+
+    value = {"items": [{"id": i, "name": f"item {i}"} for i in range(500)]}
+
+    async def scenario():
+        async with lifespan(app):
+            await storage.upsert_endpoint({
+                "endpoint_id": "big", "type": "static", "name": "big", "description": None, "is_public": True,
+                "owner_email": None, "rate_limit": None, "revision": "r1", "config": {"value": value},
+            })
+            for _ in range(2):
+                status, headers, body = await asgi_request(app, "GET", "/big/", headers={"accept-encoding": "gzip"})
+                assert (status, dict(headers)[b"content-encoding"]) == (200, b"gzip")
+                assert json.loads(gzip.decompress(body)) == value
+            variants = compiled_cache.get("big")[1]["body"].variants
+            assert list(variants) == ["gzip"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,19 @@
+from utils.request import decode_body
+
+FORM = "application/x-www-form-urlencoded"
+
+
+def test_json_is_decoded_whatever_the_content_type():
+    # What `curl -d` sends.
+    assert decode_body(b'{"a": 1}', FORM) == {"a": 1}
+    assert decode_body(b"[1, 2]", "text/plain") == [1, 2]
+    assert decode_body(b"{'a': 1}", "") == {"a": 1}
+    assert [decode_body(raw, "application/json") for raw in (b"42", b'"hi"', b"true", b"null")] == [42, "hi", True, None]
+
+
+def test_other_bodies_fall_back_to_form_fields_then_text():
+    assert decode_body(b"a=1&b=&c=x%20y", FORM) == {"a": "1", "b": "", "c": "x y"}
+    assert decode_body(b"a=1", "text/plain") == "a=1"
+    assert decode_body(b"{not json", "application/json") == "{not json"
+    assert decode_body(b"\xff\xfe", "application/octet-stream") == b"\xff\xfe"
+    assert decode_body(b"", FORM) is None
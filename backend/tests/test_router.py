@@ -0,0 +1,30 @@
+from utils.router import build_router
+
+
+def _router(*paths):
+    return build_router([{"path": path} for path in paths])
+
+
+def test_sibling_routes_may_name_the_same_parameter_differently():
+    router = _router("/pets/{petId}", "/pets/{id}/photos", "/pets/{id}/photos/{photoId}")
+
+    route, params = router.match("/pets/7")
+    assert (route["path"], params) == ("/pets/{petId}", {"petId": "7"})
+    route, params = router.match("/pets/7/photos")
+    assert (route["path"], params) == ("/pets/{id}/photos", {"id": "7"})
+    route, params = router.match("/pets/7/photos/3")
+    assert (route["path"], params) == ("/pets/{id}/photos/{photoId}", {"id": "7", "photoId": "3"})
+
+
+def test_failed_branches_leave_no_parameters_behind():
+    router = _router("/users/{id}/posts", "/users/*/likes", "/users/{rest:path}")
+
+    assert router.match("/users/ada/likes") == ({"path": "/users/*/likes"}, {})
+    assert router.match("/users/ada/files/a") == ({"path": "/users/{rest:path}"}, {"rest": "ada/files/a"})
+
+
+def test_literals_beat_parameters():
+    router = _router("/pets/{petId}", "/pets/mine")
+
+    assert router.match("/pets/mine") == ({"path": "/pets/mine"}, {})
+    assert router.match("/pets/42") == ({"path": "/pets/{petId}"}, {"petId": "42"})
@@ -0,0 +1,25 @@
+import asyncio
+from utils.sandbox import SandboxPool
+
+ECHO = "def handler(url, headers, body, data):\n    data['seen'] = len(body)\n    return body"
+
+
+async def _no_state(*_):
+    return {}
+
+
+def test_large_payloads_cross_the_pipe_intact():
+    async def scenario():
+        pool = SandboxPool(1, 10, 10, 1024)
+        pool.start()
+        try:
+            state = (_no_state, _no_state, ({}, []))
+            # Well past the socket buffer both ways, so neither side can write it in one go.
+            for body in ("small", "x" * (8 * 1024 * 1024)):
+                result, changes, _ = await pool.run("echo", ECHO, "url", {}, body, state)
+                assert result == body
+                assert changes == ({"seen": len(body)}, [])
+        finally:
+            pool.close()
+
+    asyncio.run(scenario())
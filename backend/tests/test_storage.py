@@ -0,0 +1,44 @@
+import pytest
+from storage.base import Storage
+
+
+def test_a_storage_engine_missing_a_method_fails_when_constructed():
+    class Incomplete(Storage):
+        async def get_endpoint(self, endpoint_id, stale_ok=False):
+            return None
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
+
+
+def test_the_shipped_engines_implement_every_method():
+    from storage.memory import MemoryStorage
+    from storage.mongo import MongoStorage
+
+    assert not MemoryStorage.__abstractmethods__
+    assert not MongoStorage.__abstractmethods__
+
+
+def test_owned_only_listings_skip_other_owners_public_endpoints():
+    import asyncio
+    from storage.memory import MemoryStorage
+
+    async def scenario():
+        storage = MemoryStorage()
+        for i in range(5):
+            await storage.upsert_endpoint({"endpoint_id": f"public{i}", "is_public": True, "owner_email": "other@example.com"})
+        for i in range(3):
+            await storage.upsert_endpoint({"endpoint_id": f"mine{i}", "is_public": False, "owner_email": "me@example.com"})
+
+        visible, _ = await storage.list_endpoints("me@example.com", limit=4)
+        assert [doc["endpoint_id"] for doc in visible] == ["public0", "public1", "public2", "public3"]
+
+        ids, cursor = [], None
+        while True:
+            page, cursor = await storage.list_endpoints("me@example.com", limit=2, cursor=cursor, owned_only=True)
+            ids += [doc["endpoint_id"] for doc in page]
+            if cursor is None:
+                break
+        assert ids == ["mine0", "mine1", "mine2"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from benchmarks.asgi import asgi_request
+
+HANGS = """import asyncio
+
+async def handler(url, headers, body, data):
+    yield {"n": 1}
+    yield {"n": 2}
+    if url.endswith("/hang"):
+        await asyncio.sleep(60)
+"""
+
+
+async def _stream(app, path: str, stall: bool = False) -> list:
+    """A GET that collects body chunks; with `stall` it stops reading after the first one."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"accept", b"text/event-stream")], "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    requested, never, chunks = False, asyncio.Event(), []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await never.wait()
+
+    async def send(message):
+        if message.get("body"):
+            chunks.append(message["body"])
+            if stall:
+                await never.wait()
+
+    await asyncio.wait_for(app(scope, receive, send), 30)
+    return chunks
+
+
+def test_stuck_and_stalled_streams_release_the_endpoint(monkeypatch):
+    import utils.streaming
+    from api.index import app, lifespan
+
+    monkeypatch.setattr(utils.streaming, "STREAM_MAX_SECONDS", 1)
+    monkeypatch.setattr(utils.streaming, "STREAM_SEND_TIMEOUT", 1)
+
+    async def scenario():
+        async with lifespan(app):
+            _, _, body = await asgi_request(app, "POST", "/auth/register", json_body={"email": "stream@example.com", "password": "stream-password"})
+            auth = {"authorization": f"Bearer {json.loads(body)['access_token']}"}
+            status, _, body = await asgi_request(app, "POST", "/url", headers=auth, json_body={
+                "type": "functional", "name": "hangs", "custom_id": "hangs", "config": {"code": HANGS},
+            })
+            assert status == 201, body
+
+            chunks = await _stream(app, "/hangs/hang")
+            assert b"time limit" in chunks[-1]
+            assert len(await _stream(app, "/hangs/", stall=True)) == 1
+            # Neither stream left the endpoint locked or its only worker busy.
+            assert b"".join(await _stream(app, "/hangs/")).count(b"data: ") == 2
+
+    asyncio.run(scenario())
+
+
+SLOW = """import asyncio
+
+async def handler(url, headers, body, data):
+    runs = data.get("runs", 0)
+    data["runs"] = runs + 1
+    yield {"runs": runs}
+    await asyncio.sleep(1)
+    yield {"done": True}
+"""
+
+
+def test_streams_from_one_endpoint_run_side_by_side(monkeypatch):
+    import time
+    import services.resolve_service
+    from api.index import app, lifespan
+
+    # In-process, so the streams do not also wait for the one sandbox worker.
+    monkeypatch.setattr(services.resolve_service, "sandbox_pool", None)
+
+    async def scenario():
+        async with lifespan(app):
+            _, _, body = await asgi_request(app, "POST", "/auth/register", json_body={"email": "slow@example.com", "password": "slow-password"})
+            auth = {"authorization": f"Bearer {json.loads(body)['access_token']}"}
+            status, _, body = await asgi_request(app, "POST", "/url", headers=auth, json_body={
+                "type": "functional", "name": "slow", "custom_id": "slow", "config": {"code": SLOW},
+            })
+            assert status == 201, body
+
+            # A stream's state changes are kept once it ends.
+            assert b'"runs": 0' in (await _stream(app, "/slow/"))[0]
+            started = time.perf_counter()
+            streams = await asyncio.gather(*(_stream(app, "/slow/") for _ in range(3)))
+            assert time.perf_counter() - started < 2
+            assert all(b'"runs": 1' in chunks[0] for chunks in streams)
+
+    asyncio.run(scenario())
@@ -1,20 +1,65 @@
-from passlib.context import CryptContext
-from jose import jwt, JWTError
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
-from typing import Optional
+from typing import Optional, Tuple
+from utils.startup import timed
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising BCRYPT_ROUNDS transparently upgrades existing hashes on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt is deliberately slow, so it runs on a small dedicated pool instead of the event loop.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+# Hash operations allowed to be running or queued before new ones are rejected.
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "32"))
+
+_pwd_context = None
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+
+
+class HashingSaturated(Exception):
+    """Raised when the password hashing queue is full."""
 
 SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "43200"))
 
+def get_pwd_context():
+    """The bcrypt CryptContext, built on first use so requests that never touch a
+    password (serving mocks) do not load passlib and its bcrypt backend."""
+    global _pwd_context
+    if _pwd_context is None:
+        with timed("crypt_context"):
+            from passlib.context import CryptContext
+            _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+async def _run_hashing(func, *args):
+    global _hash_pending
+    if _hash_pending >= HASH_MAX_PENDING:
+        raise HashingSaturated()
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(get_pwd_context().hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Returns (valid, new_hash). new_hash is set when the stored hash uses outdated parameters."""
+    return await _run_hashing(get_pwd_context().verify_and_update, plain_password, hashed_password)
+
+def hashing_stats() -> dict:
+    return {"workers": HASH_WORKERS, "pending": _hash_pending, "max_pending": HASH_MAX_PENDING}
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -23,10 +68,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str):
+    # jose is imported on first use, like passlib; later imports are a dict lookup.
+    from jose import jwt, JWTError
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -0,0 +1,312 @@
+import asyncio
+from collections import deque
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.websockets import WebSocketDisconnect
+from utils.streaming import MEDIA_TYPES, _json, encode_item
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+# Why a subscriber's feed ended early -> (message, WebSocket close code).
+_END_ERRORS = {
+    "overflow": ("Subscriber fell behind", 1008),
+    "failed": ("Stream handler failed", 1011),
+}
+
+
+class BroadcastEvent:
+    """One published event. It is encoded at most once per wire format, however many
+    subscribers it goes to, and shared by reference between their buffers."""
+
+    __slots__ = ("seq", "name", "data", "_encoded")
+
+    def __init__(self, seq: int, name, data):
+        self.seq = seq
+        self.name = name
+        self.data = data
+        self._encoded = {}
+
+    def encoded(self, fmt: str):
+        """The event in fmt ("sse", "ndjson", "chunked" or "ws"): bytes, or text for "ws"."""
+        encoded = self._encoded.get(fmt)
+        if encoded is None:
+            encoded = self._encoded[fmt] = self._encode(fmt)
+        return encoded
+
+    def _encode(self, fmt: str):
+        if fmt == "sse":
+            head = f"id: {self.seq}\n" + (f"event: {self.name}\n" if self.name else "")
+            return head.encode() + encode_item("sse", self.data)
+        # Outside SSE, a named event carries its name in the payload.
+        payload = {"event": self.name, "data": self.data} if self.name else self.data
+        if fmt == "ws":
+            return payload if isinstance(payload, str) else _json(payload)
+        return encode_item(fmt, payload)
+
+
+class Subscriber:
+    """A bounded buffer of events waiting to be sent to one client.
+
+    When `limit` events are already waiting, the policy decides: "drop_oldest" discards
+    the oldest buffered event, "drop_newest" discards the new one, and "disconnect"
+    ends the subscription so the client can reconnect and catch up."""
+
+    __slots__ = ("fmt", "limit", "policy", "queue", "ready", "ended", "dropped")
+
+    def __init__(self, fmt: str, limit: int, policy: str):
+        self.fmt = fmt
+        self.limit = limit
+        self.policy = policy
+        self.queue = deque(maxlen=limit if policy == "drop_oldest" else None)
+        self.ready = asyncio.Event()
+        # Why the feed ended for this subscriber ("ended", "failed", "overflow" or "closed"), once it has.
+        self.ended = None
+        self.dropped = 0
+
+    def offer(self, event: BroadcastEvent) -> bool:
+        """Buffers event. False means the subscriber overflowed and must be disconnected."""
+        queue = self.queue
+        if len(queue) >= self.limit:
+            if self.policy == "disconnect":
+                return False
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return True
+            # drop_oldest: the deque's maxlen pushes the oldest event out.
+        queue.append(event)
+        self.ready.set()
+        return True
+
+    def end(self, reason: str):
+        if self.ended is None:
+            self.ended = reason
+            if reason == "overflow":
+                self.queue.clear()
+        self.ready.set()
+
+    async def take(self) -> list:
+        """Waits for events and returns all that are buffered; [] once the feed has ended
+        and everything before the end has been taken."""
+        while not self.queue:
+            if self.ended is not None:
+                return []
+            self.ready.clear()
+            await self.ready.wait()
+        events = list(self.queue)
+        self.queue.clear()
+        return events
+
+
+class Broadcast:
+    """One endpoint's feed: a single producer whose events are fanned out to every
+    subscriber.
+
+    open_events() is awaited when the first subscriber arrives and returns an async
+    iterator of event batches, lists of (name, data) pairs. The feed stops, and the
+    iterator is closed, when it is exhausted or fails, when the last subscriber leaves,
+    or on close(). Publishing never waits for subscribers: each has its own bounded
+    buffer, so a slow client only loses its own events.
+    """
+
+    def __init__(self, key, open_events, interval: float = 0.0, on_closed=None):
+        self.key = key
+        self.interval = interval
+        self.subscribers = set()
+        self.closed = False
+        self.seq = 0
+        self.published = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self._open_events = open_events
+        self._on_closed = on_closed
+        self._opening = None
+        self._producer = None
+
+    async def subscribe(self, fmt: str, limit: int, policy: str) -> Subscriber:
+        """Adds a subscriber, starting the feed if it is not running yet. Raises whatever
+        open_events raised if the feed could not be started."""
+        subscriber = Subscriber(fmt, limit, policy)
+        self.subscribers.add(subscriber)
+        if self._producer is None:
+            if self._opening is None:
+                self._opening = asyncio.ensure_future(self._open_events())
+            try:
+                # Shielded: one subscriber giving up must not cancel the start for the others.
+                events = await asyncio.shield(self._opening)
+            except BaseException:
+                self.unsubscribe(subscriber)
+                if self._opening.done() and not self._opening.cancelled() and self._opening.exception() is not None:
+                    # Nobody can use a feed that failed to start; the next subscriber opens a new one.
+                    self.close()
+                raise
+            if self._producer is None and not self.closed:
+                self._producer = asyncio.get_running_loop().create_task(self._run(events))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+        self.dropped += subscriber.dropped
+        subscriber.dropped = 0
+        if not self.subscribers:
+            self.close()
+
+    def publish(self, name, data):
+        self.seq += 1
+        self.published += 1
+        event = BroadcastEvent(self.seq, name, data)
+        overflowed = None
+        for subscriber in self.subscribers:
+            if not subscriber.offer(event):
+                overflowed = overflowed or []
+                overflowed.append(subscriber)
+        if overflowed:
+            self.overflowed += len(overflowed)
+            for subscriber in overflowed:
+                subscriber.end("overflow")
+                self.unsubscribe(subscriber)
+
+    async def _run(self, events):
+        reason = "ended"
+        try:
+            async for batch in events:
+                for name, data in batch:
+                    if self.closed:
+                        return
+                    self.publish(name, data)
+                    if self.interval:
+                        await asyncio.sleep(self.interval)
+                # A source that never waits would otherwise starve the subscribers' sends.
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            reason = "failed"
+            print("BROADCAST::SOURCE_FAIL", e)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await _close_events(events)
+            self._finish(reason)
+
+    def close(self):
+        """Stops the feed and ends every subscriber's stream."""
+        if self.closed:
+            return
+        self._finish("closed")
+        if self._producer is not None:
+            self._producer.cancel()
+        elif self._opening is not None:
+            self._opening.add_done_callback(_close_opened)
+
+    async def wait_closed(self):
+        """Waits until a closed feed's source has been closed too."""
+        if self._producer is not None:
+            await asyncio.wait([self._producer])
+
+    def _finish(self, reason: str):
+        first = not self.closed
+        self.closed = True
+        for subscriber in self.subscribers:
+            self.dropped += subscriber.dropped
+            subscriber.dropped = 0
+            subscriber.end(reason)
+        self.subscribers.clear()
+        if first and self._on_closed is not None:
+            self._on_closed(self)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped": self.dropped + sum(subscriber.dropped for subscriber in self.subscribers),
+            "overflowed": self.overflowed,
+        }
+
+
+async def _close_events(events):
+    try:
+        await events.aclose()
+    except Exception as e:
+        print("BROADCAST::CLOSE_FAIL", e)
+
+
+def _close_opened(opening):
+    # The feed was closed while its source was still being opened; close the source once it is.
+    if not opening.cancelled() and opening.exception() is None:
+        asyncio.ensure_future(_close_events(opening.result()))
+
+
+class BroadcastResponse(StreamingResponse):
+    """Streams a subscriber's events as SSE, NDJSON or chunked text. Each send carries
+    every event buffered since the previous one. on_close() runs once the client
+    disconnects or the feed ends."""
+
+    def __init__(self, subscriber: Subscriber, on_close):
+        self.subscriber = subscriber
+        self.on_close = on_close
+        fmt = subscriber.fmt
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} if fmt == "sse" else None
+        super().__init__(self._chunks(), media_type=MEDIA_TYPES[fmt], headers=headers)
+
+    async def _chunks(self):
+        subscriber = self.subscriber
+        fmt = subscriber.fmt
+        while True:
+            events = await subscriber.take()
+            if not events:
+                break
+            if len(events) == 1:
+                yield events[0].encoded(fmt)
+            else:
+                yield b"".join(event.encoded(fmt) for event in events)
+        if subscriber.ended in _END_ERRORS and fmt == "sse":
+            yield f"event: error\ndata: {_json(_END_ERRORS[subscriber.ended][0])}\n\n".encode()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def watch_disconnect():
+                    while (await receive())["type"] != "http.disconnect":
+                        pass
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(watch_disconnect)
+                try:
+                    await self.stream_response(send)
+                except OSError:
+                    pass
+                finally:
+                    task_group.cancel_scope.cancel()
+        finally:
+            self.on_close()
+
+
+async def serve_websocket(websocket, subscriber: Subscriber):
+    """Sends a subscriber's events as WebSocket text messages, one per event, until the
+    client disconnects or the feed ends. Messages from the client are ignored."""
+    await websocket.accept()
+    disconnected = False
+    async with anyio.create_task_group() as task_group:
+
+        async def watch_disconnect():
+            nonlocal disconnected
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+            disconnected = True
+            task_group.cancel_scope.cancel()
+
+        task_group.start_soon(watch_disconnect)
+        try:
+            while True:
+                events = await subscriber.take()
+                if not events:
+                    break
+                for event in events:
+                    await websocket.send_text(event.encoded("ws"))
+        except (WebSocketDisconnect, OSError):
+            disconnected = True
+        finally:
+            task_group.cancel_scope.cancel()
+    if not disconnected:
+        reason, code = _END_ERRORS.get(subscriber.ended, (None, 1000))
+        await websocket.close(code, reason)
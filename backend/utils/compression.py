@@ -0,0 +1,116 @@
+import gzip
+import os
+from typing import Optional
+import anyio.to_thread
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available.
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are sent as is; below ~1 KB compression rarely pays for itself.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+
+def _gzip(data: bytes, best: bool) -> bytes:
+    # mtime=0 keeps the output, and so a cached variant, identical across workers.
+    return gzip.compress(data, compresslevel=9 if best else 5, mtime=0)
+
+
+def _brotli(data: bytes, best: bool) -> bytes:
+    return brotli.compress(data, quality=11 if best else 4)
+
+
+def _zstd(data: bytes, best: bool) -> bytes:
+    return zstandard.ZstdCompressor(level=19 if best else 3).compress(data)
+
+
+# Preferred first when the client accepts several with the same q-value.
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+ENCODERS["gzip"] = _gzip
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The best encoding both sides support, or None to send the body uncompressed."""
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    wildcard = None
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if name == "*":
+            wildcard = weight
+        elif name:
+            weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODERS:
+        weight = weights.get(encoding, wildcard or 0.0)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(encoding: str, data: bytes, best: bool = False) -> bytes:
+    """best=True spends more CPU for a smaller body; meant for variants that are cached."""
+    return ENCODERS[encoding](data, best)
+
+
+def encode_body(body: bytes, accept_encoding: Optional[str]):
+    """Returns (body, encoding) for the client, compressed on the fly."""
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return body, None
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return body, None
+    return compress(encoding, body), encoding
+
+
+async def encode_variant(body: bytes, accept_encoding: Optional[str], variants: dict):
+    """encode_body for a body that is sent many times: each encoding is compressed once at
+    the highest level, on a worker thread so the event loop keeps serving, and reused."""
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return body, None
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return body, None
+
+    variant = variants.get(encoding)
+    if variant is None:
+        variant = variants[encoding] = await anyio.to_thread.run_sync(compress, encoding, body, True)
+    return variant, encoding
+
+
+def compressible(body: bytes) -> bool:
+    return len(body) >= COMPRESSION_MIN_SIZE
+
+
+def compress_response(response, accept_encoding: Optional[str]):
+    """Compresses an already rendered response in place, if the client accepts it."""
+    if not compressible(response.body) or "content-encoding" in response.headers:
+        return response
+    response.headers["Vary"] = "Accept-Encoding"
+    body, encoding = encode_body(response.body, accept_encoding)
+    if encoding is not None:
+        response.body = body
+        response.headers["Content-Encoding"] = encoding
+        response.headers["Content-Length"] = str(len(body))
+    return response
@@ -0,0 +1,112 @@
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+import anyio.to_thread
+from utils.cache import LRUCache
+
+
+def _normalize(text: Optional[str]) -> str:
+    # Whitespace differences do not change what the model is asked for. Case can: key
+    # names like userId and userid must not share a result.
+    return " ".join((text or "").split())
+
+
+def generation_key(*parts: Optional[str]) -> str:
+    return hashlib.sha256(json.dumps([_normalize(part) for part in parts]).encode()).hexdigest()
+
+
+class GenerationCache:
+    """An LRU + TTL cache of AI generation results.
+
+    With a sqlite_path every new result is also written to SQLite, and unexpired
+    entries are loaded back on first use, so restarts and other workers on the same
+    host do not pay for the same generation twice. SQLite is only used from worker
+    threads, never on the event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, sqlite_path: str = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.sqlite_path = sqlite_path
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._db = None
+        # Calls come from several threads; a connection runs one transaction at a time.
+        self._db_lock = threading.Lock()
+        self._loaded = False
+
+    async def _load(self):
+        # Deferred to the first lookup, so processes that never generate never open the file.
+        # Lookups made while it loads simply miss.
+        self._loaded = True
+        if not self.sqlite_path:
+            return
+        try:
+            rows = await anyio.to_thread.run_sync(self._open, self.sqlite_path)
+        except sqlite3.Error as e:
+            # A read-only or missing directory only costs persistence, not the cache.
+            print("AI_CACHE::OPEN_FAIL", e)
+            self._db = None
+            return
+        now = time.time()
+        # Oldest first, so the freshest entries end up most recently used.
+        for key, result, expires_at in reversed(rows):
+            if self._entries.get(key) is None:
+                self._entries.set(key, json.loads(result), ttl=expires_at - now)
+
+    def _open(self, path: str) -> list:
+        db = sqlite3.connect(path, check_same_thread=False)
+        with self._db_lock:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            with db:
+                db.execute("DELETE FROM generations WHERE expires_at <= ?", (time.time(),))
+            rows = db.execute(
+                "SELECT key, result, expires_at FROM generations ORDER BY expires_at DESC LIMIT ?", (self.maxsize,)
+            ).fetchall()
+        self._db = db
+        return rows
+
+    async def get(self, key: str):
+        if not self._loaded:
+            await self._load()
+        result = self._entries.get(key)
+        return copy.deepcopy(result) if result is not None else None
+
+    async def set(self, key: str, result: dict):
+        if not self._loaded:
+            await self._load()
+        self._entries.set(key, copy.deepcopy(result))
+        if self._db is None:
+            return
+        try:
+            await anyio.to_thread.run_sync(self._write, key, json.dumps(result), time.time() + self.ttl)
+        except sqlite3.Error as e:
+            print("AI_CACHE::WRITE_FAIL", e)
+
+    def _write(self, key: str, result: str, expires_at: float):
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO generations (key, result, expires_at) VALUES (?, ?, ?)",
+                (key, result, expires_at),
+            )
+            # Keep the file bounded like the in-memory copy.
+            self._db.execute(
+                "DELETE FROM generations WHERE key NOT IN "
+                "(SELECT key FROM generations ORDER BY expires_at DESC LIMIT ?)",
+                (self.maxsize,),
+            )
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        return {**self._entries.stats(), "persistent": self._db is not None}
@@ -0,0 +1,39 @@
+import hashlib
+import os
+from utils.cache import LRUCache
+
+HANDLER_CACHE_SIZE = int(os.getenv("HANDLER_CACHE_SIZE", "512"))
+
+# endpoint_id -> (code digest, compiled module code object)
+handler_cache = LRUCache(maxsize=HANDLER_CACHE_SIZE)
+
+
+def code_digest(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def compile_handler(endpoint_id: str, code: str):
+    """Returns the compiled code object for a handler, compiling once per code version."""
+    digest = code_digest(code)
+    cached = handler_cache.get(endpoint_id)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+
+    compiled = compile(code, f"<mock:{endpoint_id}>", "exec")
+    handler_cache.set(endpoint_id, (digest, compiled))
+    return compiled
+
+
+def load_handler(endpoint_id: str, code: str):
+    """Executes the cached module code in a fresh namespace and returns its `handler`."""
+    execution_env = {"true": True, "false": False, "null": None}
+    exec(compile_handler(endpoint_id, code), execution_env)
+
+    handler = execution_env.get("handler")
+    if not handler:
+        raise ValueError("No function named 'handler' found in code.")
+    return handler
+
+
+def invalidate_handler(endpoint_id: str):
+    handler_cache.pop(endpoint_id)
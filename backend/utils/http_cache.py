@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse, Response
+from utils.compression import ENCODERS, compressible, encode_body, encode_variant
+
+# Sent with static and mapping responses unless the endpoint sets its own. "no-cache"
+# lets clients keep a copy but revalidate it every time, which is what makes the 304s work.
+MOCK_CACHE_CONTROL = os.getenv("MOCK_CACHE_CONTROL", "no-cache")
+
+CONDITIONAL_METHODS = {"GET", "HEAD"}
+
+
+class PreparedBody:
+    """A JSON body serialised once, with its strong ETag. Compressed variants are added
+    to `variants` the first time a client asks for that encoding."""
+
+    __slots__ = ("body", "etag", "variants")
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+        self.variants = {}
+
+
+def serialize(value) -> bytes:
+    """The exact bytes FastAPI would send for `value`."""
+    return JSONResponse(jsonable_encoder(value)).body
+
+
+def make_etag(*parts: bytes) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part)
+    return f'"{digest.hexdigest()}"'
+
+
+def prepare_body(value) -> PreparedBody:
+    body = serialize(value)
+    return PreparedBody(body, make_etag(body))
+
+
+def templated_etag(template: PreparedBody, params: dict) -> str:
+    """ETag of a route template rendered with params, computed without rendering it."""
+    return make_etag(template.etag.encode(), json.dumps(params, sort_keys=True).encode())
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """Each encoding is its own representation, so it gets its own strong ETag."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def _base_etag(tag: str) -> str:
+    tag = tag.strip().removeprefix("W/")
+    head, dash, encoding = tag[:-1].rpartition("-")
+    return f'{head}"' if dash and encoding in ENCODERS else tag
+
+
+def matching_etag(if_none_match: str, etag: str):
+    """The tag in If-None-Match that is still current, or None. The weak comparison is used,
+    so W/ prefixes are ignored, and a copy in any encoding is current as long as the content
+    it was encoded from is."""
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    for tag in if_none_match.split(","):
+        if _base_etag(tag) == etag:
+            return tag.strip()
+    return None
+
+
+async def conditional_response(request, etag: str, render_body, cache_control: str = None, variants: dict = None) -> Response:
+    """200 with the body from render_body(), or 304 without calling it when the client's copy is current.
+    The body is compressed if the client accepts it: once per encoding when a PreparedBody's
+    variants are passed, on the fly otherwise."""
+    headers = {"ETag": etag, "Cache-Control": cache_control or MOCK_CACHE_CONTROL}
+    if request.method in CONDITIONAL_METHODS:
+        current = matching_etag(request.headers.get("if-none-match"), etag)
+        if current:
+            # Echo the tag of the representation the client holds.
+            headers["ETag"] = current
+            return Response(status_code=304, headers=headers)
+
+    body = render_body()
+    if compressible(body):
+        headers["Vary"] = "Accept-Encoding"
+        accept_encoding = request.headers.get("accept-encoding")
+        if variants is None:
+            body, encoding = encode_body(body, accept_encoding)
+        else:
+            body, encoding = await encode_variant(body, accept_encoding, variants)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            headers["ETag"] = encoded_etag(etag, encoding)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,180 @@
+"""In-process latency histograms rendered in the Prometheus text format.
+
+Observations are a bisect and three additions on plain lists, so timing every
+request costs well under a microsecond per phase. Nothing is exported until
+/metrics is scraped.
+"""
+import hashlib
+import os
+import time
+from bisect import bisect_left
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Endpoints beyond this many distinct IDs are reported under endpoint_id="_other",
+# so a flood of random mock IDs cannot grow the series without bound. Endpoint IDs are
+# exported as a short hash, since private mocks are only protected by their ID.
+METRICS_MAX_ENDPOINTS = int(os.getenv("METRICS_MAX_ENDPOINTS", "1000"))
+
+# Seconds; spans sub-millisecond cache hits up to the sandbox timeout.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OTHER_ENDPOINT = "_other"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., count above the last bucket, sum, count]
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bounds = ['le="%r"' % float(bound) for bound in self.buckets] + ['le="+Inf"']
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series[:-2]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+phase_seconds = Histogram(
+    "mock_phase_seconds",
+    "Time spent in each phase of serving a mock.",
+    ("endpoint_id", "mock_type", "phase"),
+)
+request_seconds = Histogram(
+    "mock_request_seconds",
+    "End-to-end time to serve a mock, by response status.",
+    ("endpoint_id", "mock_type", "status"),
+)
+
+_endpoint_labels = {}  # endpoint_id -> label
+_collectors = []
+
+
+def endpoint_label(endpoint_id: str) -> str:
+    """The first 12 hex digits of the endpoint ID's SHA-256."""
+    label = _endpoint_labels.get(endpoint_id)
+    if label is None:
+        if len(_endpoint_labels) >= METRICS_MAX_ENDPOINTS:
+            return OTHER_ENDPOINT
+        label = _endpoint_labels[endpoint_id] = hashlib.sha256(endpoint_id.encode()).hexdigest()[:12]
+    return label
+
+
+class PhaseTimer:
+    """Splits one request into consecutive phases. mark(phase) attributes the time since
+    the previous mark to that phase; record() observes everything once the request ends."""
+
+    __slots__ = ("started", "last", "phases", "endpoint_id", "mock_type")
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.phases = []
+        self.endpoint_id = None
+        self.mock_type = None
+
+    def mark(self, phase: str, excluding: float = 0.0):
+        """excluding: part of the elapsed time already recorded under other phases via add()."""
+        now = time.perf_counter()
+        self.phases.append((phase, max(0.0, now - self.last - excluding)))
+        self.last = now
+
+    def add(self, phase: str, seconds: float):
+        """Records a duration measured elsewhere (e.g. inside a sandbox worker)."""
+        self.phases.append((phase, seconds))
+
+    def identify(self, endpoint_id: str, mock_type: str):
+        self.endpoint_id = endpoint_id
+        self.mock_type = mock_type
+
+    def record(self, status: int):
+        if self.endpoint_id is None:
+            # Unknown mock IDs share one series rather than one each.
+            endpoint, mock_type = OTHER_ENDPOINT, "none"
+        else:
+            endpoint, mock_type = endpoint_label(self.endpoint_id), self.mock_type
+        for phase, seconds in self.phases:
+            phase_seconds.observe((endpoint, mock_type, phase), seconds)
+        request_seconds.observe((endpoint, mock_type, str(status)), time.perf_counter() - self.started)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def mark(self, phase: str, excluding: float = 0.0):
+        pass
+
+    def add(self, phase: str, seconds: float):
+        pass
+
+    def identify(self, endpoint_id: str, mock_type: str):
+        pass
+
+    def record(self, status: int):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def start_timer():
+    return PhaseTimer() if METRICS_ENABLED else NULL_TIMER
+
+
+def register_collector(name: str, documentation: str, collect):
+    """Exports the numeric values of collect() -> dict as gauges named <name>_<key>,
+    read at scrape time. Nested dicts become a `kind` label."""
+    _collectors.append((name, documentation, collect))
+
+
+def _gauge_lines(name: str, documentation: str, values: dict) -> list:
+    series = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            for inner_key, inner_value in value.items():
+                if isinstance(inner_value, (int, float)) and not isinstance(inner_value, bool):
+                    series.setdefault(f"{name}_{inner_key}", []).append((f'{{kind="{_escape(key)}"}}', inner_value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            series.setdefault(f"{name}_{key}", []).append(("", value))
+
+    lines = []
+    for metric, samples in series.items():
+        lines.append(f"# HELP {metric} {documentation}")
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(f"{metric}{labels} {value}" for labels, value in samples)
+    return lines
+
+
+def render() -> str:
+    lines = phase_seconds.render() + request_seconds.render()
+    for name, documentation, collect in _collectors:
+        try:
+            lines.extend(_gauge_lines(name, documentation, collect()))
+        except Exception as e:
+            print("METRICS::COLLECT_FAIL", name, e)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,120 @@
+"""In-memory admission control: token buckets, sliding windows and concurrency caps.
+
+State is per process and bounded by an LRU, so a flood of distinct client IPs
+cannot grow it without limit; an evicted key simply starts again with a full
+allowance. Limits are passed on every check rather than stored, so an endpoint
+whose configuration changes is limited by its new settings straight away.
+"""
+import time
+from utils.cache import LRUCache
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`; each request takes one."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """0 if admitted, otherwise the seconds until a token is available."""
+        self.tokens = min(float(burst), self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+    def refund(self):
+        self.tokens += 1
+
+
+class SlidingWindow:
+    """At most `limit` requests in any `window` seconds, estimated from the current and
+    previous fixed windows weighted by their overlap, in O(1) time and memory."""
+
+    __slots__ = ("start", "current", "previous")
+
+    def __init__(self):
+        self.start = 0.0
+        self.current = 0
+        self.previous = 0
+
+    def take(self, limit: int, window: float, now: float) -> float:
+        start = now - now % window
+        if start != self.start:
+            self.previous = self.current if round((start - self.start) / window) == 1 else 0
+            self.current = 0
+            self.start = start
+        weight = 1 - (now - start) / window
+        if self.previous * weight + self.current < limit:
+            self.current += 1
+            return 0.0
+        if self.current >= limit:
+            return start + window - now
+        # Wait until enough of the previous window has slid out.
+        return max(0.001, start + window * (1 - (limit - self.current) / self.previous) - now)
+
+    def refund(self):
+        self.current -= 1
+
+
+class RateLimiter:
+    def __init__(self, max_keys: int = 100_000):
+        self._limiters = LRUCache(maxsize=max_keys)
+        self._in_flight = {}
+        self.admitted = 0
+        self.rejected = {}
+
+    def _limiter(self, key: tuple, factory):
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = factory()
+            self._limiters.set(key, limiter)
+        return limiter
+
+    def check(self, rules: list) -> float:
+        """rules: (scope, key, kind, limit, period) tuples, where kind "bucket" means `limit`
+        requests per second with a burst of `period`, and "window" means `limit` requests per
+        `period` seconds. Admits only if every rule allows it; returns 0 or the seconds to wait."""
+        now = time.monotonic()
+        taken = []
+        for scope, key, kind, limit, period in rules:
+            if kind == "bucket":
+                limiter = self._limiter((scope, key), lambda: TokenBucket(period))
+            else:
+                limiter = self._limiter((scope, key), SlidingWindow)
+            wait = limiter.take(limit, period, now)
+            if wait:
+                # A rejected request should not use up the allowance of the rules it did pass.
+                for passed in taken:
+                    passed.refund()
+                self.rejected[scope] = self.rejected.get(scope, 0) + 1
+                return wait
+            taken.append(limiter)
+        self.admitted += 1
+        return 0.0
+
+    def enter(self, key: str, limit: int) -> bool:
+        """Claims one of `limit` concurrent slots for key; False if they are all taken."""
+        count = self._in_flight.get(key, 0)
+        if count >= limit:
+            self.rejected["concurrency"] = self.rejected.get("concurrency", 0) + 1
+            return False
+        self._in_flight[key] = count + 1
+        return True
+
+    def leave(self, key: str):
+        count = self._in_flight.pop(key, 1) - 1
+        if count > 0:
+            self._in_flight[key] = count
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._limiters),
+            "admitted": self.admitted,
+            "in_flight": sum(self._in_flight.values()),
+            "rejected": dict(self.rejected),
+        }
@@ -0,0 +1,129 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Route templates support three kinds of dynamic segments:
+#   /users/{id}          captures a single segment as `id`
+#   /files/*             matches any single segment without capturing it
+#   /static/{rest:path}  captures the remainder of the path as `rest` (must be last)
+_PARAM_RE = re.compile(r"^\{([A-Za-z_][A-Za-z0-9_]*)(:path)?\}$")
+
+
+class _Node:
+    # Siblings such as /pets/{petId} and /pets/{id}/photos share one parameter child, so
+    # the names are kept per route: route and tail hold (route, parameter names in order).
+    __slots__ = ("literals", "param", "wildcard", "tail", "route")
+
+    def __init__(self):
+        self.literals: Dict[str, "_Node"] = {}
+        self.param: Optional["_Node"] = None
+        self.wildcard: Optional["_Node"] = None
+        self.tail: Optional[Tuple[Any, List[str]]] = None
+        self.route: Optional[Tuple[Any, List[str]]] = None
+
+
+def split_path(path: str) -> list:
+    return [segment for segment in path.split("/") if segment]
+
+
+class Router:
+    """A segment trie over route templates. Lookup cost depends on path depth, not route count."""
+
+    def __init__(self):
+        self.root = _Node()
+        self.size = 0
+
+    def add(self, template: str, route: Any) -> None:
+        node = self.root
+        names = []
+        segments = split_path(template)
+        for index, segment in enumerate(segments):
+            match = _PARAM_RE.match(segment)
+            if match and match.group(2):
+                if index != len(segments) - 1:
+                    raise ValueError(f"Path parameter '{segment}' must be the last segment in '{template}'")
+                if node.tail is None:
+                    node.tail = (route, names + [match.group(1)])
+                    self.size += 1
+                return
+            if match:
+                names.append(match.group(1))
+                node.param = node.param or _Node()
+                node = node.param
+            elif segment == "*":
+                node.wildcard = node.wildcard or _Node()
+                node = node.wildcard
+            elif "{" in segment or "}" in segment:
+                raise ValueError(f"Invalid path segment '{segment}' in '{template}'")
+            else:
+                node = node.literals.setdefault(segment, _Node())
+
+        # First definition wins, matching the previous linear scan.
+        if node.route is None:
+            node.route = (route, names)
+            self.size += 1
+
+    def match(self, path: str) -> Optional[Tuple[Any, Dict[str, str]]]:
+        """Returns (route, params) for the best match. Literals beat parameters beat wildcards."""
+        values: List[str] = []
+        found = self._match(self.root, split_path(path), 0, values)
+        if found is None:
+            return None
+        route, names = found
+        return route, dict(zip(names, values))
+
+    def _match(self, node: _Node, segments: list, index: int, values: List[str]):
+        # values collects the captured segments in order; a branch that fails removes its own.
+        if index == len(segments):
+            if node.route is None and node.tail is not None:
+                values.append("")
+                return node.tail
+            return node.route
+
+        segment = segments[index]
+        child = node.literals.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, values)
+            if found is not None:
+                return found
+
+        if node.param is not None:
+            values.append(segment)
+            found = self._match(node.param, segments, index + 1, values)
+            if found is not None:
+                return found
+            values.pop()
+
+        if node.wildcard is not None:
+            found = self._match(node.wildcard, segments, index + 1, values)
+            if found is not None:
+                return found
+
+        if node.tail is not None:
+            values.append("/".join(segments[index:]))
+            return node.tail
+        return None
+
+
+def render_value(value: Any, params: Dict[str, str]) -> Any:
+    """Substitutes `{name}` placeholders in string values with captured path parameters."""
+    if not params:
+        return value
+    if isinstance(value, str):
+        if value.startswith("{") and value.endswith("}") and value[1:-1] in params:
+            return params[value[1:-1]]
+        if "{" in value:
+            for name, param in params.items():
+                value = value.replace("{" + name + "}", param)
+        return value
+    if isinstance(value, dict):
+        return {key: render_value(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render_value(item, params) for item in value]
+    return value
+
+
+def build_router(routes: list) -> Router:
+    router = Router()
+    for route in routes:
+        router.add(route["path"], route)
+    return router
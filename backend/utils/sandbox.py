@@ -0,0 +1,436 @@
+import asyncio
+import fcntl
+import inspect
+import multiprocessing
+import os
+import pickle
+import signal
+import socket
+import struct
+import termios
+import time
+from utils.handler import load_handler
+from utils.state import LazyState, StateCache
+from utils.streaming import STREAM_BATCH_SIZE, is_stream, pull_batch, pull_async_batch
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class SandboxError(Exception):
+    """The handler raised, or its result could not be returned."""
+
+
+class SandboxTimeout(SandboxError):
+    """The handler exceeded its wall-clock or CPU budget."""
+
+
+class SandboxCrashed(SandboxError):
+    """The worker process died while running the handler."""
+
+
+class SandboxBusy(SandboxError):
+    """No worker became free within the pool's acquire timeout."""
+
+
+# Messages up to this size fit in the pipe's socket buffer, so sending one does not block.
+_INLINE_SEND_BYTES = 64 * 1024
+
+
+def _buffered_whole(peek: socket.socket) -> bool:
+    """Whether a whole message is waiting in the pipe, so recv_bytes() returns at once.
+    Messages are framed as Connection.send_bytes() does: a 4-byte big-endian length, or
+    -1 and an 8-byte one above 2 GiB."""
+    try:
+        header = peek.recv(4, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+    except BlockingIOError:
+        return False
+    if len(header) < 4:
+        # EOF, or a header still arriving; a blocking read finds out which.
+        return False
+    size, = struct.unpack("!i", header)
+    if size < 0:
+        return False
+    available, = struct.unpack("i", fcntl.ioctl(peek, termios.FIONREAD, b"\0" * 4))
+    return available >= 4 + size
+
+
+class _CpuTimeExceeded(BaseException):
+    # BaseException so a handler's own `except Exception` cannot swallow it.
+    pass
+
+
+def _on_cpu_timeout(signum, frame):
+    raise _CpuTimeExceeded()
+
+
+class _CpuBudget:
+    """Arms the CPU timer for the duration of a block."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds if hasattr(signal, "setitimer") else 0
+
+    def __enter__(self):
+        if self.seconds:
+            signal.setitimer(signal.ITIMER_PROF, self.seconds)
+
+    def __exit__(self, *exc):
+        if self.seconds:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+
+
+class _StateUnavailable(Exception):
+    pass
+
+
+def _ask_parent(conn, request: str, payload):
+    """Asks the parent for state while a handler runs: ("fetch", keys) -> {key: value},
+    ("keys", None) -> [key, ...]."""
+    conn.send_bytes(pickle.dumps((request, payload, None, None), protocol=pickle.HIGHEST_PROTOCOL))
+    status, value = conn.recv()
+    if status != "values":
+        raise _StateUnavailable(f"State unavailable: {value}")
+    return value
+
+
+def _worker_main(conn, cpu_timeout: float, memory_limit_mb: int):
+    """Worker loop. Messages and replies:
+
+    ("call", endpoint_id, code, url, headers, body, preloaded)
+        -> ("ok", result, changes, (compile seconds, execute seconds)), or
+           ("stream", None, None, timings) if the handler returned a generator.
+    ("next", size) -> ("items", [item, ...], None, None), or ("end", [item, ...], changes, None)
+    ("close",) -> ("end", [], changes, None)
+
+    Any of them can instead reply ("timeout" | "error", message, None, None). The CPU
+    budget applies to each call and to each pull from a stream.
+
+    The handler's `data` is a LazyState over preloaded (values, key names), when the
+    parent sent the whole state along, or whose keys come from the parent: before its
+    reply, the worker may send ("fetch", keys, None, None) or ("keys", None, None, None)
+    and block until the parent answers ("values", ...) or ("failed", message). changes
+    is ({key: value}, [deleted key, ...]) for the keys the handler may have changed.
+    """
+    if resource is not None and memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if hasattr(signal, "SIGPROF"):
+        signal.signal(signal.SIGPROF, _on_cpu_timeout)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    budget = _CpuBudget(cpu_timeout)
+    stream = None  # (generator, state) while a streaming handler is open
+    loop = None  # created on first use, for async generator handlers
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+
+        try:
+            if message[0] == "call":
+                _, endpoint_id, code, url, headers, body, preloaded = message
+                stream = None
+                cache = StateCache()
+                if preloaded is not None:
+                    cache.values, names = preloaded
+                    cache.names = set(names)
+                state = LazyState(
+                    lambda keys: _ask_parent(conn, "fetch", keys),
+                    lambda: _ask_parent(conn, "keys", None),
+                    cache,
+                )
+                started = time.perf_counter()
+                handler = load_handler(endpoint_id, code)
+                loaded = time.perf_counter()
+                with budget:
+                    result = handler(url, headers, body, state)
+                    if result is state:
+                        result = state.to_dict()
+                timings = (loaded - started, time.perf_counter() - loaded)
+                if is_stream(result):
+                    stream = (result, state)
+                    reply = ("stream", None, None, timings)
+                else:
+                    reply = ("ok", result, state.changes(), timings)
+
+            elif message[0] == "next":
+                generator, state = stream
+                with budget:
+                    if inspect.isasyncgen(generator):
+                        loop = loop or asyncio.new_event_loop()
+                        items, exhausted = loop.run_until_complete(pull_async_batch(generator, message[1]))
+                    else:
+                        items, exhausted = pull_batch(generator, message[1])
+                if exhausted:
+                    stream = None
+                    reply = ("end", items, state.changes(), None)
+                else:
+                    reply = ("items", items, None, None)
+
+            else:  # "close"
+                generator, state = stream
+                stream = None
+                with budget:
+                    if inspect.isasyncgen(generator):
+                        loop = loop or asyncio.new_event_loop()
+                        loop.run_until_complete(generator.aclose())
+                    else:
+                        generator.close()
+                reply = ("end", [], state.changes(), None)
+
+            reply = pickle.dumps(reply, protocol=pickle.HIGHEST_PROTOCOL)
+        except _CpuTimeExceeded:
+            stream = None
+            reply = pickle.dumps(("timeout", f"Handler exceeded its CPU time limit of {cpu_timeout}s", None, None))
+        except MemoryError:
+            stream = None
+            reply = pickle.dumps(("error", "Handler exceeded its memory limit", None, None))
+        except Exception as e:
+            stream = None
+            reply = pickle.dumps(("error", str(e), None, None))
+        conn.send_bytes(reply)
+
+
+class _Worker:
+    def __init__(self, context, cpu_timeout: float, memory_limit_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_timeout, memory_limit_mb),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        # A second handle on the pipe, to look at what is buffered without consuming it.
+        self.peek = socket.socket(fileno=os.dup(self.conn.fileno()))
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.peek.close()
+        self.conn.close()
+
+
+class SandboxPool:
+    """A pool of warm worker processes that run functional handlers off the event loop.
+
+    Each worker keeps its own compiled-handler cache, so a busy endpoint compiles
+    once per worker. A call that overruns its wall-clock budget gets its worker
+    killed and replaced; a crash only takes down that one worker. A call waits at most
+    acquire_timeout seconds for a free worker (not at all when it is 0).
+    """
+
+    def __init__(self, size: int, timeout: float, cpu_timeout: float, memory_limit_mb: int, acquire_timeout: float = None):
+        self.size = size
+        self.timeout = timeout
+        self.acquire_timeout = timeout if acquire_timeout is None else acquire_timeout
+        self.cpu_timeout = cpu_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = None
+        self._workers = []
+        self.calls = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.busy = 0
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.cpu_timeout, self.memory_limit_mb)
+        self._workers.append(worker)
+        return worker
+
+    def _retire(self, worker: _Worker):
+        self._workers.remove(worker)
+        # Waiting for the process to exit can take a while; it is done on a thread.
+        worker.process.kill()
+        asyncio.get_running_loop().run_in_executor(None, worker.kill)
+
+    def start(self):
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(self._spawn())
+
+    def _replace(self, worker: _Worker):
+        self._retire(worker)
+        self._idle.put_nowait(self._spawn())
+
+    def _release(self, worker: _Worker):
+        self._idle.put_nowait(worker)
+
+    async def _acquire(self) -> _Worker:
+        try:
+            if self.acquire_timeout <= 0:
+                return self._idle.get_nowait()
+            return await asyncio.wait_for(self._idle.get(), self.acquire_timeout)
+        except asyncio.QueueEmpty:
+            self.busy += 1
+            raise SandboxBusy(f"All {self.size} handler workers are busy")
+        except asyncio.TimeoutError:
+            self.busy += 1
+            raise SandboxBusy(f"No handler worker became free within {self.acquire_timeout}s")
+
+    async def _exchange(self, worker: _Worker, message, state=None) -> tuple:
+        """Sends one message and returns the decoded reply, answering the worker's state
+        requests on the way. A worker that times out, crashes or is abandoned mid-call is
+        replaced, so its late reply cannot reach the next caller."""
+        try:
+            deadline = time.monotonic() + self.timeout
+            await self._send(worker, message, deadline)
+            while True:
+                reply = await self._receive(worker, deadline)
+                if reply[0] not in ("fetch", "keys"):
+                    return reply
+                await self._send(worker, await self._answer(state, reply), deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._replace(worker)
+            raise SandboxTimeout(f"Handler exceeded its time limit of {self.timeout}s")
+        except asyncio.CancelledError:
+            self._replace(worker)
+            raise
+        except (EOFError, OSError, pickle.UnpicklingError):
+            self.crashes += 1
+            self._replace(worker)
+            raise SandboxCrashed("Handler process crashed")
+
+    async def _answer(self, state, request: tuple) -> tuple:
+        fetch, list_keys, _ = state
+        try:
+            if request[0] == "fetch":
+                return ("values", await fetch(request[1]))
+            return ("values", await list_keys())
+        except Exception as e:
+            # The handler sees this as an exception from its `data`.
+            print("SANDBOX::STATE_FAIL", e)
+            return ("failed", str(e))
+
+    def _raise_for(self, status: str, result):
+        if status == "timeout":
+            self.timeouts += 1
+            raise SandboxTimeout(result)
+        raise SandboxError(result)
+
+    async def run(self, endpoint_id: str, code: str, url: str, headers, body, state: tuple):
+        """Runs the handler in a worker and returns (result, changes, timings): the keys the
+        handler changed (see _worker_main) and the (compile, execute) seconds measured
+        inside the worker. state is (fetch, list_keys, preloaded): the async functions that
+        answer the worker's requests for state keys, and the whole state as (values, key
+        names) when it can be sent up front, else None.
+
+        If the handler returned a generator, result is a SandboxStream that keeps the
+        worker until it is exhausted or closed, and changes is None until then."""
+        self.start()
+        worker = await self._acquire()
+        self.calls += 1
+        status, result, changes, timings = await self._exchange(
+            worker, ("call", endpoint_id, code, url, headers, body, state[2]), state
+        )
+        if status == "stream":
+            return SandboxStream(self, worker, state), None, timings
+        self._release(worker)
+        if status != "ok":
+            self._raise_for(status, result)
+        return result, changes, timings
+
+    async def _send(self, worker: _Worker, message, deadline: float):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) <= _INLINE_SEND_BYTES:
+            worker.conn.send_bytes(data)
+        else:
+            # The worker reads it as it arrives, which takes longer than the loop should wait.
+            sending = asyncio.get_running_loop().run_in_executor(None, worker.conn.send_bytes, data)
+            await asyncio.wait_for(sending, deadline - time.monotonic())
+
+    async def _receive(self, worker: _Worker, deadline: float):
+        await self._wait_readable(worker.conn, deadline - time.monotonic())
+        if _buffered_whole(worker.peek):
+            data = worker.conn.recv_bytes()
+        else:
+            # A large reply is still being written; read the rest on a thread.
+            receiving = asyncio.get_running_loop().run_in_executor(None, worker.conn.recv_bytes)
+            data = await asyncio.wait_for(receiving, deadline - time.monotonic())
+        return pickle.loads(data)
+
+    async def _wait_readable(self, conn, timeout: float):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = conn.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, timeout)
+        finally:
+            loop.remove_reader(fd)
+
+    def close(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.peek.close()
+            worker.conn.close()
+        self._workers = []
+        self._idle = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "busy": self.busy,
+        }
+
+
+class SandboxStream:
+    """The items of a generator handler running in a worker, pulled a batch at a time.
+
+    Nothing is produced ahead of the consumer: the worker computes the next batch only
+    when next_batch() asks for it. The handler's state changes are available as
+    `changes` once the generator is exhausted or closed.
+    """
+
+    def __init__(self, pool: SandboxPool, worker: _Worker, state: tuple):
+        self._pool = pool
+        self._worker = worker
+        self._state = state
+        self.changes = None
+
+    async def _exchange(self, message) -> tuple:
+        # If the exchange fails, the pool has already replaced the worker.
+        worker, self._worker = self._worker, None
+        status, items, changes, _ = await self._pool._exchange(worker, message, self._state)
+        if status == "items":
+            self._worker = worker
+            return items
+        self._pool._release(worker)
+        if status != "end":
+            self._pool._raise_for(status, items)
+        self.changes = changes
+        return items
+
+    async def next_batch(self, size: int = STREAM_BATCH_SIZE) -> list:
+        """Up to `size` next items; an empty list once the generator is exhausted."""
+        if self._worker is None:
+            return []
+        return await self._exchange(("next", size))
+
+    async def aclose(self):
+        if self._worker is not None:
+            try:
+                await self._exchange(("close",))
+            except SandboxError:
+                pass
@@ -0,0 +1,35 @@
+"""Cold-start accounting.
+
+Heavy subsystems (the storage engine, the OpenAI client, password hashing) are
+built on first use rather than at import, and each build is timed here together
+with the import of the app itself. With STARTUP_PROFILE=1 every timing is also
+printed as it happens, which is the easiest way to read them on a serverless
+platform's logs. The timings are exported on /metrics as mock_startup_seconds.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+
+_timings = {}  # subsystem -> seconds spent initialising it
+
+
+def record(name: str, seconds: float):
+    _timings[name] = seconds
+    if STARTUP_PROFILE:
+        print(f"STARTUP::{name} {seconds * 1000:.1f}ms")
+
+
+@contextmanager
+def timed(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def startup_stats() -> dict:
+    # Nested so /metrics renders one mock_startup_seconds series per subsystem.
+    return {name: {"seconds": seconds} for name, seconds in _timings.items()}
@@ -0,0 +1,124 @@
+from collections.abc import MutableMapping
+
+# Values of these types can only change through data[key] = ..., never in place.
+_IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+
+def changes_in_place(value) -> bool:
+    return not isinstance(value, _IMMUTABLE)
+
+
+class StateCache:
+    """What is known about one endpoint's stored state: the values loaded so far, keys
+    known not to exist, and the name of every key once they have been listed."""
+
+    __slots__ = ("values", "missing", "names")
+
+    def __init__(self):
+        self.values = {}
+        self.missing = set()
+        self.names = None
+
+    def forget(self):
+        self.values = {}
+        self.missing = set()
+        self.names = None
+
+
+class LazyState(MutableMapping):
+    """The `data` a functional handler receives: a dict-like view of the endpoint's state
+    whose keys are fetched the first time they are used.
+
+    fetch(keys) returns {key: value} for those keys that exist, and list_keys() every key
+    name; both block until the answer is there. Loaded and written values live in cache,
+    which may outlive the call. Pickling or deep-copying the view yields a plain dict of
+    the whole state.
+    """
+
+    def __init__(self, fetch, list_keys, cache: StateCache = None):
+        self._fetch = fetch
+        self._list_keys = list_keys
+        self.cache = cache if cache is not None else StateCache()
+        # Keys assigned or deleted, and keys whose value was handed out and may be mutated.
+        self.written = set()
+        self.exposed = set()
+
+    def _load(self, keys):
+        cache = self.cache
+        wanted = [key for key in keys if key not in cache.values and key not in cache.missing]
+        if cache.names is not None:
+            cache.missing.update(key for key in wanted if key not in cache.names)
+            wanted = [key for key in wanted if key in cache.names]
+        if not wanted:
+            return
+        found = self._fetch(wanted)
+        for key in wanted:
+            if key in found:
+                cache.values[key] = found[key]
+            else:
+                cache.missing.add(key)
+
+    def _names(self) -> set:
+        cache = self.cache
+        if cache.names is None:
+            cache.names = set(self._list_keys()) | set(cache.values)
+            cache.names -= cache.missing
+        return cache.names
+
+    def load_all(self):
+        """Loads every key in one fetch."""
+        self._load(list(self._names()))
+
+    def __getitem__(self, key):
+        values = self.cache.values
+        if key not in values:
+            self._load([key])
+        value = values[key]  # KeyError when the key does not exist
+        if changes_in_place(value):
+            self.exposed.add(key)
+        return value
+
+    def __setitem__(self, key, value):
+        cache = self.cache
+        cache.values[key] = value
+        cache.missing.discard(key)
+        if cache.names is not None:
+            cache.names.add(key)
+        self.written.add(key)
+
+    def __delitem__(self, key):
+        self._load([key])
+        cache = self.cache
+        del cache.values[key]
+        cache.missing.add(key)
+        if cache.names is not None:
+            cache.names.discard(key)
+        self.written.add(key)
+
+    def __contains__(self, key):
+        if key not in self.cache.values:
+            self._load([key])
+        return key in self.cache.values
+
+    def __iter__(self):
+        # Whoever iterates usually reads the values too, so fetch them all at once.
+        self.load_all()
+        return iter(list(self.cache.values))
+
+    def __len__(self):
+        return len(self._names())
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self}
+
+    def __reduce__(self):
+        return dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"LazyState({self.to_dict()!r})"
+
+    def changes(self) -> tuple:
+        """({key: value} to store, [keys to delete]) for everything this view may have changed."""
+        values = self.cache.values
+        dirty = self.written | self.exposed
+        return {key: values[key] for key in dirty if key in values}, [key for key in dirty if key not in values]
@@ -0,0 +1,214 @@
+import inspect
+import json
+import os
+import time
+import anyio
+from starlette.responses import StreamingResponse
+from utils.metrics import NULL_TIMER
+
+# Items are pulled and sent in batches of up to this many, cut short once a batch
+# has taken STREAM_FLUSH_MS, so slow producers still stream item by item.
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "64"))
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "10"))
+# A streamed functional response keeps its endpoint locked, and in process mode a sandbox
+# worker busy, until it ends. It is cut off after STREAM_MAX_SECONDS, or as soon as the
+# client has not taken a chunk for STREAM_SEND_TIMEOUT seconds.
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "300"))
+STREAM_SEND_TIMEOUT = float(os.getenv("STREAM_SEND_TIMEOUT", "30"))
+
+STREAM_FORMATS = ("chunked", "ndjson", "sse")
+
+MEDIA_TYPES = {
+    "chunked": "text/plain; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def is_stream(result) -> bool:
+    return inspect.isgenerator(result) or inspect.isasyncgen(result)
+
+
+def choose_format(configured: str = None, accept: str = "") -> str:
+    """The endpoint's configured format wins; otherwise the Accept header decides."""
+    if configured in STREAM_FORMATS:
+        return configured
+    accept = accept.lower()
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept or "application/jsonl" in accept:
+        return "ndjson"
+    return "chunked"
+
+
+def _json(item) -> str:
+    return json.dumps(item, default=str)
+
+
+def encode_item(fmt: str, item) -> bytes:
+    if fmt == "ndjson":
+        return (_json(item) + "\n").encode()
+    if fmt == "sse":
+        text = item if isinstance(item, str) else _json(item)
+        return ("".join(f"data: {line}\n" for line in text.split("\n")) + "\n").encode()
+    if isinstance(item, bytes):
+        return item
+    return (item if isinstance(item, str) else _json(item)).encode()
+
+
+def pull_batch(iterator, size: int = STREAM_BATCH_SIZE, flush_ms: float = STREAM_FLUSH_MS):
+    """Up to `size` items from a synchronous iterator. Returns (items, exhausted)."""
+    items = []
+    deadline = time.perf_counter() + flush_ms / 1000
+    for item in iterator:
+        items.append(item)
+        if len(items) >= size or time.perf_counter() >= deadline:
+            return items, False
+    return items, True
+
+
+async def pull_async_batch(agen, size: int = STREAM_BATCH_SIZE, flush_ms: float = STREAM_FLUSH_MS):
+    """pull_batch for async generators."""
+    items = []
+    deadline = time.perf_counter() + flush_ms / 1000
+    async for item in agen:
+        items.append(item)
+        if len(items) >= size or time.perf_counter() >= deadline:
+            return items, False
+    return items, True
+
+
+async def iter_batches(source, size: int = STREAM_BATCH_SIZE):
+    """Normalises a generator, async generator or sandbox stream into lists of up to
+    `size` items."""
+    if inspect.isasyncgen(source):
+        exhausted = False
+        while not exhausted:
+            items, exhausted = await pull_async_batch(source, size)
+            if items:
+                yield items
+    elif inspect.isgenerator(source):
+        exhausted = False
+        while not exhausted:
+            items, exhausted = pull_batch(source, size)
+            if items:
+                yield items
+    else:
+        while True:
+            items = await source.next_batch(size)
+            if not items:
+                return
+            yield items
+
+
+async def close_stream(source):
+    if inspect.isgenerator(source):
+        source.close()
+    else:
+        await source.aclose()
+
+
+class MockStreamResponse(StreamingResponse):
+    """Streams what a generator handler yields. The next items are only pulled once the
+    previous chunk has been handed to the server, so a slow client slows the producer down
+    instead of buffering. Whether the stream completes, fails, runs out of time or the
+    client disconnects or stalls, the handler is closed and on_close(failed) runs before
+    the response finishes."""
+
+    def __init__(self, source, fmt: str, on_close, timer=NULL_TIMER):
+        self.source = source
+        self.fmt = fmt
+        self.on_close = on_close
+        self.timer = timer
+        self.failed = False
+        self.disconnected = False
+        self._produce_seconds = 0.0
+        self._encode_seconds = 0.0
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} if fmt == "sse" else None
+        super().__init__(self._chunks(), media_type=MEDIA_TYPES[fmt], headers=headers)
+
+    async def _chunks(self):
+        batches = iter_batches(self.source)
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        while not self.disconnected:
+            started = time.perf_counter()
+            try:
+                with anyio.move_on_after(deadline - time.monotonic()) as limit:
+                    items = await batches.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                self.failed = True
+                print("STREAM::HANDLER_FAIL", e)
+                if self.fmt != "sse":
+                    # Aborting the connection is the only way to tell a chunked client the body is incomplete.
+                    raise
+                yield f"event: error\ndata: {_json(f'Functional Error: {e}')}\n\n".encode()
+                return
+            if limit.cancelled_caught:
+                message = f"Functional Timeout: stream exceeded its time limit of {STREAM_MAX_SECONDS}s"
+                if self.fmt != "sse":
+                    raise TimeoutError(message)
+                yield f"event: error\ndata: {_json(message)}\n\n".encode()
+                return
+            encoding = time.perf_counter()
+            chunk = b"".join(encode_item(self.fmt, item) for item in items)
+            self._produce_seconds += encoding - started
+            self._encode_seconds += time.perf_counter() - encoding
+            yield chunk
+
+    async def collect(self, limit: int) -> list:
+        """Runs the stream without a client and returns its first `limit` items, then
+        closes the handler just as a disconnect would. For callers that need one body."""
+        items = []
+        try:
+            with anyio.move_on_after(STREAM_MAX_SECONDS):
+                async for batch in iter_batches(self.source):
+                    items.extend(batch)
+                    if len(items) >= limit:
+                        del items[limit:]
+                        break
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            with anyio.CancelScope(shield=True):
+                try:
+                    await close_stream(self.source)
+                finally:
+                    await self.on_close(self.failed)
+        return items
+
+    async def _watch_disconnect(self, receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        self.disconnected = True
+
+    async def __call__(self, scope, receive, send):
+        # Unlike StreamingResponse, a disconnect does not cancel the stream mid-pull: the
+        # pull in flight finishes, then the loop stops and the handler is closed cleanly,
+        # so a sandboxed generator's state still comes back from its worker.
+        async def send_or_give_up(message):
+            with anyio.move_on_after(STREAM_SEND_TIMEOUT) as limit:
+                await send(message)
+            if limit.cancelled_caught:
+                raise OSError(f"Client took no data for {STREAM_SEND_TIMEOUT}s")
+
+        try:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(self._watch_disconnect, receive)
+                try:
+                    await self.stream_response(send_or_give_up)
+                except OSError:
+                    self.disconnected = True
+                finally:
+                    task_group.cancel_scope.cancel()
+        finally:
+            with anyio.CancelScope(shield=True):
+                try:
+                    await close_stream(self.source)
+                finally:
+                    await self.on_close(self.failed)
+                    self.timer.add("execute", self._produce_seconds)
+                    self.timer.add("serialize", self._encode_seconds)
+                    self.timer.record(500 if self.failed else self.status_code)
@@ -1,4 +1,15 @@
+import os
 import uuid
+from dotenv import load_dotenv
+
+_env_loaded = False
+
+def load_env():
+    """Loads .env into the environment, once per process however many modules ask."""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
 
 def format_path(path: str) -> str:
     """Ensures a path starts with exactly one leading slash."""
@@ -9,4 +20,7 @@ def format_path(path: str) -> str:
 def generate_unique_id(length: int = 8) -> str:
     """Generates a shortened unique identifier."""
     return str(uuid.uuid4())[:length]
-    
\ No newline at end of file
+
+def is_serverless() -> bool:
+    """True when running on a serverless platform where background tasks do not outlive a request."""
+    return bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
@@ -22,10 +22,17 @@ export function BasePathSelector({ value, onChange, onValidityChange }: BasePath
         const fetchEndpoints = async () => {
             setLoadingPaths(true);
             try {
-                const res = await api.get("/endpoints");
-                // Filter unique endpoint IDs. 
-                // Assuming backend returns list of endpoint objects with 'endpoint_id'
-                const ids = res.data.map((e: any) => e.endpoint_id);
+                // Only the user's own endpoints can take new routes. The backend returns
+                // them a page at a time, so follow next_cursor until the last page.
+                const ids: string[] = [];
+                let cursor: string | null = null;
+                do {
+                    const res: any = await api.get("/endpoints", {
+                        params: cursor ? { mine: true, limit: 200, cursor } : { mine: true, limit: 200 },
+                    });
+                    ids.push(...res.data.items.map((e: any) => e.endpoint_id));
+                    cursor = res.data.next_cursor;
+                } while (cursor);
                 const uniqueIds = Array.from(new Set(ids)) as string[];
                 setExistingPaths(uniqueIds);
 
@@ -17,13 +17,15 @@ const BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL || "http://localhost:8000"
 
 const EndpointList = () => {
   const [endpoints, setEndpoints] = useState<Endpoint[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const [selectedEndpoint, setSelectedEndpoint] = useState<Endpoint | null>(null);
 
-  const fetchEndpoints = async () => {
+  const fetchEndpoints = async (cursor: string | null = null) => {
     try {
-      const res = await api.get("/endpoints");
-      setEndpoints(res.data);
+      const res = await api.get("/endpoints", { params: cursor ? { cursor } : {} });
+      setEndpoints((prev) => (cursor ? [...prev, ...res.data.items] : res.data.items));
+      setNextCursor(res.data.next_cursor);
     } catch (err) {
       console.error("Failed to fetch endpoints", err);
     } finally {
@@ -31,6 +33,16 @@ const EndpointList = () => {
     }
   };
 
+  // The listing only carries summaries, so load the full definition on demand.
+  const openDetails = async (ep: Endpoint) => {
+    try {
+      const res = await api.get(`/endpoints/${encodeURIComponent(ep.endpoint_id)}`);
+      setSelectedEndpoint(res.data);
+    } catch (err) {
+      console.error("Failed to fetch endpoint details", err);
+    }
+  };
+
   useEffect(() => {
     fetchEndpoints();
   }, []);
@@ -47,7 +59,7 @@ const EndpointList = () => {
       <div className="p-4 border-b border-gray-700 flex justify-between items-center bg-gray-800/50">
         <h3 className="font-bold text-white">Active Mock Endpoints</h3>
         <button
-          onClick={fetchEndpoints}
+          onClick={() => fetchEndpoints()}
           className="text-xs bg-gray-700 hover:bg-gray-600 text-gray-300 px-3 py-1 rounded transition"
         >
           Refresh
@@ -75,7 +87,7 @@ const EndpointList = () => {
                     <div className="text-zinc-400 text-xs mt-1 font-medium">{ep.name || "Untitled Endpoint"}</div>
                   </div>
                   <button
-                    onClick={() => setSelectedEndpoint(ep)}
+                    onClick={() => openDetails(ep)}
                     className="text-xs bg-indigo-600 hover:bg-indigo-500 text-white px-3 py-1.5 rounded transition-colors opacity-0 group-hover:opacity-100"
                   >
                     View Details
@@ -90,6 +102,14 @@ const EndpointList = () => {
                 </div>
               </div>
             ))}
+            {nextCursor && (
+              <button
+                onClick={() => fetchEndpoints(nextCursor)}
+                className="w-full p-3 text-xs text-gray-400 hover:text-white hover:bg-gray-700/30 transition"
+              >
+                Load more
+              </button>
+            )}
           </div>
         )}
       </div>